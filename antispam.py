@@ -0,0 +1,223 @@
+"""Антиспам: обмеження частоти повідомлень і натискань кнопок від користувача.
+
+Обробники реєструються в group=-1, тобто виконуються до всіх інших; якщо
+користувач перевищив ліміт, подальша обробка апдейта зупиняється
+(ApplicationHandlerStop).
+
+* ліміт — «не більше limit подій за window секунд» з можливістю сплеску до
+  limit подій поспіль; рахується алгоритмом GCRA: на кожну пару (тип, користувач)
+  зберігається одне число (теоретичний час наступної події), перевірка — O(1);
+* записи зберігаються в OrderedDict у порядку останнього звернення; записи, що
+  вже «відновились» (теоретичний час у минулому), нічого не важать і
+  прибираються з голови черги мимохідь, а понад max_users витісняється
+  найдавніший — пам'ять обмежена за будь-якого потоку;
+* адміністратори не обмежуються;
+* події антиспаму не пишуться в БД на кожен відсічений апдейт: за інтервал
+  між flush для пари (користувач, тип) накопичується один запис (час першого
+  блокування, найбільший retry_after), і flush_async записує їх однією пачкою
+  (executemany) у потоці-писачі db_async.
+"""
+
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Iterable, Optional
+
+from telegram import Update
+from telegram.ext import ApplicationHandlerStop, ContextTypes
+
+import db
+import db_async
+
+logger = logging.getLogger(__name__)
+
+
+class GcraLimiter:
+    """limit подій за window секунд на ключ; hit() повертає 0.0 або скільки чекати."""
+
+    def __init__(self, limit: int, window: float, max_keys: int = 10000):
+        self.limit = max(1, int(limit))
+        self.window = float(window)
+        self.interval = self.window / self.limit
+        self.tolerance = self.window - self.interval
+        self.max_keys = max(1, int(max_keys))
+        self._tat: OrderedDict[int, float] = OrderedDict()
+        self.evicted = 0
+
+    def hit(self, key: int, now: Optional[float] = None) -> float:
+        if self.interval <= 0:
+            # window=0 — обмеження вимкнено, стан не потрібен
+            return 0.0
+        now = time.monotonic() if now is None else now
+        tats = self._tat
+        tat = tats.get(key, now)
+        if tat < now:
+            tat = now
+        wait = tat - self.tolerance - now
+        if wait > 0:
+            tats.move_to_end(key)
+            return wait
+        tats[key] = tat + self.interval
+        tats.move_to_end(key)
+        self._evict(now)
+        return 0.0
+
+    def _evict(self, now: float):
+        tats = self._tat
+        # Два найдавніші записи, якщо вони вже відновились, — амортизовано O(1)
+        for _ in range(2):
+            if not tats:
+                break
+            key, tat = next(iter(tats.items()))
+            if tat > now:
+                break
+            del tats[key]
+        while len(tats) > self.max_keys:
+            tats.popitem(last=False)
+            self.evicted += 1
+
+    def __len__(self) -> int:
+        return len(self._tat)
+
+
+class AntiSpam:
+    def __init__(
+        self,
+        admin_ids: Iterable[int] = (),
+        message_limit: int = 5,
+        message_window: float = 5.0,
+        callback_limit: int = 8,
+        callback_window: float = 10.0,
+        max_users: int = 10000,
+        warn_cooldown: float = 10.0,
+        max_pending_events: int = 10000,
+    ):
+        self.admin_ids = frozenset(admin_ids)
+        self.limiters = {
+            "message": GcraLimiter(message_limit, message_window, max_users),
+            "callback": GcraLimiter(callback_limit, callback_window, max_users),
+        }
+        self.warn_cooldown = float(warn_cooldown)
+        self._warned: OrderedDict[int, float] = OrderedDict()
+        self.max_users = max(1, int(max_users))
+        self.max_pending_events = max(1, int(max_pending_events))
+        # (user_id, kind) -> [created_at, retry_after]
+        self._pending: dict[tuple[int, str], list] = {}
+        # Метрики
+        self.checked = 0
+        self.blocked = {"message": 0, "callback": 0}
+        self.events_logged = 0
+        self.events_dropped = 0
+
+    def check(self, user_id: int, kind: str, now: Optional[float] = None) -> float:
+        """0.0 — пропустити, інакше скільки секунд користувачу варто зачекати."""
+        self.checked += 1
+        if user_id in self.admin_ids:
+            return 0.0
+        retry = self.limiters[kind].hit(user_id, now)
+        if retry:
+            self.blocked[kind] += 1
+            self._record(user_id, kind, retry)
+        return retry
+
+    def _record(self, user_id: int, kind: str, retry: float):
+        event = self._pending.get((user_id, kind))
+        if event is not None:
+            if retry > event[1]:
+                event[1] = retry
+        elif len(self._pending) < self.max_pending_events:
+            self._pending[(user_id, kind)] = [time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime()), retry]
+        else:
+            self.events_dropped += 1
+
+    def should_warn(self, user_id: int, now: Optional[float] = None) -> bool:
+        now = time.monotonic() if now is None else now
+        if self._warned.get(user_id, 0.0) > now:
+            return False
+        self._warned[user_id] = now + self.warn_cooldown
+        self._warned.move_to_end(user_id)
+        while len(self._warned) > self.max_users:
+            self._warned.popitem(last=False)
+        return True
+
+    def _take_pending(self) -> list[tuple]:
+        pending, self._pending = self._pending, {}
+        return [
+            (user_id, kind, round(retry, 2), created_at)
+            for (user_id, kind), (created_at, retry) in pending.items()
+        ]
+
+    def _restore(self, events: list[tuple]):
+        # Запис не вдався — повертаємо події, щоб їх записав наступний flush
+        for user_id, kind, retry, created_at in events:
+            if (user_id, kind) not in self._pending and len(self._pending) < self.max_pending_events:
+                self._pending[(user_id, kind)] = [created_at, retry]
+            else:
+                self.events_dropped += 1
+
+    def flush(self) -> int:
+        """Синхронно записати накопичені події (для зупинки бота). Повертає кількість записів."""
+        if not self._pending:
+            return 0
+        events = self._take_pending()
+        try:
+            db.log_antispam_events(events)
+        except Exception:
+            self._restore(events)
+            raise
+        self.events_logged += len(events)
+        return len(events)
+
+    async def flush_async(self) -> int:
+        """Те саме, але пачка пишеться в потоці-писачі db_async, не блокуючи цикл подій."""
+        if not self._pending:
+            return 0
+        events = self._take_pending()
+        try:
+            await db_async.log_antispam_events(events)
+        except Exception:
+            self._restore(events)
+            raise
+        self.events_logged += len(events)
+        return len(events)
+
+    async def on_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Pre-handler для повідомлень: при перевищенні ліміту перериває обробку."""
+        user = update.effective_user
+        if not user:
+            return
+        retry = self.check(user.id, "message")
+        if not retry:
+            return
+        if update.effective_message and self.should_warn(user.id):
+            try:
+                await update.effective_message.reply_text(f"⏳ Занадто часто. Зачекайте приблизно {int(retry) + 1} сек.")
+            except Exception:
+                pass
+        raise ApplicationHandlerStop()
+
+    async def on_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Pre-handler для кліків по кнопках: при перевищенні ліміту перериває обробку."""
+        query = update.callback_query
+        if not query or not query.from_user:
+            return
+        retry = self.check(query.from_user.id, "callback")
+        if not retry:
+            return
+        try:
+            # Відповідь на callback обов'язкова, інакше у клієнта «крутиться» кнопка
+            await query.answer(f"⏳ Повільніше, зачекайте ~{int(retry) + 1} сек.", show_alert=False)
+        except Exception:
+            pass
+        raise ApplicationHandlerStop()
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "tracked": {kind: len(limiter) for kind, limiter in self.limiters.items()},
+            "evicted": sum(limiter.evicted for limiter in self.limiters.values()),
+            "checked": self.checked,
+            "blocked": dict(self.blocked),
+            "pending_events": len(self._pending),
+            "events_logged": self.events_logged,
+            "events_dropped": self.events_dropped,
+        }
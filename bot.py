@@ -1,10 +1,11 @@
 import os
+import html
 import logging
-import re
+import secrets
 import time
 import traceback
 from collections import deque
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, ReplyKeyboardRemove
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardRemove
 from telegram.ext import (
     Application,
     CommandHandler,
@@ -14,37 +15,72 @@ from telegram.ext import (
     filters,
     ConversationHandler,
     ApplicationHandlerStop,
+    ChatMemberHandler,
 )
-from db import init_db, upsert_profile, update_profile_fields, get_profile
-from db import replace_profile_images
-from db import (
+from db import init_db, close_db, start_audit_writer, stop_audit_writer, profile_cache_stats, LOG_RETENTION_DAYS
+import db_async
+from broadcast import broadcast
+from cache import TTLCache
+from outbound import OutboundRateLimiter, BULK
+from state_store import StateStore
+from records import ApplicationDraft
+from update_processor import KeyedUpdateProcessor
+from invite_pool import InviteLinkPool
+from antispam import AntiSpam
+from log_setup import get_logger, parse_sampling, setup_logging, stop_logging
+from validation import FULL_NAME_RE, NAME_CHARS_RE, URL_PREFIX_RE, is_ukrainian_name, is_valid_date, normalize_ranked_name
+from ui_assets import (
+    NPU_DEPARTMENTS,
+    NPU_RANKS,
+    DEPARTMENT_TITLE_BY_LOWER,
+    DEPARTMENT_KEYBOARDS,
+    RANK_KEYBOARDS,
+    DEPARTMENT_REPLY_KEYBOARD,
+    DEPARTMENT_CARDS,
+    REQUEST_ACCESS_KEYBOARD,
+    USER_MENU_KEYBOARD,
+    USER_MENU_KEYBOARD_ADMIN,
+    ADMIN_MENU_KEYBOARD,
+    HELP_TEXT,
+    HELP_TEXT_ADMIN,
+    ADMIN_HELP_TEXT,
+)
+from db_async import upsert_profile, update_profile_fields, get_profile
+from db_async import replace_profile_images
+from db_async import (
     insert_warning,
     insert_neaktyv_request,
     decide_neaktyv_request,
     insert_access_application,
     decide_access_application,
+    record_admin_notifications,
 )
-from db import log_action, log_profile_update
-from db import (
+from db_async import (
     log_action,
     log_profile_update,
     query_action_logs,
     export_table_csv,
     logs_stats,
+    check_log_rollups,
+    rebuild_log_rollups,
+    list_archives,
     log_error,
 )
 try:
-    from db import get_profile_by_username, search_profiles
+    from db_async import get_profile_by_username, search_profiles
 except ImportError:
     get_profile_by_username = None  # type: ignore
     search_profiles = None  # type: ignore
 
-# Налаштування логування
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
+# Налаштування логування: запис у stderr іде окремим потоком (log_setup)
+setup_logging(
+    level=os.getenv("LOG_LEVEL") or "INFO",
+    fmt=os.getenv("LOG_FORMAT") or "text",
+    sampling=parse_sampling(os.getenv("LOG_SAMPLING")),
 )
 logger = logging.getLogger(__name__)
+# Покрокові події обробки кожного повідомлення: DEBUG, за потреби з вибіркою (LOG_SAMPLING)
+message_log = get_logger("bot.messages")
 
 # Конфігурація
 BOT_TOKEN = os.getenv("BOT_TOKEN")
@@ -71,126 +107,134 @@ REPORTS_CHAT_ID = _int_or_none(os.getenv("REPORTS_CHAT_ID")) or _int_or_none(os.
 WARNINGS_TOPIC_ID = _int_or_none(os.getenv("WARNINGS_TOPIC_ID")) or 146
 AFK_TOPIC_ID = _int_or_none(os.getenv("AFK_TOPIC_ID")) or 152
 
-# Стани користувача
-PENDING_REQUESTS = {}
-USER_APPLICATIONS = {}  # Зберігання даних заявок користувачів
+# Обслуговування БД (секунди)
+DB_CHECKPOINT_INTERVAL = _int_or_none(os.getenv("DB_CHECKPOINT_INTERVAL")) or 300
+DB_OPTIMIZE_INTERVAL = _int_or_none(os.getenv("DB_OPTIMIZE_INTERVAL")) or 6 * 3600
+# Архівування старих журналів: як часто і скільки порцій (по ARCHIVE_BATCH_ROWS рядків) за один запуск
+LOG_ARCHIVE_INTERVAL = _int_or_none(os.getenv("LOG_ARCHIVE_INTERVAL")) or 3600
+LOG_ARCHIVE_MAX_BATCHES = _int_or_none(os.getenv("LOG_ARCHIVE_MAX_BATCHES")) or 2000
+
+# Розсилка адмінам: скільки повідомлень паралельно і тайм-аут на одного отримувача (секунди)
+ADMIN_BROADCAST_CONCURRENCY = _int_or_none(os.getenv("ADMIN_BROADCAST_CONCURRENCY")) or 10
+ADMIN_BROADCAST_TIMEOUT = float(os.getenv("ADMIN_BROADCAST_TIMEOUT") or 10)
+
+# Ліміти вихідних запитів до Telegram (повідомлень за секунду / запас на сплеск)
+OUTBOUND_RATE = float(os.getenv("OUTBOUND_RATE") or 30)
+OUTBOUND_PRIVATE_RATE = float(os.getenv("OUTBOUND_PRIVATE_RATE") or 1)
+OUTBOUND_GROUP_PER_MINUTE = float(os.getenv("OUTBOUND_GROUP_PER_MINUTE") or 20)
+OUTBOUND_MAX_RETRIES = _int_or_none(os.getenv("OUTBOUND_MAX_RETRIES")) or 3
+OUTBOUND_LIMITER = OutboundRateLimiter(
+    overall_rate=OUTBOUND_RATE,
+    private_rate=OUTBOUND_PRIVATE_RATE,
+    group_rate=OUTBOUND_GROUP_PER_MINUTE / 60,
+    max_retries=OUTBOUND_MAX_RETRIES,
+)
+
+# Паралельна обробка апдейтів: скільки виконується одночасно і скільки може чекати в черзі
+UPDATE_CONCURRENCY = _int_or_none(os.getenv("UPDATE_CONCURRENCY")) or 16
+UPDATE_MAX_PENDING = _int_or_none(os.getenv("UPDATE_MAX_PENDING")) or 512
+UPDATE_PROCESSOR = KeyedUpdateProcessor(max_running=UPDATE_CONCURRENCY, max_pending=UPDATE_MAX_PENDING)
+
+# Режим отримання апдейтів: polling (за замовчуванням) або webhook
+BOT_MODE = (os.getenv("BOT_MODE") or "polling").strip().lower()
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")  # публічна адреса, напр. https://<app>.up.railway.app
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH") or "/telegram"
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN") or "0.0.0.0"
+WEBHOOK_PORT = _int_or_none(os.getenv("PORT")) or 8080
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_MAX_QUEUE = _int_or_none(os.getenv("WEBHOOK_MAX_QUEUE")) or 1000
+
+# Пул одноразових запрошень: розмір, поріг поповнення, час життя і мінімальний залишок (секунди)
+INVITE_POOL_SIZE = _int_or_none(os.getenv("INVITE_POOL_SIZE")) or 10
+INVITE_POOL_LOW_WATERMARK = _int_or_none(os.getenv("INVITE_POOL_LOW_WATERMARK")) or 3
+INVITE_LINK_TTL = _int_or_none(os.getenv("INVITE_LINK_TTL")) or 7 * 24 * 3600
+INVITE_LINK_MIN_VALID = _int_or_none(os.getenv("INVITE_LINK_MIN_VALID")) or 24 * 3600
+INVITE_POOL_CHECK_INTERVAL = _int_or_none(os.getenv("INVITE_POOL_CHECK_INTERVAL")) or 600
+INVITE_POOL = (
+    InviteLinkPool(
+        _int_or_none(GROUP_CHAT_ID),
+        target_size=INVITE_POOL_SIZE,
+        low_watermark=INVITE_POOL_LOW_WATERMARK,
+        ttl=INVITE_LINK_TTL,
+        min_valid=INVITE_LINK_MIN_VALID,
+    )
+    if _int_or_none(GROUP_CHAT_ID)
+    else None
+)
+
+# Кеш членства у групі для /start (секунди): підтверджене членство і «не в групі»
+MEMBERSHIP_CACHE_TTL = _int_or_none(os.getenv("MEMBERSHIP_CACHE_TTL")) or 3600
+MEMBERSHIP_CACHE_NEGATIVE_TTL = _int_or_none(os.getenv("MEMBERSHIP_CACHE_NEGATIVE_TTL")) or 60
+MEMBER_STATUSES = {"member", "administrator", "creator"}
+MEMBERSHIP_CACHE = TTLCache(maxsize=5000, ttl=MEMBERSHIP_CACHE_TTL)
+
+# Telegram приймає від бота документи до 50 МБ
+EXPORT_MAX_DOCUMENT_BYTES = 50 * 1024 * 1024
+
+# Антиспам: не більше LIMIT подій за WINDOW секунд від одного користувача
+ANTISPAM_MESSAGE_LIMIT = _int_or_none(os.getenv("ANTISPAM_MESSAGE_LIMIT")) or 5
+ANTISPAM_MESSAGE_WINDOW = float(os.getenv("ANTISPAM_MESSAGE_WINDOW") or 5)
+ANTISPAM_CALLBACK_LIMIT = _int_or_none(os.getenv("ANTISPAM_CALLBACK_LIMIT")) or 8
+ANTISPAM_CALLBACK_WINDOW = float(os.getenv("ANTISPAM_CALLBACK_WINDOW") or 10)
+ANTISPAM_MAX_USERS = _int_or_none(os.getenv("ANTISPAM_MAX_USERS")) or 10000
+ANTISPAM_FLUSH_INTERVAL = _int_or_none(os.getenv("ANTISPAM_FLUSH_INTERVAL")) or 10
+ANTISPAM = AntiSpam(
+    ADMIN_IDS,
+    message_limit=ANTISPAM_MESSAGE_LIMIT,
+    message_window=ANTISPAM_MESSAGE_WINDOW,
+    callback_limit=ANTISPAM_CALLBACK_LIMIT,
+    callback_window=ANTISPAM_CALLBACK_WINDOW,
+    max_users=ANTISPAM_MAX_USERS,
+)
+
+# Як часто скидати змінений стан (заявки, анкети) у БД, секунди
+STATE_FLUSH_INTERVAL = _int_or_none(os.getenv("STATE_FLUSH_INTERVAL")) or 5
+
+# Скільки живуть незавершені анкети і заяви без модерації (секунди), ліміт анкет і період прибирання
+APPLICATION_DRAFT_TTL = _int_or_none(os.getenv("APPLICATION_DRAFT_TTL")) or 24 * 3600
+APPLICATION_DRAFT_MAX = _int_or_none(os.getenv("APPLICATION_DRAFT_MAX")) or 5000
+PENDING_REQUEST_TTL = _int_or_none(os.getenv("PENDING_REQUEST_TTL")) or 30 * 24 * 3600
+STATE_SWEEP_INTERVAL = _int_or_none(os.getenv("STATE_SWEEP_INTERVAL")) or 600
+
+# Стани користувача (зберігаються в БД і переживають перезапуск)
+STATE = StateStore()
+PENDING_REQUESTS = STATE.namespace("pending_requests", ttl=PENDING_REQUEST_TTL)
+# Незавершені анкети (ApplicationDraft): покинуті прибирає state_sweep_job
+USER_APPLICATIONS = STATE.namespace("user_applications", ttl=APPLICATION_DRAFT_TTL, maxsize=APPLICATION_DRAFT_MAX)
+NEAKTYV_STATE = STATE.namespace("neaktyv", ttl=PENDING_REQUEST_TTL)  # neaktyv_form_<id> / neaktyv_req_id_<id>
+# Заявки на доступ, які зараз обробляє якийсь адмін (апдейти різних адмінів виконуються паралельно)
+MODERATION_IN_PROGRESS: set[int] = set()
  
 # Тимчасовий рефіл профілю (стани діалогу)
 REFILL_NAME, REFILL_NPU, REFILL_RANK, REFILL_IMAGES = range(4)
 
 
-# Підрозділи НПУ (UKRAINE GTA) з описами
-NPU_DEPARTMENTS = {
-    # 1. НАВС / ХНУВС
-    "navs": {
-        "title": "Національна академія внутрішніх справ (НАВС / ХНУВС)",
-        "tag": "[ХНУВС]",
-        "location": "перебуває при ГУНП м. Харкова",
-        "eligibility": "вступ до НПУ — автоматичне зарахування",
-        "desc": "Провідний навчальний заклад МВС для підготовки, перепідготовки та підвищення кваліфікації працівників поліції; наукові дослідження, міжнародна співпраця.",
-    },
-    # 2. КОРД
-    "kord": {
-        "title": "Корпус Оперативно-Раптових Дій (КОРД)",
-        "tag": "[КОРД]",
-        "location": "перебуває в УНПУ м. Дніпра",
-        "eligibility": "з 4-го порядкового звання",
-        "desc": "Елітний спецпідрозділ: штурмові/антитерористичні операції, звільнення заручників, нейтралізація озброєних злочинців, взаємодія з іншими підрозділами.",
-    },
-    # 3. ДПП
-    "dpp": {
-        "title": "Департамент Патрульної Поліції (ДПП)",
-        "tag": "[ДПП]",
-        "location": "перебуває в УНПУ м. Харкова",
-        "eligibility": "з 3-го порядкового звання",
-        "desc": "Патрулювання, реагування на виклики, профілактика правопорушень, ПДР, оформлення адмінправопорушень, перша допомога при ДТП.",
-    },
-    # 4. ГСУ
-    "gsu": {
-        "title": "Головне Слідче Управління (ГСУ)",
-        "tag": "[ГСУ]",
-        "location": "перебуває в ГУНПУ м. Києва",
-        "eligibility": "офіцерський склад, спец. у кримінальному процесі",
-        "desc": "Досудове розслідування особливо тяжких злочинів, координація регіональних слідчих, взаємодія з прокуратурою та спецслужбами.",
-    },
-    # 5. ДВБ
-    "dvb": {
-        "title": "Департамент Внутрішньої Безпеки (ДВБ)",
-        "tag": "[ДВБ]",
-        "location": "перебуває в ГУНПУ м. Києва",
-        "eligibility": "відбір у спеціалізований підрозділ",
-        "desc": "Протидія корупції та злочинам у поліції, службові розслідування, оперативні заходи, взаємодія з антикорупційними органами.",
-    },
-    # 6. НЦУП
-    "ncup": {
-        "title": "Національний Центр Управління Поліцією (НЦУП)",
-        "tag": "[НЦУП]",
-        "location": "перебуває в ГУНПУ м. Києва",
-        "eligibility": "центральний оперативно-аналітичний підрозділ",
-        "desc": "Координація підрозділів у реальному часі, диспетчеризація 102, аналітика, підтримка інформаційних систем і кібербезпека.",
-    },
-}
-
-# Список звань НПУ для UKRAINE GTA (по порядку)
-NPU_RANKS = [
-    "Рядовий",
-    "Капрал",
-    "Сержант",
-    "Старший сержант",
-    "Молодший лейтенант",
-    "Лейтенант",
-    "Старший лейтенант",
-    "Капітан",
-    "Майор",
-    "Підполковник",
-    "Полковник",
-    "Генерал",
-]
-
-def parse_ranked_name(text: str) -> tuple[str | None, str]:
-    """Виділяє звання на початку рядка, якщо воно є, та повертає (rank, name).
-    Якщо звання не знайдено — повертає (None, original_text).
-    Порівняння нечутливе до регістру.
-    """
-    s = text.strip()
-    lower = s.lower()
-    for rank in NPU_RANKS:
-        r = rank.lower()
-        if lower.startswith(r + " "):
-            name = s[len(rank):].strip()
-            return rank, name
-    return None, s
-
-def is_ukrainian_name(text: str) -> bool:
-    """Перевіряє, чи містить текст українські ім'я та прізвище"""
-    # Українські літери
-    ukrainian_pattern = re.compile(r'^[А-ЯІЇЄа-яіїє\'\-\s]+$', re.UNICODE)
-    
-    # Перевіряємо базовий формат
-    if not ukrainian_pattern.match(text.strip()):
-        return False
-    
-    # Розділяємо на слова та перевіряємо що є мінімум 2 слова (ім'я та прізвище)
-    words = text.strip().split()
-    if len(words) < 2:
-        return False
-    
-    # Перевіряємо що кожне слово має мінімум 2 символи
-    for word in words:
-        if len(word) < 2:
-            return False
-    
-    return True
-
 def display_ranked_name(rank: str | None, name: str) -> str:
     """Повертає відформатоване ім'я з опціональним званням."""
     return f"{rank} {name}".strip() if rank else name
 
+async def notify_admins(context: ContextTypes.DEFAULT_TYPE, kind: str, ref_id: int | None, **send_kwargs):
+    """Паралельно надсилає повідомлення всім адмінам і зберігає, хто яке повідомлення отримав."""
+    results = await broadcast(
+        lambda chat_id: context.bot.send_message(chat_id=chat_id, rate_limit_args=BULK, **send_kwargs),
+        ADMIN_IDS,
+        concurrency=ADMIN_BROADCAST_CONCURRENCY,
+        timeout=ADMIN_BROADCAST_TIMEOUT,
+    )
+    failed = [r.chat_id for r in results if not r.ok]
+    if failed:
+        logger.warning(f"Розсилка {kind} #{ref_id}: не доставлено {len(failed)}/{len(results)} адмінам: {failed}")
+    try:
+        await record_admin_notifications(kind, ref_id, results)
+    except Exception as dbe:
+        logger.error(f"DB record admin_notifications failed: {dbe}")
+    return results
+
 # ===== Тимчасова команда для повторного заповнення профілю =====
 async def refill_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Старт тимчасового майстра перезаповнення профілю для вже зареєстрованих."""
     user = update.effective_user
-    profile = get_profile(user.id)
+    profile = await get_profile(user.id)
     if not profile:
         await update.message.reply_text(
             "ℹ️ Профіль ще не створено. Спочатку скористайтесь /start для первинної заявки.")
@@ -221,12 +265,9 @@ async def refill_name(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
     context.user_data.setdefault("refill_form", {})["in_game_name"] = name_input
 
     # Крок 2: вибір підрозділу
-    keyboard = []
-    for code, meta in NPU_DEPARTMENTS.items():
-        keyboard.append([InlineKeyboardButton(meta["title"], callback_data=f"refill_npu_{code}")])
     await update.message.reply_text(
         "🔸 Крок 2 з 4: Підрозділ НПУ\n\nОберіть ваш підрозділ:",
-        reply_markup=InlineKeyboardMarkup(keyboard),
+        reply_markup=DEPARTMENT_KEYBOARDS["refill_npu_"],
     )
     return REFILL_NPU
 
@@ -249,24 +290,9 @@ async def refill_select_npu(update: Update, context: ContextTypes.DEFAULT_TYPE)
     form["npu_code"] = npu_code
 
     # Показати картку та вибір звання
-    rank_buttons = []
-    row = []
-    for idx, rank in enumerate(NPU_RANKS):
-        row.append(InlineKeyboardButton(rank, callback_data=f"refill_rank_{idx}"))
-        if len(row) == 2:
-            rank_buttons.append(row)
-            row = []
-    if row:
-        rank_buttons.append(row)
-
-    desc = (
-        f"✅ Обрано підрозділ: <b>{meta['title']}</b> {meta['tag']}\n"
-        f"Місце: {meta['location']}\n"
-        f"Допуск: {meta['eligibility']}\n\n"
-        f"{meta['desc']}\n\n"
-        "🔸 Крок 3 з 4: Оберіть ваше звання"
+    await query.edit_message_text(
+        DEPARTMENT_CARDS["refill"][npu_code], reply_markup=RANK_KEYBOARDS["refill_rank_"], parse_mode="HTML"
     )
-    await query.edit_message_text(desc, reply_markup=InlineKeyboardMarkup(rank_buttons), parse_mode="HTML")
     return REFILL_RANK
 
 async def refill_select_rank(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -302,16 +328,16 @@ async def refill_images(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
 
     # Оновлюємо профіль та зображення в БД
     try:
-        update_profile_fields(
+        await update_profile_fields(
             user.id,
             in_game_name=form.get("in_game_name"),
             npu_department=form.get("npu_department"),
             rank=form.get("rank"),
         )
-        replace_profile_images(user.id, urls)
+        await replace_profile_images(user.id, urls)
         # Логи оновлення профілю та дії
         try:
-            log_profile_update(
+            await log_profile_update(
                 user_id=user.id,
                 fields={
                     "in_game_name": form.get("in_game_name"),
@@ -321,7 +347,7 @@ async def refill_images(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
                 images_count=len(urls),
                 source="refill",
             )
-            log_action(
+            await log_action(
                 actor_id=user.id,
                 actor_username=update.effective_user.username if update.effective_user else None,
                 action="profile_refill",
@@ -353,8 +379,16 @@ async def refill_images(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
     context.user_data.pop("refill_form", None)
     return ConversationHandler.END
 
-async def create_invite_link(context: ContextTypes.DEFAULT_TYPE, user_name: str) -> str:
-    """Створює одноразове посилання-запрошення для користувача"""
+async def create_invite_link(context: ContextTypes.DEFAULT_TYPE, user_name: str, user_id: int | None = None) -> str:
+    """Видає одноразове посилання-запрошення: з пулу, а якщо він порожній — створює нове"""
+    if INVITE_POOL and user_id is not None:
+        try:
+            link = await INVITE_POOL.claim(context.bot, user_id, user_name)
+            if link:
+                logger.info(f"Видано посилання з пулу для {user_name}: {link}")
+                return link
+        except Exception as e:
+            logger.error(f"Пул запрошень недоступний: {e}")
     try:
         # Якщо є ID групи, створюємо одноразове посилання
         if GROUP_CHAT_ID:
@@ -377,13 +411,40 @@ async def create_invite_link(context: ContextTypes.DEFAULT_TYPE, user_name: str)
         # В разі помилки використовуємо основне посилання
         return GROUP_INVITE_LINK
 
+def _cache_membership(chat_id: int, user_id: int, status: str, token: int | None = None):
+    ttl = MEMBERSHIP_CACHE_TTL if status in MEMBER_STATUSES else MEMBERSHIP_CACHE_NEGATIVE_TTL
+    if token is None:
+        MEMBERSHIP_CACHE.set((chat_id, user_id), status, ttl=ttl)
+    else:
+        MEMBERSHIP_CACHE.fill((chat_id, user_id), status, token, ttl=ttl)
+
+async def is_group_member(context: ContextTypes.DEFAULT_TYPE, chat_id: int, user_id: int) -> bool:
+    """Перевіряє членство через кеш; get_chat_member викликається лише при промаху."""
+    status = MEMBERSHIP_CACHE.get((chat_id, user_id))
+    if status is None:
+        # Токен відкидає відповідь API, якщо поки ми чекали, прийшов chat_member-апдейт
+        token = MEMBERSHIP_CACHE.fill_token()
+        member = await context.bot.get_chat_member(chat_id, user_id)
+        status = member.status
+        _cache_membership(chat_id, user_id, status, token)
+    return status in MEMBER_STATUSES
+
+async def track_chat_member(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Оновлює кеш членства з chat_member-апдейтів (вступ, вихід, бан, зміна прав)."""
+    change = update.chat_member
+    if not change or change.chat.id != REPORTS_CHAT_ID:
+        return
+    user_id = change.new_chat_member.user.id
+    MEMBERSHIP_CACHE.invalidate((change.chat.id, user_id))
+    _cache_membership(change.chat.id, user_id, change.new_chat_member.status)
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Обробник команди /start: різна поведінка для членів групи та тих, хто ще не в групі"""
     user = update.effective_user
 
     # Оновлюємо профіль користувача в БД (TG дані)
     tg_fullname = f"{user.first_name or ''} {user.last_name or ''}".strip()
-    upsert_profile(
+    await upsert_profile(
         telegram_id=user.id,
         username=user.username or None,
         full_name_tg=tg_fullname or None,
@@ -391,7 +452,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     )
     # Лог події старту та знімок оновлення профілю
     try:
-        log_profile_update(
+        await log_profile_update(
             user_id=user.id,
             fields={
                 "username": user.username or None,
@@ -401,7 +462,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
             images_count=None,
             source="start",
         )
-        log_action(
+        await log_action(
             actor_id=user.id,
             actor_username=user.username,
             action="start",
@@ -416,18 +477,15 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user_is_member = False
     if REPORTS_CHAT_ID:
         try:
-            member = await context.bot.get_chat_member(REPORTS_CHAT_ID, user.id)
-            user_is_member = member.status in {"member", "administrator", "creator"}
+            user_is_member = await is_group_member(context, REPORTS_CHAT_ID, user.id)
         except Exception as e:
             logger.warning(f"Не вдалося перевірити членство користувача {user.id}: {e}")
 
     if user_is_member:
         # Показуємо меню взаємодії (кнопки під полем вводу)
         is_admin = user.id in ADMIN_IDS
-        keyboard_rows = [["📝 Заява на неактив"]]
-        if is_admin:
-            keyboard_rows.append(["�️ Адмін-команди"])  # Перемикач у адмін-меню
-        reply_kb = ReplyKeyboardMarkup(keyboard_rows, resize_keyboard=True)
+        # Для адмінів — з перемикачем у адмін-меню
+        reply_kb = USER_MENU_KEYBOARD_ADMIN if is_admin else USER_MENU_KEYBOARD
 
         text = (
             f"<b>Вітаю, {user.first_name}!</b> 👋\n\n"
@@ -436,10 +494,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         await update.message.reply_text(text, reply_markup=reply_kb, parse_mode="HTML")
     else:
         # Користувач ще не в групі — стара логіка отримання доступу
-        keyboard = [
-            [InlineKeyboardButton("📝 Подати заявку на доступ", callback_data="request_access")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        reply_markup = REQUEST_ACCESS_KEYBOARD
 
         welcome_message = (
             f"<b>Вітаю, {user.first_name}!</b> 👋\n\n"
@@ -454,20 +509,7 @@ async def admin_help_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
     if update.effective_user.id not in ADMIN_IDS:
         await update.message.reply_text("❌ Немає доступу.")
         return
-    text = (
-        "🛡️ <b>Адмін-довідка</b>\n\n"
-        "<b>Адмінські команди</b>:\n"
-        "• /admin — коротка статистика заяв\n"
-        "• /dogana — оформлення догани (5 кроків, збереження у БД)\n"
-        "• /user &lt;id|@username&gt; — показати профіль користувача\n"
-        "• /find &lt;текст&gt; — пошук профілів; з повідомлення додаються кнопки дій (kick/догана)\n"
-        "• /broadcast_fill — розсилка інструкції щодо заповнення профілю\n"
-        "• /logs [limit] [action=...] [actor_id=...] [actor=@...] [from=YYYY-MM-DD] [to=YYYY-MM-DD] — останні дії з фільтрами\n"
-        "• /export_csv &lt;table&gt; [days=N] — експорт таблиці у CSV (profiles, action_logs, warnings, ... )\n"
-        "• /log_stats [days=7] — сводка (дії за типами, антиспам підсумки)\n\n"
-        "<b>Модерація неактиву</b>: у приват приходять картки з кнопками; після рішення — публікація у темі з атрибуцією.\n"
-    )
-    await update.message.reply_text(text, parse_mode="HTML", disable_web_page_preview=True)
+    await update.message.reply_text(ADMIN_HELP_TEXT, parse_mode="HTML", disable_web_page_preview=True)
 
 ############################
 # ДОГАН (адміністраторам)
@@ -506,7 +548,7 @@ async def dogana_date(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
     date_text = update.message.text.strip()
     
     # Перевірка формату дати (цифри та точки)
-    if not re.match(r'^\d{1,2}\.\d{1,2}(\.\d{4})?$', date_text):
+    if not is_valid_date(date_text):
         await update.message.reply_text(
             "❌ <b>Невірний формат дати!</b>\n\n"
             "<i>Використовуйте формат:</i>\n"
@@ -536,10 +578,10 @@ async def dogana_to(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     # Дозволяємо 'за замовчуванням' для використання префіла з /find
     if raw.lower() == "за замовчуванням" and context.user_data.get("dogana_prefill_to"):
         raw = context.user_data.get("dogana_prefill_to")
-    rank, name_text = parse_ranked_name(raw)
+    rank, name_text, valid = normalize_ranked_name(raw, NAME_CHARS_RE)
     
     # Перевірка українських символів та формату імені
-    if not re.match(r'^[А-ЯІЇЄа-яіїє\'\-\s\.]+$', name_text):
+    if not valid:
         await update.message.reply_text(
             "❌ <b>Ім'я та прізвище мають бути українською мовою!</b>\n\n"
             "<i>Приклади правильного формату:</i>\n"
@@ -619,7 +661,7 @@ async def dogana_punish_selected(update: Update, context: ContextTypes.DEFAULT_T
     try:
         # Логування в БД
         try:
-            insert_warning(
+            await insert_warning(
                 offense=form.get('offense') or '',
                 date_text=form.get('date') or '',
                 to_whom=form.get('to_whom') or '',
@@ -630,7 +672,7 @@ async def dogana_punish_selected(update: Update, context: ContextTypes.DEFAULT_T
                 issued_by_username=(query.from_user.username if query and query.from_user else None),
             )
             try:
-                log_action(
+                await log_action(
                     actor_id=query.from_user.id if query and query.from_user else None,
                     actor_username=query.from_user.username if query and query.from_user else None,
                     action="warning_issued",
@@ -649,6 +691,7 @@ async def dogana_punish_selected(update: Update, context: ContextTypes.DEFAULT_T
             message_thread_id=WARNINGS_TOPIC_ID,
             parse_mode="HTML",
             disable_web_page_preview=True,
+            rate_limit_args=BULK,
         )
         await query.edit_message_text("✅ Догану оформлено та відправлено у тему.")
     except Exception as e:
@@ -688,10 +731,10 @@ async def neaktyv_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
 
 async def neaktyv_to(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     raw = update.message.text.strip()
-    rank, name = parse_ranked_name(raw)
+    rank, name, valid = normalize_ranked_name(raw)
     
     # Валідація українського імені
-    if not re.match(r'^[А-ЯҐІЇЄЁ][а-яґіїєё\']*\s+[А-ЯҐІЇЄЁ][а-яґіїєё\']*$', name):
+    if not valid:
         await update.message.reply_text(
             "❌ Помилка введення!\n\n"
             "Ім'я та прізвище повинні:\n"
@@ -712,7 +755,7 @@ async def neaktyv_to(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     if update.effective_user and update.effective_user.id:
         # Не завжди доречно, але якщо користувач вказав звання про себе — збережемо
         if rank:
-            update_profile_fields(update.effective_user.id, rank=rank)
+            await update_profile_fields(update.effective_user.id, rank=rank)
     await update.message.reply_text(
         "🔸 Крок 2 з 3: Термін неактиву\n\n"
         "Введіть термін неактиву:\n"
@@ -725,11 +768,7 @@ async def neaktyv_time(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
     await update.message.reply_text(
         "🔸 Крок 3 з 3: Відділ\n\n"
         "Оберіть відділ НПУ:",
-        reply_markup=ReplyKeyboardMarkup(
-            [[meta["title"]] for meta in NPU_DEPARTMENTS.values()],
-            one_time_keyboard=True,
-            resize_keyboard=True
-        )
+        reply_markup=DEPARTMENT_REPLY_KEYBOARD
     )
     return NEAKTYV_DEPARTMENT
 
@@ -742,11 +781,7 @@ async def neaktyv_dept(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
         dept_title = NPU_DEPARTMENTS[inp]["title"]
     else:
         # Пошук по назві (без регістру)
-        low = inp.lower()
-        for meta in NPU_DEPARTMENTS.values():
-            if meta["title"].lower() == low:
-                dept_title = meta["title"]
-                break
+        dept_title = DEPARTMENT_TITLE_BY_LOWER.get(inp.lower())
     context.user_data["neaktyv_form"]["department"] = dept_title or inp
     form = context.user_data.get("neaktyv_form", {})
     
@@ -777,12 +812,12 @@ async def neaktyv_dept(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
     reply_markup = InlineKeyboardMarkup(keyboard)
     
     # Зберігаємо дані заяви для подальшого використання
-    context.bot_data[f"neaktyv_form_{user_id}"] = form.copy()
-    context.bot_data[f"neaktyv_form_{user_id}"]["author"] = author
+    NEAKTYV_STATE[f"neaktyv_form_{user_id}"] = form.copy()
+    NEAKTYV_STATE[f"neaktyv_form_{user_id}"]["author"] = author
     
     # Зберігаємо заявку в БД
     try:
-        request_id = insert_neaktyv_request(
+        request_id = await insert_neaktyv_request(
             requester_id=user_id,
             requester_username=username,
             to_whom=form.get('to_whom') or '',
@@ -791,10 +826,10 @@ async def neaktyv_dept(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
             department=form.get('department') or '',
         )
         # збережемо id заявки, щоб модераторське рішення оновило саме її
-        context.bot_data[f"neaktyv_req_id_{user_id}"] = request_id
+        NEAKTYV_STATE[f"neaktyv_req_id_{user_id}"] = request_id
         # Загальний лог створення заявки
         try:
-            log_action(
+            await log_action(
                 actor_id=user_id,
                 actor_username=username,
                 action="neaktyv_request_created",
@@ -808,16 +843,14 @@ async def neaktyv_dept(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
         logger.error(f"DB insert neaktyv failed: {dbe}")
 
     # Відправляємо адміністраторам
-    for admin_id in ADMIN_IDS:
-        try:
-            await context.bot.send_message(
-                chat_id=admin_id,
-                text=admin_message,
-                reply_markup=reply_markup,
-                parse_mode="HTML"
-            )
-        except Exception as e:
-            logger.error(f"Не вдалося відправити повідомлення адміністратору {admin_id}: {e}")
+    await notify_admins(
+        context,
+        "neaktyv_request",
+        NEAKTYV_STATE.get(f"neaktyv_req_id_{user_id}"),
+        text=admin_message,
+        reply_markup=reply_markup,
+        parse_mode="HTML",
+    )
     
     await update.message.reply_text(
         "✅ Заяву на неактив відправлено адміністраторам для розгляду.",
@@ -873,10 +906,11 @@ async def handle_neaktyv_moderation(update: Update, context: ContextTypes.DEFAUL
 
 async def process_neaktyv_approval_name(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Обробка введення імені модератора"""
-    name = update.message.text.strip()
+    # Лише ім'я та прізвище, без звання; зайві пробіли прибираємо
+    name = " ".join(update.message.text.split())
     
     # Валідація українського імені
-    if not re.match(r'^[А-ЯҐІЇЄЁ][а-яґіїєё\']*\s+[А-ЯҐІЇЄЁ][а-яґіїєё\']*$', name):
+    if not FULL_NAME_RE.fullmatch(name):
         await update.message.reply_text(
             "❌ Помилка введення!\n\n"
             "Ім'я та прізвище повинні:\n"
@@ -897,7 +931,7 @@ async def process_neaktyv_approval_name(update: Update, context: ContextTypes.DE
     
     # Отримуємо збережені дані заяви
     form_key = f"neaktyv_form_{user_id}"
-    form = context.bot_data.get(form_key)
+    form = NEAKTYV_STATE.get(form_key)
     
     if not form:
         await update.message.reply_text("❌ Дані заяви не знайдено. Можливо, вона вже була оброблена.")
@@ -943,20 +977,21 @@ async def process_neaktyv_approval_name(update: Update, context: ContextTypes.DE
                 chat_id=REPORTS_CHAT_ID,
                 text=group_message,
                 message_thread_id=AFK_TOPIC_ID,
-                parse_mode="HTML"
+                parse_mode="HTML",
+                rate_limit_args=BULK,
             )
             # Лог рішення в БД
             try:
-                req_id = context.bot_data.get(f"neaktyv_req_id_{user_id}")
+                req_id = NEAKTYV_STATE.get(f"neaktyv_req_id_{user_id}")
                 if req_id:
-                    decide_neaktyv_request(
+                    await decide_neaktyv_request(
                         request_id=req_id,
                         status='approved',
                         moderator_name=name,
                         moderator_user_id=update.effective_user.id,
                     )
                     try:
-                        log_action(
+                        await log_action(
                             actor_id=update.effective_user.id,
                             actor_username=update.effective_user.username,
                             action="neaktyv_approved",
@@ -996,16 +1031,16 @@ async def process_neaktyv_approval_name(update: Update, context: ContextTypes.DE
             )
             # Лог рішення в БД
             try:
-                req_id = context.bot_data.get(f"neaktyv_req_id_{user_id}")
+                req_id = NEAKTYV_STATE.get(f"neaktyv_req_id_{user_id}")
                 if req_id:
-                    decide_neaktyv_request(
+                    await decide_neaktyv_request(
                         request_id=req_id,
                         status='rejected',
                         moderator_name=name,
                         moderator_user_id=update.effective_user.id,
                     )
                     try:
-                        log_action(
+                        await log_action(
                             actor_id=update.effective_user.id,
                             actor_username=update.effective_user.username,
                             action="neaktyv_rejected",
@@ -1023,7 +1058,8 @@ async def process_neaktyv_approval_name(update: Update, context: ContextTypes.DE
             await update.message.reply_text("❌ Помилка при обробці відхилення.")
     
     # Очищуємо збережені дані
-    context.bot_data.pop(form_key, None)
+    NEAKTYV_STATE.pop(form_key, None)
+    NEAKTYV_STATE.pop(f"neaktyv_req_id_{user_id}", None)
     context.user_data.pop("moderation_action", None)
     context.user_data.pop("moderation_user_id", None)
     context.user_data.pop("original_message_id", None)
@@ -1066,10 +1102,10 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             rank = NPU_RANKS[rank_idx]
             user_id = update.effective_user.id
             if user_id in USER_APPLICATIONS:
-                USER_APPLICATIONS[user_id]['rank'] = rank
-                update_profile_fields(user_id, rank=rank)
+                USER_APPLICATIONS[user_id].rank = rank
+                await update_profile_fields(user_id, rank=rank)
                 try:
-                    log_profile_update(user_id=user_id, fields={"rank": rank}, images_count=None, source="apply")
+                    await log_profile_update(user_id=user_id, fields={"rank": rank}, images_count=None, source="apply")
                 except Exception:
                     pass
                 await query.edit_message_text(
@@ -1079,15 +1115,15 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                 )
                 context.user_data['awaiting_application'] = True
                 context.user_data['step'] = 'waiting_image_urls'
-                USER_APPLICATIONS[user_id]['step'] = 'waiting_image_urls'
+                USER_APPLICATIONS[user_id].step = 'waiting_image_urls'
     
     elif query.data.startswith("approve_"):
         user_id = int(query.data.split("_")[1])
-        await approve_request(update, context, user_id)
+        await moderate_request(approve_request, update, context, user_id)
     
     elif query.data.startswith("reject_"):
         user_id = int(query.data.split("_")[1])
-        await reject_request(update, context, user_id)
+        await moderate_request(reject_request, update, context, user_id)
 
 async def handle_application_text(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Універсальний обробник текстових повідомлень для заявок"""
@@ -1096,57 +1132,49 @@ async def handle_application_text(update: Update, context: ContextTypes.DEFAULT_
     message_text = update.message.text
     
     # Логируем все входящие текстовые сообщения
-    logger.info(f"handle_application_text: User {user_id} sent: '{message_text}'")
-    logger.info(f"handle_application_text: awaiting_application = {context.user_data.get('awaiting_application')}")
-    logger.info(f"handle_application_text: step = {context.user_data.get('step')}")
+    message_log.debug(
+        "handle_application_text: user %s sent %r (awaiting_application=%s, step=%s)",
+        user_id, message_text, context.user_data.get('awaiting_application'), context.user_data.get('step'),
+    )
     
     # Перевіряємо, чи це може бути список посилань (якщо є принаймні 2 рядки, що виглядають як URL)
     lines = [line.strip() for line in message_text.split('\n') if line.strip()]
-    url_pattern = re.compile(r'^https?://')
-    url_lines = [line for line in lines if url_pattern.match(line)]
+    url_lines = [line for line in lines if URL_PREFIX_RE.match(line)]
     
-    logger.info(f"handle_application_text: Found {len(url_lines)} URL lines out of {len(lines)} total lines")
+    message_log.debug("handle_application_text: found %d URL lines out of %d total lines", len(url_lines), len(lines))
     
     # Якщо є 2 або більше посилань, обробляємо як посилання на зображення
     if len(url_lines) >= 2:
-        logger.info(f"handle_application_text: Processing as image URLs")
         # Перевіряємо, чи користувач вже в системі
         if user_id not in USER_APPLICATIONS:
             # Якщо користувач ще не починав процес, створюємо базовий запис
-            USER_APPLICATIONS[user_id] = {
-                'user': user,
-                'name': None,
-                'npu_department': None,
-                'image_urls': [],
-                'step': 'waiting_image_urls'
-            }
-            logger.info(f"handle_application_text: Created new USER_APPLICATIONS entry for {user_id}")
+            USER_APPLICATIONS[user_id] = ApplicationDraft.start(user, 'waiting_image_urls')
+            message_log.debug("handle_application_text: created new USER_APPLICATIONS entry for %s", user_id)
         
         # Оновлюємо крок на очікування зображень, якщо ще не встановлено
-        if USER_APPLICATIONS[user_id]['step'] != 'waiting_image_urls':
-            USER_APPLICATIONS[user_id]['step'] = 'waiting_image_urls'
+        if USER_APPLICATIONS[user_id].step != 'waiting_image_urls':
+            USER_APPLICATIONS[user_id].step = 'waiting_image_urls'
         
         # Встановлюємо, що користувач в процесі подачі заявки
         context.user_data['awaiting_application'] = True
         context.user_data['step'] = 'waiting_image_urls'
         
         # Викликаємо обробку посилань
-        logger.info(f"handle_application_text: Calling handle_image_urls_application")
+        message_log.debug("handle_application_text: processing as image URLs")
         await handle_image_urls_application(update, context)
         return
     
     # Якщо користувач не в процесі подачі заявки
     if not context.user_data.get('awaiting_application'):
-        logger.info(f"User {user_id} not in application process, ignoring text: '{message_text}'")
+        message_log.debug("User %s not in application process, ignoring text", user_id)
         return
     
     step = context.user_data.get('step', 'waiting_name')
-    logger.info(f"handle_application_text: Processing step = {step}")
+    message_log.debug("handle_application_text: processing step = %s", step)
     
     if step == 'waiting_name':
         await handle_name_input(update, context)
     elif step == 'waiting_image_urls':
-        logger.info(f"handle_application_text: Calling handle_image_urls_application for step waiting_image_urls")
         await handle_image_urls_application(update, context)
 
 async def handle_name_input(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -1173,35 +1201,22 @@ async def handle_name_input(update: Update, context: ContextTypes.DEFAULT_TYPE)
     
     # Зберігаємо ім'я та показуємо вибір НПУ
     if user_id not in USER_APPLICATIONS:
-        USER_APPLICATIONS[user_id] = {
-            'user': user,
-            'name': None,
-            'npu_department': None,
-            'image_urls': [],
-            'step': 'waiting_name'
-        }
-    
-    USER_APPLICATIONS[user_id]['name'] = name_input
+        USER_APPLICATIONS[user_id] = ApplicationDraft.start(user, 'waiting_name')
+    
+    USER_APPLICATIONS[user_id].name = name_input
     # Зберігаємо ім'я у грі в профіль
-    update_profile_fields(user_id, in_game_name=name_input)
+    await update_profile_fields(user_id, in_game_name=name_input)
     try:
-        log_profile_update(user_id=user_id, fields={"in_game_name": name_input}, images_count=None, source="apply")
+        await log_profile_update(user_id=user_id, fields={"in_game_name": name_input}, images_count=None, source="apply")
     except Exception:
         pass
     context.user_data['step'] = 'waiting_npu' # FIX: Update user_data context
     
-    # Створюємо кнопки для вибору НПУ
-    keyboard = []
-    for code, meta in NPU_DEPARTMENTS.items():
-        keyboard.append([InlineKeyboardButton(meta["title"], callback_data=f"npu_{code}")])
-    
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
     await update.message.reply_text(
         f"✅ Ім'я прийнято: {name_input}\n\n"
         "📝 Крок 2: Оберіть ваше управління НПУ\n\n"
         "⚠️ Доступні тільки ці управління для UKRAINE GTA:",
-        reply_markup=reply_markup
+        reply_markup=DEPARTMENT_KEYBOARDS["npu_"]
     )
 
 async def select_npu_department(update: Update, context: ContextTypes.DEFAULT_TYPE, npu_code: str) -> None:
@@ -1221,72 +1236,49 @@ async def select_npu_department(update: Update, context: ContextTypes.DEFAULT_TY
         return
     
     # Зберігаємо вибір НПУ
-    USER_APPLICATIONS[user_id]['npu_department'] = NPU_DEPARTMENTS[npu_code]["title"]
+    USER_APPLICATIONS[user_id].npu_department = NPU_DEPARTMENTS[npu_code]["title"]
     # Оновлюємо підрозділ у профілі
-    update_profile_fields(user_id, npu_department=NPU_DEPARTMENTS[npu_code]["title"])
+    await update_profile_fields(user_id, npu_department=NPU_DEPARTMENTS[npu_code]["title"])
     try:
-        log_profile_update(user_id=user_id, fields={"npu_department": NPU_DEPARTMENTS[npu_code]["title"]}, images_count=None, source="apply")
+        await log_profile_update(user_id=user_id, fields={"npu_department": NPU_DEPARTMENTS[npu_code]["title"]}, images_count=None, source="apply")
     except Exception:
         pass
-    USER_APPLICATIONS[user_id]['step'] = 'waiting_rank'
+    USER_APPLICATIONS[user_id].step = 'waiting_rank'
     context.user_data['step'] = 'waiting_rank'
 
     # Показать выбор звания
-    rank_buttons = []
-    row = []
-    for idx, rank in enumerate(NPU_RANKS):
-        row.append(InlineKeyboardButton(rank, callback_data=f"rank_{idx}"))
-        if len(row) == 2:
-            rank_buttons.append(row)
-            row = []
-    if row:
-        rank_buttons.append(row)
-    meta = NPU_DEPARTMENTS[npu_code]
-    desc = (
-        f"✅ Обрано підрозділ: <b>{meta['title']}</b> {meta['tag']}\n"
-        f"Місце: {meta['location']}\n"
-        f"Допуск: {meta['eligibility']}\n\n"
-        f"{meta['desc']}\n\n"
-        "📝 Крок 3: Оберіть ваше звання"
+    await query.edit_message_text(
+        DEPARTMENT_CARDS["apply"][npu_code], reply_markup=RANK_KEYBOARDS["rank_"], parse_mode="HTML"
     )
-    await query.edit_message_text(desc, reply_markup=InlineKeyboardMarkup(rank_buttons), parse_mode="HTML")
 
 async def handle_image_urls_application(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Обробник посилань на зображення для заявок"""
     user = update.effective_user
     user_id = user.id
 
-    logger.info(f"handle_image_urls_application: User {user_id} entered function")
-    logger.info(f"handle_image_urls_application: USER_APPLICATIONS contains user: {user_id in USER_APPLICATIONS}")
+    message_log.debug("handle_image_urls_application: user %s, has draft: %s", user_id, user_id in USER_APPLICATIONS)
 
     # Перевіряємо чи користувач вже надіслав текст
     if user_id not in USER_APPLICATIONS:
         # Якщо користувача немає в списку, створюємо базовий запис
-        logger.info(f"handle_image_urls_application: Creating new USER_APPLICATIONS entry for {user_id}")
-        USER_APPLICATIONS[user_id] = {
-            'user': user,
-            'name': None,
-            'npu_department': None,
-            'image_urls': [],
-            'step': 'waiting_image_urls'
-        }
-    
-    user_data = USER_APPLICATIONS[user_id]
-    logger.info(f"handle_image_urls_application: User data step = {user_data.get('step')}")
+        message_log.debug("handle_image_urls_application: creating new USER_APPLICATIONS entry for %s", user_id)
+        USER_APPLICATIONS[user_id] = ApplicationDraft.start(user, 'waiting_image_urls')
+    
+    draft = USER_APPLICATIONS[user_id]
+    message_log.debug("handle_image_urls_application: draft step = %s", draft.step)
     
     # Оновлюємо крок, якщо ще не встановлений
-    if user_data.get('step') != 'waiting_image_urls':
-        user_data['step'] = 'waiting_image_urls'
-        logger.info(f"handle_image_urls_application: Updated step to waiting_image_urls")
+    if draft.step != 'waiting_image_urls':
+        draft.step = 'waiting_image_urls'
     
     # Отримуємо текст повідомлення та розділяємо на рядки
     message_text = update.message.text.strip()
     urls = [url.strip() for url in message_text.split('\n') if url.strip()]
     
-    logger.info(f"handle_image_urls_application: Processing {len(urls)} URLs: {urls}")
+    message_log.debug("handle_image_urls_application: processing %d URLs: %s", len(urls), urls)
     
     if len(urls) < 2:
-        logger.info(f"handle_image_urls_application: Not enough URLs ({len(urls)}), asking for more")
+        message_log.debug("handle_image_urls_application: not enough URLs (%d), asking for more", len(urls))
         await update.message.reply_text(
             "❌ Будь ласка, надішліть мінімум 2 посилання на зображення:\n"
             "1. Скріншот посвідчення\n"
@@ -1296,12 +1288,11 @@ async def handle_image_urls_application(update: Update, context: ContextTypes.DE
         return
     
     # Зберігаємо посилання без валідації
-    logger.info(f"handle_image_urls_application: Saving URLs to user_data and database")
-    user_data['image_urls'] = urls
+    draft.image_urls = urls
     # Сохраняем изображения в БД
-    replace_profile_images(user_id, urls)
+    await replace_profile_images(user_id, urls)
     
-    logger.info(f"handle_image_urls_application: Calling finalize_application")
+    logger.info("Application from user %s: %d image URLs saved, finalizing", user_id, len(urls))
     await finalize_application(update, context, user_id)
 
 def get_image_info(url: str) -> str:
@@ -1315,59 +1306,60 @@ async def finalize_application(update: Update, context: ContextTypes.DEFAULT_TYP
         await update.message.reply_text("❌ Помилка: дані заявки не знайдено. Спробуйте почати знову з /start")
         return
     
-    user_data = USER_APPLICATIONS[user_id]
-    user = user_data['user']
+    draft = USER_APPLICATIONS[user_id]
+    user = draft.user
     
     # Якщо ім'я не вказане, намагаємося отримати з профілю або використовуємо ім'я з Telegram
-    if not user_data.get('name'):
-        profile = get_profile(user_id)
+    if not draft.name:
+        profile = await get_profile(user_id)
         if profile and profile.get('in_game_name'):
-            user_data['name'] = profile['in_game_name']
+            draft.name = profile['in_game_name']
         else:
             # Використовуємо ім'я з Telegram, якщо немає іншого варіанту
-            user_data['name'] = f"{user.first_name} {user.last_name or ''}".strip()
+            draft.name = user.full_name
     
     # Якщо немає вибраного підрозділу, встановлюємо значення за замовчуванням
-    if not user_data.get('npu_department'):
-        user_data['npu_department'] = "Не вказано"
+    if not draft.npu_department:
+        draft.npu_department = "Не вказано"
 
     # Створюємо заявку для обробки
     PENDING_REQUESTS[user_id] = {
         'user': user,
-        'name': user_data['name'],
-        'npu_department': user_data['npu_department'],
-        'image_urls': user_data['image_urls']
+        'name': draft.name,
+        'npu_department': draft.npu_department,
+        'image_urls': draft.image_urls
     }
 
     # Лог заявки на доступ у БД
+    application_id = None
     try:
-        insert_access_application(
+        application_id = await insert_access_application(
             user_id=user.id,
             username=user.username,
-            in_game_name=user_data['name'],
-            npu_department=user_data['npu_department'],
-            rank=USER_APPLICATIONS[user_id].get('rank'),
-            images=user_data['image_urls'],
+            in_game_name=draft.name,
+            npu_department=draft.npu_department,
+            rank=draft.rank,
+            images=draft.image_urls,
         )
         try:
             # Знімок оновлення профілю та лог дії
-            log_profile_update(
+            await log_profile_update(
                 user_id=user.id,
                 fields={
-                    "in_game_name": user_data.get('name'),
-                    "npu_department": user_data.get('npu_department'),
-                    "rank": USER_APPLICATIONS[user_id].get('rank'),
+                    "in_game_name": draft.name,
+                    "npu_department": draft.npu_department,
+                    "rank": draft.rank,
                 },
-                images_count=len(user_data.get('image_urls') or []),
+                images_count=len(draft.image_urls or []),
                 source="apply",
             )
-            log_action(
+            await log_action(
                 actor_id=user.id,
                 actor_username=user.username,
                 action="access_application_submitted",
                 target_user_id=user.id,
                 target_username=user.username,
-                details=f"images={len(user_data.get('image_urls') or [])}",
+                details=f"images={len(draft.image_urls or [])}",
             )
         except Exception:
             pass
@@ -1377,10 +1369,10 @@ async def finalize_application(update: Update, context: ContextTypes.DEFAULT_TYP
     # Відправляємо підтвердження користувачу
     await update.message.reply_text(
         "✅ Вашу заявку повністю отримано!\n\n"
-        f"👤 Ім'я: {user_data['name']}\n"
-        f"🎖️ Звання: {user_data.get('rank') or '—'}\n"
-        f"🏛️ Підрозділ НПУ: {user_data.get('npu_department') or '—'}\n"
-        f"🔗 Посилання на зображення: {len(user_data['image_urls'])}\n\n"
+        f"👤 Ім'я: {draft.name}\n"
+        f"🎖️ Звання: {draft.rank or '—'}\n"
+        f"🏛️ Підрозділ НПУ: {draft.npu_department or '—'}\n"
+        f"🔗 Посилання на зображення: {len(draft.image_urls)}\n\n"
         "Очікуйте на розгляд адміністратором. "
         "Ви отримаєте повідомлення, коли заявку буде розглянуто."
     )
@@ -1395,7 +1387,7 @@ async def finalize_application(update: Update, context: ContextTypes.DEFAULT_TYP
     reply_markup = InlineKeyboardMarkup(keyboard)
 
     # Формуємо список зображень для адміністратора
-    images_list = "\n".join([f"{i+1}. {url}" for i, url in enumerate(user_data['image_urls'])])
+    images_list = "\n".join([f"{i+1}. {url}" for i, url in enumerate(draft.image_urls)])
 
     admin_message = (
         "🆕 Нова заявка на доступ!\n\n"
@@ -1403,28 +1395,37 @@ async def finalize_application(update: Update, context: ContextTypes.DEFAULT_TYP
         f"🆔 ID: {user.id}\n"
         f"📱 Нікнейм: @{user.username or 'немає'}\n\n"
         f"📝 Заявка:\n"
-        f"👤 Ім'я: {user_data['name']}\n"
-        f"🎖️ Звання: {user_data.get('rank') or '—'}\n"
-        f"🏛️ Підрозділ НПУ: {user_data.get('npu_department') or '—'}\n\n"
-        f"🔗 Зображення ({len(user_data['image_urls'])}):\n{images_list}"
+        f"👤 Ім'я: {draft.name}\n"
+        f"🎖️ Звання: {draft.rank or '—'}\n"
+        f"🏛️ Підрозділ НПУ: {draft.npu_department or '—'}\n\n"
+        f"🔗 Зображення ({len(draft.image_urls)}):\n{images_list}"
     )
 
-    for admin_id in ADMIN_IDS:
-        try:
-            # Надсилаємо текстове повідомлення з кнопками
-            await context.bot.send_message(
-                chat_id=admin_id,
-                text=admin_message,
-                reply_markup=reply_markup
-            )
-        except Exception as e:
-            logger.error(f"Не вдалося відправити повідомлення адміністратору {admin_id}: {e}")
+    # Надсилаємо текстове повідомлення з кнопками
+    await notify_admins(
+        context,
+        "access_application",
+        application_id,
+        text=admin_message,
+        reply_markup=reply_markup,
+    )
 
     # Очищуємо дані користувача
     context.user_data['awaiting_application'] = False
     if user_id in USER_APPLICATIONS:
         del USER_APPLICATIONS[user_id]
 
+async def moderate_request(handler, update: Update, context: ContextTypes.DEFAULT_TYPE, user_id: int) -> None:
+    """Не даємо двом адмінам одночасно схвалити/відхилити ту саму заявку."""
+    if user_id in MODERATION_IN_PROGRESS:
+        await update.callback_query.edit_message_text("⏳ Цю заявку вже обробляє інший адміністратор.")
+        return
+    MODERATION_IN_PROGRESS.add(user_id)
+    try:
+        await handler(update, context, user_id)
+    finally:
+        MODERATION_IN_PROGRESS.discard(user_id)
+
 async def approve_request(update: Update, context: ContextTypes.DEFAULT_TYPE, user_id: int) -> None:
     """Схвалення заявки"""
     query = update.callback_query
@@ -1442,7 +1443,7 @@ async def approve_request(update: Update, context: ContextTypes.DEFAULT_TYPE, us
         if user.username:
             user_display_name += f" (@{user.username})"
         
-        invite_link = await create_invite_link(context, user_display_name)
+        invite_link = await create_invite_link(context, user_display_name, user.id)
         
         # Відправляємо персональне посилання користувачу
         invite_message = (
@@ -1476,7 +1477,7 @@ async def approve_request(update: Update, context: ContextTypes.DEFAULT_TYPE, us
         )
         # Лог рішення по заявці у БД
         try:
-            decide_access_application(
+            await decide_access_application(
                 user_id=user.id,
                 decision='approved',
                 decided_by_admin_id=update.effective_user.id,
@@ -1487,7 +1488,7 @@ async def approve_request(update: Update, context: ContextTypes.DEFAULT_TYPE, us
             logger.error(f"DB decide access approve failed: {dbe}")
         # Загальний лог рішення
         try:
-            log_action(
+            await log_action(
                 actor_id=update.effective_user.id,
                 actor_username=update.effective_user.username,
                 action="access_approved",
@@ -1524,7 +1525,7 @@ async def approve_request(update: Update, context: ContextTypes.DEFAULT_TYPE, us
             logger.error(f"Не вдалося відправити навіть основне посилання користувачу {user.id}: {e2}")
         # Лог рішення по заявці у БД (approve без персонального інвайту)
         try:
-            decide_access_application(
+            await decide_access_application(
                 user_id=user.id,
                 decision='approved',
                 decided_by_admin_id=update.effective_user.id,
@@ -1534,7 +1535,7 @@ async def approve_request(update: Update, context: ContextTypes.DEFAULT_TYPE, us
         except Exception as dbe:
             logger.error(f"DB decide access approve(fallback) failed: {dbe}")
         try:
-            log_action(
+            await log_action(
                 actor_id=update.effective_user.id,
                 actor_username=update.effective_user.username,
                 action="access_approved_fallback",
@@ -1580,7 +1581,7 @@ async def reject_request(update: Update, context: ContextTypes.DEFAULT_TYPE, use
         )
     # Лог рішення по заявці у БД
     try:
-        decide_access_application(
+        await decide_access_application(
             user_id=user.id,
             decision='rejected',
             decided_by_admin_id=update.effective_user.id,
@@ -1590,7 +1591,7 @@ async def reject_request(update: Update, context: ContextTypes.DEFAULT_TYPE, use
     except Exception as dbe:
         logger.error(f"DB decide access reject failed: {dbe}")
     try:
-        log_action(
+        await log_action(
             actor_id=update.effective_user.id,
             actor_username=update.effective_user.username,
             action="access_rejected",
@@ -1613,24 +1614,135 @@ async def admin_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
         return
     
     pending_count = len(PENDING_REQUESTS)
+    cache = profile_cache_stats()["profiles"]
+    out = OUTBOUND_LIMITER.stats()
+    upd = UPDATE_PROCESSOR.stats()
+    members = MEMBERSHIP_CACHE.stats()
+    spam = ANTISPAM.stats()
+    state = STATE.stats()
+    state_line = ", ".join(
+        f"{name} {count} (~{state['bytes'][name] / 1024:.0f} КБ)" for name, count in state["namespaces"].items()
+    )
+    if INVITE_POOL:
+        invites = INVITE_POOL.stats()
+        invites_line = (
+            f"Пул запрошень: {invites['depth'] if invites['depth'] is not None else '?'}/{invites['target_size']} "
+            f"(видано {invites['claimed']}, промахів {invites['misses']}, створено {invites['created']}, "
+            f"відкликано {invites['revoked']}; останнє поповнення {invites['last_refill_ms']:.0f} мс)"
+        )
+    else:
+        invites_line = "Пул запрошень: вимкнено (немає GROUP_CHAT_ID)"
     await update.message.reply_text(
         f"📊 Статистика:\n\n"
-        f"Заявок в очікуванні: {pending_count}"
+        f"Заявок в очікуванні: {pending_count}\n"
+        f"Стан у пам'яті: {state_line or '—'}; прострочено {state['expired']}, витіснено {state['evicted']}\n\n"
+        f"Кеш профілів: {cache['size']}/{cache['maxsize']}, "
+        f"влучань {cache['hits']}, промахів {cache['misses']} ({cache['hit_rate']:.0%}), "
+        f"витіснень {cache['evictions']}\n"
+        f"Кеш членства: {members['size']} записів, влучань {members['hits']} ({members['hit_rate']:.0%}), "
+        f"зекономлено запитів get_chat_member: {members['hits']}\n"
+        f"{invites_line}\n\n"
+        f"Вихідна черга: {out['queued']} у глобальній, {out['waiting_chat']} чекають ліміту чату; "
+        f"RetryAfter: {out['retries']} ({out['retry_after_total']:.0f} с)\n"
+        f"Очікування interactive: сер. {out['interactive']['avg_wait'] * 1000:.0f} мс, "
+        f"p95 {out['interactive']['p95_wait'] * 1000:.0f} мс; "
+        f"bulk: сер. {out['bulk']['avg_wait'] * 1000:.0f} мс, p95 {out['bulk']['p95_wait'] * 1000:.0f} мс\n\n"
+        f"Обробка апдейтів: {upd['running']}/{upd['max_running']} виконується, {upd['queued']} у черзі; "
+        f"найдовша черга користувача {upd['deepest_key']} (макс. {upd['max_key_depth']}), "
+        f"p95 очікування {upd['p95_wait'] * 1000:.0f} мс\n"
+        f"Антиспам: відсічено повідомлень {spam['blocked']['message']}, кліків {spam['blocked']['callback']}; "
+        f"відстежується {spam['tracked']['message']}/{spam['tracked']['callback']} користувачів, "
+        f"витіснено {spam['evicted']}, подій до запису {spam['pending_events']}"
     )
 
+# /logs: скільки записів на сторінці за замовчуванням/максимум і скільки запитів пам'ятати на адміна
+LOGS_PAGE_SIZE = 20
+LOGS_PAGE_MAX = 100
+LOGS_CURSORS_MAX = 20
+# Повідомлення Telegram — до 4096 символів; лишаємо місце під заголовок і теги
+LOGS_PAGE_CHARS = 3800
+LOGS_ROW_CHARS = 700
+
+
+def _format_log_row(r: dict) -> str:
+    actor = f"{r['actor_id']} (@{r['actor_username']})" if r.get('actor_username') else str(r.get('actor_id'))
+    target = (f" -> {r['target_user_id']} (@{r['target_username']})" if r.get('target_user_id') else "")
+    det = f" | {r['details']}" if r.get('details') else ""
+    # Обрізаємо до екранування: html.escape може збільшити рядок, а розрізати сутність не можна
+    return html.escape(f"[{r['created_at']}] {actor}: {r['action']}{target}{det}"[:LOGS_ROW_CHARS])
+
+
+def _fit_log_page(rows: list[dict], keep_oldest: bool) -> tuple[list[dict], list[str]]:
+    """Скільки рядків (від новіших до старіших) влізе в одне повідомлення.
+
+    Для сторінки «новіші» обрізаємо з боку новіших, щоб сторінки йшли без пропусків.
+    """
+    ordered = list(reversed(rows)) if keep_oldest else rows
+    shown, lines, used = [], [], 0
+    for r in ordered:
+        line = _format_log_row(r)
+        if lines and used + len(line) + 1 > LOGS_PAGE_CHARS:
+            break
+        shown.append(r)
+        lines.append(line)
+        used += len(line) + 1
+    if keep_oldest:
+        shown.reverse()
+        lines.reverse()
+    return shown, lines
+
+
+async def _send_logs_page(update: Update, context: ContextTypes.DEFAULT_TYPE, token: str, before_id=None, after_id=None) -> None:
+    query_state = context.user_data.get("logs_cursors", {}).get(token)
+    if query_state is None:
+        await update.callback_query.answer("Запит застарів — повторіть /logs", show_alert=True)
+        return
+    page_size = query_state["page_size"]
+    # Один зайвий рядок показує, чи є ще сторінка в цьому напрямку
+    rows = await query_action_logs(
+        limit=page_size + 1, before_id=before_id, after_id=after_id, **query_state["filters"]
+    )
+    going_newer = after_id is not None
+    more = len(rows) > page_size
+    if more:
+        rows = rows[1:] if going_newer else rows[:-1]
+    shown, lines = _fit_log_page(rows, keep_oldest=going_newer)
+    truncated = len(shown) < len(rows)
+
+    if not shown:
+        text = "Порожньо."
+        keyboard = None
+    else:
+        has_newer = (more or truncated) if going_newer else before_id is not None
+        has_older = (more or truncated) if not going_newer else True
+        buttons = []
+        if has_newer:
+            buttons.append(InlineKeyboardButton("⬅️ Новіші", callback_data=f"logs:{token}:a{shown[0]['id']:x}"))
+        if has_older:
+            buttons.append(InlineKeyboardButton("Старіші ➡️", callback_data=f"logs:{token}:b{shown[-1]['id']:x}"))
+        keyboard = InlineKeyboardMarkup([buttons]) if buttons else None
+        text = f"<b>Дії #{shown[-1]['id']}–#{shown[0]['id']} ({len(shown)}):</b>\n\n<code>" + "\n".join(lines) + "</code>"
+
+    if update.callback_query:
+        await update.callback_query.answer()
+        await update.callback_query.edit_message_text(text, parse_mode="HTML", reply_markup=keyboard, disable_web_page_preview=True)
+    else:
+        await update.message.reply_text(text, parse_mode="HTML", reply_markup=keyboard, disable_web_page_preview=True)
+
+
 async def logs_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Адм-команда: последние N действий, фильтры по дате/актеру/действию.\n
-    Использование: /logs [limit] [action=<x>] [actor_id=<id>] [actor=@name] [from=YYYY-MM-DD] [to=YYYY-MM-DD]
+    """Адм-команда: журнал действий постранично, фильтры по дате/актеру/действию.\n
+    Использование: /logs [per_page] [action=<x>] [actor_id=<id>] [actor=@name] [from=YYYY-MM-DD] [to=YYYY-MM-DD]
     """
     if update.effective_user.id not in ADMIN_IDS:
         await update.message.reply_text("❌ Немає доступу.")
         return
     args = context.args or []
-    limit = 50
+    page_size = LOGS_PAGE_SIZE
     kw = {"actor_id": None, "actor_username": None, "action": None, "date_from": None, "date_to": None}
     for a in args:
         if a.isdigit():
-            limit = max(1, min(500, int(a)))
+            page_size = max(1, min(LOGS_PAGE_MAX, int(a)))
         elif a.startswith("action="):
             kw["action"] = a.split("=",1)[1]
         elif a.startswith("actor_id="):
@@ -1644,44 +1756,77 @@ async def logs_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
             kw["date_from"] = a.split("=",1)[1]
         elif a.startswith("to="):
             kw["date_to"] = a.split("=",1)[1]
-    rows = query_action_logs(limit=limit, **kw)
-    if not rows:
-        await update.message.reply_text("Порожньо.")
+    # Фільтри лишаються в user_data, у кнопках — лише токен запиту і id межі сторінки
+    cursors = context.user_data.setdefault("logs_cursors", {})
+    token = secrets.token_urlsafe(6)
+    cursors[token] = {"filters": kw, "page_size": page_size}
+    while len(cursors) > LOGS_CURSORS_MAX:
+        cursors.pop(next(iter(cursors)))
+    await _send_logs_page(update, context, token)
+
+
+async def logs_page_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Кнопки «Новіші/Старіші» під /logs: logs:<token>:<a|b><id у hex>."""
+    query = update.callback_query
+    if query.from_user.id not in ADMIN_IDS:
+        await query.answer("❌ Немає доступу.", show_alert=True)
         return
-    lines = []
-    for r in rows:
-        actor = f"{r['actor_id']} (@{r['actor_username']})" if r.get('actor_username') else str(r.get('actor_id'))
-        target = (f" -> {r['target_user_id']} (@{r['target_username']})" if r.get('target_user_id') else "")
-        det = f" | {r['details']}" if r.get('details') else ""
-        lines.append(f"[{r['created_at']}] {actor}: {r['action']}{target}{det}")
-    text = "\n".join(lines[:1000])
-    await update.message.reply_text(f"<b>Останні дії ({len(rows)}):</b>\n\n<code>{text}</code>", parse_mode="HTML", disable_web_page_preview=True)
+    try:
+        _, token, cursor = query.data.split(":", 2)
+        boundary = int(cursor[1:], 16)
+    except ValueError:
+        await query.answer()
+        return
+    if cursor[0] == "a":
+        await _send_logs_page(update, context, token, after_id=boundary)
+    else:
+        await _send_logs_page(update, context, token, before_id=boundary)
 
 
 async def export_csv_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Адм-команда: експорта CSV.\n
-    Использование: /export_csv <table> [days=N]
+    Использование: /export_csv <table> [days=N] [gzip]
     Допустимые таблицы: profiles, profile_images, warnings, neaktyv_requests, access_applications, action_logs, profile_updates, antispam_events, error_logs
     """
     if update.effective_user.id not in ADMIN_IDS:
         await update.message.reply_text("❌ Немає доступу.")
         return
     if not context.args:
-        await update.message.reply_text("Використання: /export_csv <table> [days=N]")
+        await update.message.reply_text("Використання: /export_csv <table> [days=N] [gzip]")
         return
     table = context.args[0]
     days = None
-    if len(context.args) > 1 and context.args[1].startswith("days="):
-        try:
-            days = int(context.args[1].split("=",1)[1])
-        except Exception:
-            days = None
+    compress = False
+    for a in context.args[1:]:
+        if a.startswith("days="):
+            try:
+                days = int(a.split("=",1)[1])
+            except Exception:
+                days = None
+        elif a.lower() in ("gzip", "gz"):
+            compress = True
     try:
-        filename, content = export_table_csv(table, days=days)
+        # Таблиця читається пачками у тимчасовий файл у потоці читання БД, цикл подій не блокується
+        filename, content, rows = await export_table_csv(table, days=days, compress=compress)
     except Exception as e:
         await update.message.reply_text(f"❌ Помилка: {e}")
         return
-    await update.message.reply_document(document=(filename, content), caption=f"Експорт {table}{' за ' + str(days) + ' дн.' if days else ''}")
+    try:
+        size = content.seek(0, 2)
+        content.seek(0)
+        if size > EXPORT_MAX_DOCUMENT_BYTES:
+            await update.message.reply_text(
+                f"❌ Файл завеликий для Telegram ({size / 1024 / 1024:.1f} МБ). "
+                f"Додайте gzip або обмежте період через days=N."
+            )
+            return
+        await update.message.reply_document(
+            document=content,
+            filename=filename,
+            caption=f"Експорт {table}{' за ' + str(days) + ' дн.' if days else ''}: {rows} рядків",
+        )
+    finally:
+        content.close()
 
 async def log_stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Адм-команда: сводные показатели.\n
@@ -1695,13 +1840,42 @@ async def log_stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
         if a.startswith("days="):
             try: days = max(1, int(a.split("=",1)[1]));
             except Exception: pass
-    stats = logs_stats(days=days)
+    stats = await logs_stats(days=days)
     parts = ["<b>Сводка</b>"]
     parts.append("\nДії по типам:")
     for k,v in stats.get("actions_by_type", []):
+        parts.append(f"• {html.escape(k)}: {v}")
+    parts.append(f"\nАнтиспам (всього): {stats.get('antispam_total', 0)}")
+    for k,v in stats.get("antispam_by_kind", []):
         parts.append(f"• {k}: {v}")
+    archives = await list_archives()
+    if archives:
+        archived = sum(a["rows"] for a in archives)
+        months = sorted({a["month"] for a in archives})
+        parts.append(f"\nАрхів журналів: {archived} рядків, {len(months)} міс. ({months[0]} — {months[-1]})")
     await update.message.reply_text("\n".join(parts), parse_mode="HTML")
 
+async def rollups_check_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Адм-команда: сверка сводок /log_stats с сырыми журналами.\n
+    Использование: /rollups_check [rebuild]
+    """
+    if update.effective_user.id not in ADMIN_IDS:
+        await update.message.reply_text("❌ Немає доступу.")
+        return
+    rebuild = "rebuild" in (context.args or [])
+    started = time.perf_counter()
+    # Звірка йде в потоці читання; перерахунок — у потоці запису, лише якщо є розбіжності
+    mismatches = await check_log_rollups()
+    if rebuild and any(mismatches.values()):
+        await rebuild_log_rollups()
+    elapsed = time.perf_counter() - started
+    lines = [f"• {table}: {count} розбіжностей" for table, count in mismatches.items()]
+    if any(mismatches.values()):
+        lines.append("Зведення перераховано." if rebuild else "Для перерахунку: /rollups_check rebuild")
+    else:
+        lines.append("Зведення узгоджені з журналами.")
+    await update.message.reply_text(f"Перевірка зведень ({elapsed:.1f} с):\n" + "\n".join(lines))
+
 async def broadcast_fill_profiles(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Команда для адмінів: попросити заповнити профілі (інструкція)."""
     if update.effective_user.id not in ADMIN_IDS:
@@ -1728,23 +1902,18 @@ async def open_admin_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         return
     
     logger.info(f"Opening admin menu for admin {user_id}")
-    kb = ReplyKeyboardMarkup([
-        ["📝 Оформити догану", "/admin_help"],
-        ["🔙 Звичайні команди"],
-    ], resize_keyboard=True)
-    await update.message.reply_text("🛡️ Адмін-меню відкрито.", reply_markup=kb)
+    await update.message.reply_text("🛡️ Адмін-меню відкрито.", reply_markup=ADMIN_MENU_KEYBOARD)
 
 async def open_user_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Повернутись до звичайного меню (у всіх користувачів)."""
     user_id = update.effective_user.id
     logger.info(f"open_user_menu called by user {user_id}")
     
-    kb_rows = [["📝 Заява на неактив"]]
     if user_id in ADMIN_IDS:
-        kb_rows.append(["🛡️ Адмін-команди"])
+        kb = USER_MENU_KEYBOARD_ADMIN
         logger.info(f"Added admin button for admin {user_id}")
-    
-    kb = ReplyKeyboardMarkup(kb_rows, resize_keyboard=True)
+    else:
+        kb = USER_MENU_KEYBOARD
     await update.message.reply_text("🔙 Повернувся до звичайного меню.", reply_markup=kb)
 
 def _format_profile(profile: dict) -> str:
@@ -1774,9 +1943,9 @@ async def user_lookup_command(update: Update, context: ContextTypes.DEFAULT_TYPE
     arg = context.args[0]
     profile = None
     if arg.isdigit():
-        profile = get_profile(int(arg))
+        profile = await get_profile(int(arg))
     else:
-        profile = get_profile_by_username(arg)
+        profile = await get_profile_by_username(arg)
     if not profile:
         await update.message.reply_text("Не знайдено профіль.")
         return
@@ -1794,7 +1963,7 @@ async def find_profiles_command(update: Update, context: ContextTypes.DEFAULT_TY
     if not q:
         await update.message.reply_text("Використання: /find <текст>")
         return
-    results = search_profiles(q, limit=10)
+    results = await search_profiles(q, limit=10)
     if not results:
         await update.message.reply_text("Нічого не знайдено.")
         return
@@ -1823,10 +1992,11 @@ async def handle_admin_user_action(update: Update, context: ContextTypes.DEFAULT
         chat_id = REPORTS_CHAT_ID
         try:
             await context.bot.ban_chat_member(chat_id=chat_id, user_id=target_id)
+            MEMBERSHIP_CACHE.invalidate((chat_id, target_id))
             await context.bot.unban_chat_member(chat_id=chat_id, user_id=target_id)
             await query.edit_message_text(f"🚫 Користувача {target_id} вигнано з групи.")
             try:
-                log_action(
+                await log_action(
                     actor_id=query.from_user.id,
                     actor_username=query.from_user.username,
                     action="kick_from_group",
@@ -1841,7 +2011,7 @@ async def handle_admin_user_action(update: Update, context: ContextTypes.DEFAULT
     elif data.startswith("admin_warn_"):
         target_id = int(data.split("_")[2])
         # Отримаємо профіль, щоб підставити Ім'я та, за наявності, звання
-        prof = get_profile(target_id)
+        prof = await get_profile(target_id)
         disp = None
         if prof:
             disp = display_ranked_name(prof.get('rank'), prof.get('in_game_name') or prof.get('full_name_tg') or '')
@@ -1854,7 +2024,7 @@ async def handle_admin_user_action(update: Update, context: ContextTypes.DEFAULT
                 parse_mode="HTML"
             )
             try:
-                log_action(
+                await log_action(
                     actor_id=query.from_user.id,
                     actor_username=query.from_user.username,
                     action="dogana_prefill_set",
@@ -1871,7 +2041,7 @@ async def handle_admin_user_action(update: Update, context: ContextTypes.DEFAULT
 async def me_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Показати збережений профіль користувача."""
     user = update.effective_user
-    profile = get_profile(user.id)
+    profile = await get_profile(user.id)
     if not profile:
         await update.message.reply_text("ℹ️ Профіль ще не збережено. Натисніть /start і спробуйте знову.")
         return
@@ -1889,39 +2059,93 @@ async def me_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Показати довідку по командам та діям бота."""
     is_admin = update.effective_user.id in ADMIN_IDS
-    text = (
-        "ℹ️ <b>Довідка</b>\n\n"
-        "<b>Основні команди</b>:\n"
-        "• /start — запустити бота та показати меню\n"
-        "• /help — ця довідка\n"
-        "• /me — показати ваш збережений профіль\n"
-    "• /neaktyv — подати <i>заяву на неактив</i> (також є кнопка в меню)\n"
-    "• /refill — <i>тимчасово</i>: перезаповнити ваш профіль для оновлень БД\n\n"
-        "<b>Заява на доступ у групу</b>:\n"
-        "1) Натисніть /start і дотримуйтесь інструкцій\n"
-        "2) Введіть <i>ім'я та прізвище українською</i> (повністю)\n"
-        "3) Оберіть <i>управління НПУ</i> і <i>своє звання</i> зі списку\n"
-    "4) Надішліть <i>2 посилання</i> на скріншоти (посвідчення і трудову книжку) з imgbb/imgur/postimg\n\n"
-        "<blockquote>Порада: надсилайте <b>прямі URL</b> зображень, кожне з нового рядка.</blockquote>\n\n"
-    )
-    if is_admin:
-        text += (
-            "<b>Адмінські команди</b>:\n"
-            "• /admin — коротка статистика заяв\n"
-            "• /dogana — оформлення догани\n"
-            "• /user &lt;id|@username&gt; — показати профіль користувача\n"
-            "• /find &lt;текст&gt; — пошук профілів (username/ім'я TG/ім'я у грі)\n"
-            "• /broadcast_fill — надіслати інструкцію для заповнення профілів\n\n"
-        )
-    text += (
-        "<b>Модерація заяв на неактив</b> (адміни):\n"
-        "• У приват повідомлення приходить карточка з кнопками <b>Одобрити/Відхилити</b>\n"
-        "• Після кліку бот попросить <i>ім'я та прізвище модератора</i> для підпису\n"
-        "• Результат публікується у групі з атрибуцією <i>Перевіряючий</i>\n\n"
-        "<b>Формат імені</b>: лише українські літери, повне ім'я та прізвище.\n"
-    )
+    text = HELP_TEXT_ADMIN if is_admin else HELP_TEXT
     await update.message.reply_text(text, parse_mode="HTML", disable_web_page_preview=True)
 
+async def state_flush_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Пакетно записує в БД змінений стан заявок і анкет."""
+    try:
+        await STATE.flush_async()
+    except Exception as e:
+        logger.error(f"State flush failed: {e}")
+
+async def antispam_flush_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Записує накопичені події антиспаму однією пачкою в потоці-писачі."""
+    try:
+        await ANTISPAM.flush_async()
+    except Exception as e:
+        logger.error(f"Antispam flush failed: {e}")
+
+async def state_sweep_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Прибирає покинуті анкети і заяви, яких ніхто не розглянув за відведений час."""
+    removed = STATE.sweep()
+    if removed:
+        logger.info(f"State sweep: прибрано {removed} прострочених записів")
+
+async def invite_pool_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Відкликає прострочені посилання пулу і поповнює його нижче порогу."""
+    if INVITE_POOL:
+        await INVITE_POOL.maintain(context.bot)
+
+async def db_checkpoint_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Періодичний пасивний checkpoint WAL, щоб журнал не розростався."""
+    try:
+        result = await db_async.checkpoint_db("PASSIVE")
+        if result:
+            logger.debug("WAL checkpoint: busy=%s log=%s checkpointed=%s", *result)
+    except Exception as e:
+        logger.warning(f"WAL checkpoint failed: {e}")
+
+async def log_archive_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Переносить журнали, старші за LOG_RETENTION_DAYS, у помісячний архів.
+
+    Кожна порція — окремий виклик у потоці запису, тож інші записи встигають
+    виконуватися між порціями і не чекають на все архівування.
+    """
+    moved = 0
+    started = time.perf_counter()
+    try:
+        for _ in range(LOG_ARCHIVE_MAX_BATCHES):
+            batch = await db_async.archive_logs_batch()
+            if not batch:
+                break
+            moved += batch
+    except Exception as e:
+        logger.warning(f"Log archiving failed: {e}")
+    if moved:
+        logger.info(f"Архів журналів: перенесено {moved} рядків за {time.perf_counter() - started:.1f} с")
+
+async def db_optimize_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Періодичний PRAGMA optimize для актуальної статистики планувальника."""
+    try:
+        await db_async.optimize_db()
+    except Exception as e:
+        logger.warning(f"PRAGMA optimize failed: {e}")
+
+async def on_startup(application: Application) -> None:
+    """Відновлюємо стан користувачів до обробки першого апдейта, не блокуючи цикл подій."""
+    started = time.perf_counter()
+    restored = await STATE.load_async()
+    logger.info(f"Стан відновлено: {restored} записів за {(time.perf_counter() - started) * 1000:.1f} мс")
+
+async def on_shutdown(application: Application) -> None:
+    """Звільняємо ресурси при зупинці бота."""
+    # Спершу дочекаємося черги записів і скинемо буфер журналів, потім закриваємо з'єднання
+    db_async.shutdown(wait=True)
+    try:
+        STATE.flush()
+    except Exception as e:
+        logger.error(f"State flush on shutdown failed: {e}")
+    try:
+        ANTISPAM.flush()
+    except Exception as e:
+        logger.error(f"Antispam flush on shutdown failed: {e}")
+    stop_audit_writer()
+    close_db()
+    logger.info("Database connections closed")
+    # Останнім: дописати чергу логів
+    stop_logging()
+
 def main() -> None:
     """Запуск бота"""
     try:
@@ -1936,12 +2160,21 @@ def main() -> None:
         
         # Створюємо додаток
         logger.info("Creating Telegram application...")
-        application = Application.builder().token(BOT_TOKEN).build()
+        application = (
+            Application.builder()
+            .token(BOT_TOKEN)
+            .rate_limiter(OUTBOUND_LIMITER)
+            .concurrent_updates(UPDATE_PROCESSOR)
+            .post_init(on_startup)
+            .post_shutdown(on_shutdown)
+            .build()
+        )
         logger.info("Application created successfully")
         
         # Ініціалізуємо БД
         logger.info("Initializing database...")
         init_db()
+        start_audit_writer()
         logger.info("Database initialized successfully")
     
     except Exception as e:
@@ -1951,6 +2184,10 @@ def main() -> None:
         raise
 
     # Додаємо обробники
+    # Антиспам виконується раніше за всі обробники і зупиняє обробку апдейта при перевищенні ліміту
+    application.add_handler(MessageHandler(filters.ChatType.PRIVATE, ANTISPAM.on_message), group=-1)
+    application.add_handler(CallbackQueryHandler(ANTISPAM.on_callback), group=-1)
+
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("me", me_command))
     application.add_handler(CommandHandler("help", help_command))
@@ -1967,6 +2204,9 @@ def main() -> None:
     # Адмінські кнопки з /find
     application.add_handler(CallbackQueryHandler(handle_admin_user_action, pattern=r"^admin_(kick|warn)_\d+$"))
 
+    # Зміни членства в робочому чаті оновлюють кеш перевірок членства
+    application.add_handler(ChatMemberHandler(track_chat_member, ChatMemberHandler.CHAT_MEMBER))
+
     # Діалоги: Догани (адміністраторам)
     dogana_conv = ConversationHandler(
         entry_points=[CommandHandler("dogana", dogana_start), MessageHandler(filters.Regex("^📝 Оформити догану$"), dogana_start)],
@@ -2051,8 +2291,8 @@ def main() -> None:
                 update_json = None
             import traceback as tb
             stack = "".join(tb.format_exception_only(type(err), err)) if err else None
-            log_error(err_type, message, stack, update_json, None)
-            log_action(
+            await log_error(err_type, message, stack, update_json, None)
+            await log_action(
                 actor_id=None,
                 actor_username=None,
                 action="error",
@@ -2063,13 +2303,49 @@ def main() -> None:
         except Exception:
             pass
     application.add_handler(CommandHandler("logs", logs_command))
+    application.add_handler(CallbackQueryHandler(logs_page_callback, pattern=r"^logs:"))
     application.add_handler(CommandHandler("export_csv", export_csv_command))
     application.add_handler(CommandHandler("log_stats", log_stats_command))
+    application.add_handler(CommandHandler("rollups_check", rollups_check_command))
     
     application.add_error_handler(error_handler)
+
+    # Фонові задачі обслуговування БД
+    if application.job_queue:
+        application.job_queue.run_repeating(db_checkpoint_job, interval=DB_CHECKPOINT_INTERVAL, first=DB_CHECKPOINT_INTERVAL)
+        application.job_queue.run_repeating(db_optimize_job, interval=DB_OPTIMIZE_INTERVAL, first=60)
+        if LOG_RETENTION_DAYS:
+            application.job_queue.run_repeating(log_archive_job, interval=LOG_ARCHIVE_INTERVAL, first=120)
+        application.job_queue.run_repeating(state_flush_job, interval=STATE_FLUSH_INTERVAL, first=STATE_FLUSH_INTERVAL)
+        application.job_queue.run_repeating(state_sweep_job, interval=STATE_SWEEP_INTERVAL, first=STATE_SWEEP_INTERVAL)
+        application.job_queue.run_repeating(antispam_flush_job, interval=ANTISPAM_FLUSH_INTERVAL, first=ANTISPAM_FLUSH_INTERVAL)
+        if INVITE_POOL:
+            application.job_queue.run_repeating(invite_pool_job, interval=INVITE_POOL_CHECK_INTERVAL, first=5)
+    else:
+        logger.warning(
+            "JobQueue недоступна (встановіть python-telegram-bot[job-queue]) — обслуговування БД вимкнено, "
+            "стан заявок зберігатиметься лише при зупинці"
+        )
     
     logger.info("All handlers added successfully. Starting polling...")
     
+    if BOT_MODE == "webhook":
+        import asyncio
+        from webhook import serve, default_secret
+
+        logger.info("Starting bot in webhook mode...")
+        asyncio.run(serve(
+            application,
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            path=WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET or default_secret(BOT_TOKEN),
+            url=WEBHOOK_URL,
+            max_queue=WEBHOOK_MAX_QUEUE,
+            allowed_updates=Update.ALL_TYPES,
+        ))
+        return
+
     # Запускаємо з обробкою конфліктів
     try:
         logger.info("Starting bot polling...")
@@ -0,0 +1,53 @@
+"""Паралельна розсилка одного повідомлення кільком отримувачам (адмінам).
+
+Кожне відправлення має власний тайм-аут, одночасно виконується не більше
+concurrency запитів, а помилка чи повільний чат одного отримувача не
+затримує інших. Результат — список DeliveryResult у порядку chat_ids.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Iterable, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class DeliveryResult(NamedTuple):
+    chat_id: int
+    ok: bool
+    message_id: Optional[int]
+    error: Optional[str]
+    elapsed: float
+
+
+async def broadcast(
+    send: Callable[[int], Awaitable[Any]],
+    chat_ids: Iterable[int],
+    *,
+    concurrency: int = 10,
+    timeout: float = 10.0,
+) -> list[DeliveryResult]:
+    """Викликає send(chat_id) для кожного отримувача.
+
+    send має повертати надіслане повідомлення (об'єкт з message_id) —
+    наприклад, lambda chat_id: bot.send_message(chat_id=chat_id, text=...).
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def deliver(chat_id: int) -> DeliveryResult:
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                message = await asyncio.wait_for(send(chat_id), timeout)
+                return DeliveryResult(
+                    chat_id, True, getattr(message, "message_id", None), None, time.perf_counter() - started
+                )
+            except asyncio.TimeoutError:
+                error = f"timeout after {timeout:g}s"
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+            logger.error(f"Не вдалося відправити повідомлення {chat_id}: {error}")
+            return DeliveryResult(chat_id, False, None, error, time.perf_counter() - started)
+
+    return list(await asyncio.gather(*(deliver(chat_id) for chat_id in chat_ids)))
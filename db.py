@@ -1,10 +1,21 @@
+import atexit
+import calendar
+import json
+import logging
 import os
 import sqlite3
 import csv
+import gzip
 import io
-import traceback
+import queue
+import re
+import tempfile
+import threading
+import time
 from contextlib import contextmanager
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, BinaryIO, Callable, NamedTuple
+
+from cache import TTLCache
 
 # Разрешаем переопределять путь к БД через переменные окружения
 _DEFAULT_DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
@@ -17,285 +28,872 @@ else:
     data_dir = _ENV_DB_DIR or _DEFAULT_DATA_DIR
     DB_PATH = os.path.join(data_dir, "bot.db")
 
+logger = logging.getLogger(__name__)
+
+# Настройки пула соединений. Пулом одновременно пользуются читатели db_async
+# (DB_READ_WORKERS потоков), поток-писатель и поток журналов, поэтому по
+# умолчанию соединений на два больше, чем читателей: иначе под нагрузкой
+# вызовы ждут свободного соединения до DB_POOL_TIMEOUT.
+DB_READ_WORKERS = max(1, int(os.getenv("DB_READ_WORKERS") or 4))
+DB_POOL_SIZE = max(1, int(os.getenv("DB_POOL_SIZE") or DB_READ_WORKERS + 2))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Соединение, пролежавшее в пуле дольше этого времени, проверяется через SELECT 1
+DB_POOL_PING_AFTER = float(os.getenv("DB_POOL_PING_AFTER", "60"))
+
+
+def _env_choice(name: str, default: str, allowed: set[str]) -> str:
+    value = (os.getenv(name) or default).strip().upper()
+    if value not in allowed:
+        raise ValueError(f"{name}={value!r}: допустимые значения {sorted(allowed)}")
+    return value
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value not in (None, "") else default
+
+
+# Параметры хранилища (PRAGMA), задаются через переменные окружения
+DB_JOURNAL_MODE = _env_choice("DB_JOURNAL_MODE", "WAL", {"WAL", "DELETE", "TRUNCATE", "PERSIST", "MEMORY"})
+DB_SYNCHRONOUS = _env_choice("DB_SYNCHRONOUS", "NORMAL", {"OFF", "NORMAL", "FULL", "EXTRA"})
+DB_TEMP_STORE = _env_choice("DB_TEMP_STORE", "MEMORY", {"DEFAULT", "FILE", "MEMORY"})
+DB_CACHE_SIZE = _env_int("DB_CACHE_SIZE", -16000)        # отрицательное значение — размер в КиБ
+DB_MMAP_SIZE = _env_int("DB_MMAP_SIZE", 64 * 1024 * 1024)
+DB_BUSY_TIMEOUT_MS = _env_int("DB_BUSY_TIMEOUT_MS", 5000)
+
 
 def _ensure_dir():
     os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
 
 
+def _apply_pragmas(conn: sqlite3.Connection):
+    """Настройки уровня соединения. journal_mode хранится в самом файле БД,
+    поэтому переключается один раз в configure_storage()."""
+    conn.execute("PRAGMA foreign_keys = ON;")
+    conn.execute(f"PRAGMA synchronous = {DB_SYNCHRONOUS};")
+    conn.execute(f"PRAGMA cache_size = {int(DB_CACHE_SIZE)};")
+    conn.execute(f"PRAGMA mmap_size = {int(DB_MMAP_SIZE)};")
+    conn.execute(f"PRAGMA temp_store = {DB_TEMP_STORE};")
+    conn.execute(f"PRAGMA busy_timeout = {int(DB_BUSY_TIMEOUT_MS)};")
+
+
+class _ConnectionPool:
+    """Пул долгоживущих соединений SQLite.
+
+    Соединения создаются лениво (не больше size штук), возвращаются в пул
+    после использования и переиспользуются в порядке LIFO, чтобы «горячее»
+    соединение с прогретым кэшем страниц доставалось первым.
+    """
+
+    def __init__(self, path: str, size: int, timeout: float, ping_after: float):
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self.ping_after = ping_after
+        self._idle: queue.LifoQueue = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._closed = False
+        self._dir_ready = False
+
+    def _connect(self) -> sqlite3.Connection:
+        if not self._dir_ready:
+            _ensure_dir()
+            self._dir_ready = True
+        conn = sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False)
+        _apply_pragmas(conn)
+        return conn
+
+    def acquire(self) -> sqlite3.Connection:
+        if self._closed:
+            raise RuntimeError("Пул соединений БД уже закрыт")
+        try:
+            conn, idle_since = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_create = self._created < self.size
+                if can_create:
+                    self._created += 1
+            if can_create:
+                try:
+                    return self._connect()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            try:
+                conn, idle_since = self._idle.get(timeout=self.timeout)
+            except queue.Empty:
+                raise RuntimeError("Не дочекалися вільного з'єднання з БД") from None
+        if time.monotonic() - idle_since > self.ping_after and not self._healthy(conn):
+            self._discard(conn)
+            return self.acquire()
+        return conn
+
+    def release(self, conn: sqlite3.Connection, broken: bool = False):
+        if broken or self._closed:
+            self._discard(conn)
+            return
+        self._idle.put((conn, time.monotonic()))
+
+    @staticmethod
+    def _healthy(conn: sqlite3.Connection) -> bool:
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _discard(self, conn: sqlite3.Connection):
+        with self._lock:
+            self._created -= 1
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    def close(self):
+        """Закрывает все свободные соединения; занятые закроются при возврате."""
+        self._closed = True
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+
+    def stats(self) -> dict[str, int]:
+        return {"size": self.size, "open": self._created, "idle": self._idle.qsize()}
+
+
+_pool: Optional[_ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> _ConnectionPool:
+    global _pool
+    pool = _pool
+    if pool is None or pool._closed:
+        with _pool_lock:
+            if _pool is None or _pool._closed:
+                _pool = _ConnectionPool(DB_PATH, DB_POOL_SIZE, DB_POOL_TIMEOUT, DB_POOL_PING_AFTER)
+            pool = _pool
+    return pool
+
+
 @contextmanager
 def get_conn():
-    _ensure_dir()
-    conn = sqlite3.connect(DB_PATH)
+    pool = _get_pool()
+    conn = pool.acquire()
+    broken = False
     try:
-        conn.execute("PRAGMA foreign_keys = ON;")
         yield conn
         conn.commit()
-    finally:
-        conn.close()
-
-def migrate_db():
-    """Выполняем миграции базы данных"""
-    with get_conn() as conn:
-        # Проверяем, существует ли колонка file_id в profile_images
-        cursor = conn.execute("PRAGMA table_info(profile_images)")
-        columns = [row[1] for row in cursor.fetchall()]
-        
-        if 'file_id' not in columns and 'url' in columns:
-            print("Migrating profile_images table from url to file_id...")
-            
-            # Создаем новую таблицу с правильной структурой
-            conn.execute(
-                """
-                CREATE TABLE IF NOT EXISTS profile_images_new (
-                    id           INTEGER PRIMARY KEY AUTOINCREMENT,
-                    telegram_id  INTEGER NOT NULL,
-                    file_id      TEXT NOT NULL,
-                    created_at   TEXT DEFAULT (datetime('now')),
-                    FOREIGN KEY(telegram_id) REFERENCES profiles(telegram_id) ON DELETE CASCADE
-                );
-                """
-            )
-            
-            # Копируем данные, используя URL как временный file_id
-            conn.execute(
-                """
-                INSERT INTO profile_images_new (telegram_id, file_id, created_at)
-                SELECT telegram_id, url, created_at FROM profile_images
-                WHERE url IS NOT NULL
-                """
-            )
-            
-            # Удаляем старую таблицу и переименовываем новую
-            conn.execute("DROP TABLE profile_images")
-            conn.execute("ALTER TABLE profile_images_new RENAME TO profile_images")
-            
-            print("Migration completed: profile_images.url -> profile_images.file_id")
-        
-        # Проверяем промошн таблицу
+    except BaseException:
+        # Незавершённая транзакция не должна «утечь» к следующему пользователю соединения
         try:
-            cursor = conn.execute("PRAGMA table_info(promotion_requests)")
-            columns = [row[1] for row in cursor.fetchall()]
-            
-            if not columns:
-                print("promotion_requests table does not exist, skipping migration")
-            elif 'workbook_image_id' not in columns:
-                print("Migrating promotion_requests table...")
-                
-                # Добавляем новые колонки
-                try:
-                    conn.execute("ALTER TABLE promotion_requests ADD COLUMN workbook_image_id TEXT")
-                    print("Added workbook_image_id column")
-                except sqlite3.OperationalError as e:
-                    if "duplicate column name" not in str(e):
-                        print(f"Error adding workbook_image_id: {e}")
-                
-                try:
-                    conn.execute("ALTER TABLE promotion_requests ADD COLUMN evidence_image_id TEXT")
-                    print("Added evidence_image_id column")
-                except sqlite3.OperationalError as e:
-                    if "duplicate column name" not in str(e):
-                        print(f"Error adding evidence_image_id: {e}")
-                    
-                # Копируем данные из старых колонок только если они существуют
-                if 'workbook_image' in columns:
-                    try:
-                        conn.execute(
-                            """
-                            UPDATE promotion_requests 
-                            SET workbook_image_id = workbook_image
-                            WHERE workbook_image IS NOT NULL
-                            """
-                        )
-                        print("Copied workbook_image data to workbook_image_id")
-                    except sqlite3.OperationalError as e:
-                        print(f"Error copying workbook_image data: {e}")
-                
-                if 'evidence_image' in columns:
-                    try:
-                        conn.execute(
-                            """
-                            UPDATE promotion_requests 
-                            SET evidence_image_id = evidence_image
-                            WHERE evidence_image IS NOT NULL
-                            """
-                        )
-                        print("Copied evidence_image data to evidence_image_id")
-                    except sqlite3.OperationalError as e:
-                        print(f"Error copying evidence_image data: {e}")
-                    
-                print("Migration completed: promotion_requests migration finished")
-        except sqlite3.OperationalError as e:
-            print(f"Error during promotion_requests migration: {e}")
+            conn.rollback()
+        except sqlite3.Error:
+            broken = True
+        raise
+    finally:
+        pool.release(conn, broken=broken)
 
 
-def init_db():
-    # Сначала выполняем миграции
-    migrate_db()
-    
+def close_db():
+    """Закрывает пул соединений (вызывается при остановке бота)."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+
+def db_pool_stats() -> dict[str, int]:
+    return _get_pool().stats()
+
+
+def configure_storage() -> str:
+    """Переключает режим журнала (по умолчанию WAL). Возвращает фактический режим."""
+    with get_conn() as conn:
+        mode = conn.execute(f"PRAGMA journal_mode = {DB_JOURNAL_MODE};").fetchone()[0]
+    return str(mode).upper()
+
+
+def checkpoint_db(mode: str = "PASSIVE") -> tuple[int, int, int] | None:
+    """Контрольная точка WAL. PASSIVE не ждёт читателей и писателей.
+    Возвращает (busy, log_frames, checkpointed_frames) или None вне режима WAL."""
+    mode = mode.upper()
+    if mode not in {"PASSIVE", "FULL", "RESTART", "TRUNCATE"}:
+        raise ValueError(f"Недопустимый режим checkpoint: {mode}")
+    if DB_JOURNAL_MODE != "WAL":
+        return None
+    with get_conn() as conn:
+        row = conn.execute(f"PRAGMA wal_checkpoint({mode});").fetchone()
+    return int(row[0]), int(row[1]), int(row[2])
+
+
+def optimize_db():
+    """PRAGMA optimize — обновляет статистику планировщика там, где это нужно."""
+    with get_conn() as conn:
+        conn.execute("PRAGMA optimize;")
+
+# ===== Миграции схемы =====
+# Каждая миграция выполняется ровно один раз в своей транзакции; номер последней
+# применённой хранится в PRAGMA user_version. Если схема актуальна, init_db()
+# ограничивается чтением user_version. Тяжёлые перестройки таблиц выносятся в
+# prepare-шаг, который копирует данные порциями по MIGRATION_CHUNK_ROWS строк
+# в отдельных коротких транзакциях и не держит блокировку БД секундами.
+MIGRATION_CHUNK_ROWS = max(1, _env_int("MIGRATION_CHUNK_ROWS", 5000))
+
+
+class _Migration(NamedTuple):
+    version: int
+    name: str
+    apply: Callable[[sqlite3.Connection], None]
+    prepare: Optional[Callable[[], None]]
+
+
+_MIGRATIONS: list[_Migration] = []
+
+
+def _migration(version: int, name: str, prepare: Optional[Callable[[], None]] = None):
+    def decorator(fn: Callable[[sqlite3.Connection], None]):
+        if _MIGRATIONS and version <= _MIGRATIONS[-1].version:
+            raise ValueError(f"Миграции должны идти по возрастанию версий: {version}")
+        _MIGRATIONS.append(_Migration(version, name, fn, prepare))
+        return fn
+    return decorator
+
+
+def _columns(conn: sqlite3.Connection, table: str) -> list[str]:
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})").fetchall()]
+
+
+def _copy_in_chunks(src_sql: str, dst_sql: str, last_id_sql: str):
+    """Переносит строки порциями по id. src_sql принимает (last_id, limit) и
+    возвращает строки, у которых первый столбец — id. Продолжает с места,
+    на котором остановился прошлый запуск."""
+    with get_conn() as conn:
+        last_id = conn.execute(last_id_sql).fetchone()[0] or 0
+    while True:
+        with get_conn() as conn:
+            rows = conn.execute(src_sql, (last_id, MIGRATION_CHUNK_ROWS)).fetchall()
+            if not rows:
+                return
+            conn.executemany(dst_sql, rows)
+        last_id = rows[-1][0]
+
+
+_PROFILE_IMAGES_NEW_DDL = """
+    CREATE TABLE IF NOT EXISTS profile_images_new (
+        id           INTEGER PRIMARY KEY AUTOINCREMENT,
+        telegram_id  INTEGER NOT NULL,
+        file_id      TEXT NOT NULL,
+        created_at   TEXT DEFAULT (datetime('now')),
+        FOREIGN KEY(telegram_id) REFERENCES profiles(telegram_id) ON DELETE CASCADE
+    )
+"""
+_PROFILE_IMAGES_COPY_SRC = """
+    SELECT id, telegram_id, url, created_at FROM profile_images
+    WHERE id > ? AND url IS NOT NULL ORDER BY id LIMIT ?
+"""
+_PROFILE_IMAGES_COPY_DST = "INSERT INTO profile_images_new (id, telegram_id, file_id, created_at) VALUES (?, ?, ?, ?)"
+
+
+def _prepare_profile_images_file_id():
+    """Порционное копирование profile_images.url -> profile_images_new.file_id."""
     with get_conn() as conn:
+        columns = _columns(conn, "profile_images")
+        if "file_id" in columns or "url" not in columns:
+            return
+        logger.info("Migrating profile_images table from url to file_id...")
+        conn.execute(_PROFILE_IMAGES_NEW_DDL)
+    _copy_in_chunks(
+        _PROFILE_IMAGES_COPY_SRC,
+        _PROFILE_IMAGES_COPY_DST,
+        "SELECT max(id) FROM profile_images_new",
+    )
+
+
+def _legacy_profile_images_swap(conn: sqlite3.Connection):
+    columns = _columns(conn, "profile_images")
+    if "file_id" in columns or "url" not in columns:
+        return
+    conn.execute(_PROFILE_IMAGES_NEW_DDL)
+    # Досинхронизируем строки, появившиеся после порционного копирования
+    last_id = conn.execute("SELECT max(id) FROM profile_images_new").fetchone()[0] or 0
+    conn.execute(
+        "INSERT INTO profile_images_new (id, telegram_id, file_id, created_at) "
+        "SELECT id, telegram_id, url, created_at FROM profile_images WHERE id > ? AND url IS NOT NULL",
+        (last_id,),
+    )
+    conn.execute("DROP TABLE profile_images")
+    conn.execute("ALTER TABLE profile_images_new RENAME TO profile_images")
+    logger.info("Migration completed: profile_images.url -> profile_images.file_id")
+
+
+def _legacy_promotion_columns(conn: sqlite3.Connection):
+    columns = _columns(conn, "promotion_requests")
+    if not columns or "workbook_image_id" in columns:
+        return
+    logger.info("Migrating promotion_requests table...")
+    conn.execute("ALTER TABLE promotion_requests ADD COLUMN workbook_image_id TEXT")
+    if "evidence_image_id" not in columns:
+        conn.execute("ALTER TABLE promotion_requests ADD COLUMN evidence_image_id TEXT")
+    # Копируем данные из старых колонок только если они существуют
+    if "workbook_image" in columns:
         conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS profiles (
-                telegram_id     INTEGER PRIMARY KEY,
-                username        TEXT,
-                full_name_tg    TEXT,
-                in_game_name    TEXT,
-                rank            TEXT,
-                npu_department  TEXT,
-                role            TEXT CHECK(role IN ('user','admin')) DEFAULT 'user',
-                created_at      TEXT DEFAULT (datetime('now')),
-                updated_at      TEXT DEFAULT (datetime('now'))
-            );
-            """
+            "UPDATE promotion_requests SET workbook_image_id = workbook_image WHERE workbook_image IS NOT NULL"
         )
+    if "evidence_image" in columns:
         conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS profile_images (
-                id           INTEGER PRIMARY KEY AUTOINCREMENT,
-                telegram_id  INTEGER NOT NULL,
-                file_id      TEXT NOT NULL,
-                created_at   TEXT DEFAULT (datetime('now')),
-                FOREIGN KEY(telegram_id) REFERENCES profiles(telegram_id) ON DELETE CASCADE
-            );
-            """
+            "UPDATE promotion_requests SET evidence_image_id = evidence_image WHERE evidence_image IS NOT NULL"
         )
-        # Журнал доган (попереджень)
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS warnings (
-                id                    INTEGER PRIMARY KEY AUTOINCREMENT,
-                offense               TEXT,
-                date_text             TEXT,
-                to_whom               TEXT,
-                rank_to               TEXT,
-                by_whom               TEXT,
-                kind                  TEXT, -- 'Догана' або 'Попередження'
-                issued_by_user_id     INTEGER,
-                issued_by_username    TEXT,
-                created_at            TEXT DEFAULT (datetime('now')),
-                revoked_at            TEXT,
-                revoked_by_user_id    INTEGER,
-                revoked_by_name       TEXT,
-                revoke_reason         TEXT
-            );
-            """
+
+
+_BASE_SCHEMA = [
+    """
+        CREATE TABLE IF NOT EXISTS profiles (
+            telegram_id     INTEGER PRIMARY KEY,
+            username        TEXT,
+            full_name_tg    TEXT,
+            in_game_name    TEXT,
+            rank            TEXT,
+            npu_department  TEXT,
+            role            TEXT CHECK(role IN ('user','admin')) DEFAULT 'user',
+            created_at      TEXT DEFAULT (datetime('now')),
+            updated_at      TEXT DEFAULT (datetime('now'))
         )
-        # Журнал заяв на неактив
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS neaktyv_requests (
-                id                  INTEGER PRIMARY KEY AUTOINCREMENT,
-                requester_id        INTEGER NOT NULL,
-                requester_username  TEXT,
-                to_whom             TEXT,
-                rank                TEXT,
-                duration            TEXT,
-                department          TEXT,
-                status              TEXT CHECK(status IN ('pending','approved','rejected')) DEFAULT 'pending',
-                moderator_name      TEXT,
-                moderator_user_id   INTEGER,
-                decided_at          TEXT,
-                created_at          TEXT DEFAULT (datetime('now'))
-            );
-            """
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS profile_images (
+            id           INTEGER PRIMARY KEY AUTOINCREMENT,
+            telegram_id  INTEGER NOT NULL,
+            file_id      TEXT NOT NULL,
+            created_at   TEXT DEFAULT (datetime('now')),
+            FOREIGN KEY(telegram_id) REFERENCES profiles(telegram_id) ON DELETE CASCADE
         )
-        # Журнал заяв на доступ у групу та рішень по ним
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS access_applications (
-                id                    INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id               INTEGER NOT NULL,
-                username              TEXT,
-                in_game_name          TEXT,
-                npu_department        TEXT,
-                rank                  TEXT,
-                images                TEXT,
-                created_at            TEXT DEFAULT (datetime('now')),
-                decision              TEXT CHECK(decision IN ('pending','approved','rejected')) DEFAULT 'pending',
-                decided_at            TEXT,
-                decided_by_admin_id   INTEGER,
-                decided_by_username   TEXT,
-                invite_link           TEXT
-            );
-            """
+    """,
+    # Журнал доган (попереджень)
+    """
+        CREATE TABLE IF NOT EXISTS warnings (
+            id                    INTEGER PRIMARY KEY AUTOINCREMENT,
+            offense               TEXT,
+            date_text             TEXT,
+            to_whom               TEXT,
+            rank_to               TEXT,
+            by_whom               TEXT,
+            kind                  TEXT, -- 'Догана' або 'Попередження'
+            issued_by_user_id     INTEGER,
+            issued_by_username    TEXT,
+            created_at            TEXT DEFAULT (datetime('now')),
+            revoked_at            TEXT,
+            revoked_by_user_id    INTEGER,
+            revoked_by_name       TEXT,
+            revoke_reason         TEXT
         )
-        # Загальний журнал дій адміністраторів
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS action_logs (
-                id               INTEGER PRIMARY KEY AUTOINCREMENT,
-                actor_id         INTEGER,
-                actor_username   TEXT,
-                action           TEXT,
-                target_user_id   INTEGER,
-                target_username  TEXT,
-                details          TEXT,
-                created_at       TEXT DEFAULT (datetime('now'))
-            );
-            """
+    """,
+    # Журнал заяв на неактив
+    """
+        CREATE TABLE IF NOT EXISTS neaktyv_requests (
+            id                  INTEGER PRIMARY KEY AUTOINCREMENT,
+            requester_id        INTEGER NOT NULL,
+            requester_username  TEXT,
+            to_whom             TEXT,
+            rank                TEXT,
+            duration            TEXT,
+            department          TEXT,
+            status              TEXT CHECK(status IN ('pending','approved','rejected')) DEFAULT 'pending',
+            moderator_name      TEXT,
+            moderator_user_id   INTEGER,
+            decided_at          TEXT,
+            created_at          TEXT DEFAULT (datetime('now'))
         )
-        # Журнал оновлень профілю (через /refill або інші дії)
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS profile_updates (
-                id             INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id        INTEGER NOT NULL,
-                fields         TEXT, -- JSON/текст із переліком оновлених полів
-                images_count   INTEGER,
-                source         TEXT, -- 'refill' | 'apply' | ...
-                created_at     TEXT DEFAULT (datetime('now'))
-            );
-            """
+    """,
+    # Журнал заяв на доступ у групу та рішень по ним
+    """
+        CREATE TABLE IF NOT EXISTS access_applications (
+            id                    INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id               INTEGER NOT NULL,
+            username              TEXT,
+            in_game_name          TEXT,
+            npu_department        TEXT,
+            rank                  TEXT,
+            images                TEXT,
+            created_at            TEXT DEFAULT (datetime('now')),
+            decision              TEXT CHECK(decision IN ('pending','approved','rejected')) DEFAULT 'pending',
+            decided_at            TEXT,
+            decided_by_admin_id   INTEGER,
+            decided_by_username   TEXT,
+            invite_link           TEXT
         )
-        # Події антиспаму
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS antispam_events (
-                id           INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id      INTEGER NOT NULL,
-                kind         TEXT CHECK(kind IN ('message','callback')),
-                retry_after  REAL,
-                created_at   TEXT DEFAULT (datetime('now'))
-            );
-            """
+    """,
+    # Загальний журнал дій адміністраторів
+    """
+        CREATE TABLE IF NOT EXISTS action_logs (
+            id               INTEGER PRIMARY KEY AUTOINCREMENT,
+            actor_id         INTEGER,
+            actor_username   TEXT,
+            action           TEXT,
+            target_user_id   INTEGER,
+            target_username  TEXT,
+            details          TEXT,
+            created_at       TEXT DEFAULT (datetime('now'))
         )
-        # Логи ошибок
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS error_logs (
-                id           INTEGER PRIMARY KEY AUTOINCREMENT,
-                error_type   TEXT,
-                message      TEXT,
-                stack        TEXT,
-                update_json  TEXT,
-                context_info TEXT,
-                created_at   TEXT DEFAULT (datetime('now'))
-            );
-            """
+    """,
+    # Журнал оновлень профілю (через /refill або інші дії)
+    """
+        CREATE TABLE IF NOT EXISTS profile_updates (
+            id             INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id        INTEGER NOT NULL,
+            fields         TEXT, -- JSON/текст із переліком оновлених полів
+            images_count   INTEGER,
+            source         TEXT, -- 'refill' | 'apply' | ...
+            created_at     TEXT DEFAULT (datetime('now'))
         )
-        # Заявки на повышение
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS promotion_requests (
-                id                    INTEGER PRIMARY KEY AUTOINCREMENT,
-                requester_id          INTEGER NOT NULL,
-                requester_username    TEXT,
-                requester_name        TEXT,
-                current_rank          TEXT NOT NULL,
-                target_rank           TEXT NOT NULL,
-                workbook_image_id     TEXT NOT NULL,
-                work_evidence_image_id TEXT NOT NULL,
-                status                TEXT CHECK(status IN ('pending','approved','rejected')) DEFAULT 'pending',
-                moderator_id          INTEGER,
-                moderator_username    TEXT,
-                moderator_rank        TEXT,
-                reject_reason         TEXT,
-                decided_at            TEXT,
-                created_at            TEXT DEFAULT (datetime('now')),
-                FOREIGN KEY(requester_id) REFERENCES profiles(telegram_id) ON DELETE CASCADE
-            );
-            """
+    """,
+    # Події антиспаму
+    """
+        CREATE TABLE IF NOT EXISTS antispam_events (
+            id           INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id      INTEGER NOT NULL,
+            kind         TEXT CHECK(kind IN ('message','callback')),
+            retry_after  REAL,
+            created_at   TEXT DEFAULT (datetime('now'))
+        )
+    """,
+    # Логи ошибок
+    """
+        CREATE TABLE IF NOT EXISTS error_logs (
+            id           INTEGER PRIMARY KEY AUTOINCREMENT,
+            error_type   TEXT,
+            message      TEXT,
+            stack        TEXT,
+            update_json  TEXT,
+            context_info TEXT,
+            created_at   TEXT DEFAULT (datetime('now'))
+        )
+    """,
+    # Заявки на повышение
+    """
+        CREATE TABLE IF NOT EXISTS promotion_requests (
+            id                    INTEGER PRIMARY KEY AUTOINCREMENT,
+            requester_id          INTEGER NOT NULL,
+            requester_username    TEXT,
+            requester_name        TEXT,
+            current_rank          TEXT NOT NULL,
+            target_rank           TEXT NOT NULL,
+            workbook_image_id     TEXT NOT NULL,
+            work_evidence_image_id TEXT NOT NULL,
+            status                TEXT CHECK(status IN ('pending','approved','rejected')) DEFAULT 'pending',
+            moderator_id          INTEGER,
+            moderator_username    TEXT,
+            moderator_rank        TEXT,
+            reject_reason         TEXT,
+            decided_at            TEXT,
+            created_at            TEXT DEFAULT (datetime('now')),
+            FOREIGN KEY(requester_id) REFERENCES profiles(telegram_id) ON DELETE CASCADE
+        )
+    """,
+]
+
+
+# Вторичные индексы под фильтры и сортировки запросов этого модуля
+_INDEXES_V1 = [
+    # get_profile_by_username: lower(username) = lower(?)
+    "CREATE INDEX IF NOT EXISTS idx_profiles_username_lower ON profiles(lower(username))",
+    "CREATE INDEX IF NOT EXISTS idx_profiles_updated_at ON profiles(updated_at)",
+    "CREATE INDEX IF NOT EXISTS idx_profile_images_owner ON profile_images(telegram_id, id)",
+    # query_action_logs: фильтры по actor_id / action / actor_username / created_at, сортировка по id
+    "CREATE INDEX IF NOT EXISTS idx_action_logs_actor ON action_logs(actor_id, id)",
+    "CREATE INDEX IF NOT EXISTS idx_action_logs_action ON action_logs(action, id)",
+    "CREATE INDEX IF NOT EXISTS idx_action_logs_actor_username ON action_logs(lower(coalesce(actor_username,'')), id)",
+    "CREATE INDEX IF NOT EXISTS idx_action_logs_created ON action_logs(created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_profile_updates_user ON profile_updates(user_id, id)",
+    "CREATE INDEX IF NOT EXISTS idx_profile_updates_created ON profile_updates(created_at)",
+    # query_antispam_top: окно по created_at с группировкой по user_id
+    "CREATE INDEX IF NOT EXISTS idx_antispam_created_user ON antispam_events(created_at, user_id)",
+    "CREATE INDEX IF NOT EXISTS idx_antispam_kind_created ON antispam_events(kind, created_at, user_id)",
+    "CREATE INDEX IF NOT EXISTS idx_error_logs_created ON error_logs(created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_warnings_created ON warnings(created_at)",
+    # decide_access_application: последняя заявка пользователя
+    "CREATE INDEX IF NOT EXISTS idx_access_apps_user_created ON access_applications(user_id, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_access_apps_pending ON access_applications(created_at) WHERE decision = 'pending'",
+    "CREATE INDEX IF NOT EXISTS idx_neaktyv_requester ON neaktyv_requests(requester_id)",
+    "CREATE INDEX IF NOT EXISTS idx_neaktyv_pending ON neaktyv_requests(created_at) WHERE status = 'pending'",
+    # get_pending_promotion_requests: status = 'pending' ORDER BY created_at
+    "CREATE INDEX IF NOT EXISTS idx_promotion_pending ON promotion_requests(created_at) WHERE status = 'pending'",
+    "CREATE INDEX IF NOT EXISTS idx_promotion_requester ON promotion_requests(requester_id)",
+]
+
+
+@_migration(1, "baseline schema and indexes", prepare=_prepare_profile_images_file_id)
+def _m001_baseline(conn: sqlite3.Connection):
+    # Старые базы: перестройка profile_images и новые колонки promotion_requests
+    _legacy_profile_images_swap(conn)
+    _legacy_promotion_columns(conn)
+    for ddl in _BASE_SCHEMA:
+        conn.execute(ddl)
+    for sql in _INDEXES_V1:
+        conn.execute(sql)
+    conn.execute("ANALYZE")
+
+
+# Полнотекстовый индекс профилей. remove_diacritics 0: й/ї/ґ в украинском —
+# самостоятельные буквы, а не «и/і/г с диакритикой», их нельзя склеивать.
+# Апострофы (’ U+2019 и ʼ U+02BC; ASCII ' и так разделитель) считаем
+# разделителями, чтобы «В'ячеслав», «В’ячеслав» и «Вʼячеслав» индексировались одинаково.
+_PROFILES_FTS_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS profiles_fts USING fts5(
+        username, full_name_tg, in_game_name,
+        content='profiles', content_rowid='telegram_id',
+        tokenize = "unicode61 remove_diacritics 0 separators '\u2019\u02bc'"
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS profiles_fts_ai AFTER INSERT ON profiles BEGIN
+        INSERT INTO profiles_fts(rowid, username, full_name_tg, in_game_name)
+        VALUES (new.telegram_id, new.username, new.full_name_tg, new.in_game_name);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS profiles_fts_ad AFTER DELETE ON profiles BEGIN
+        INSERT INTO profiles_fts(profiles_fts, rowid, username, full_name_tg, in_game_name)
+        VALUES ('delete', old.telegram_id, old.username, old.full_name_tg, old.in_game_name);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS profiles_fts_au AFTER UPDATE OF username, full_name_tg, in_game_name ON profiles
+    WHEN old.username IS NOT new.username
+      OR old.full_name_tg IS NOT new.full_name_tg
+      OR old.in_game_name IS NOT new.in_game_name
+    BEGIN
+        INSERT INTO profiles_fts(profiles_fts, rowid, username, full_name_tg, in_game_name)
+        VALUES ('delete', old.telegram_id, old.username, old.full_name_tg, old.in_game_name);
+        INSERT INTO profiles_fts(rowid, username, full_name_tg, in_game_name)
+        VALUES (new.telegram_id, new.username, new.full_name_tg, new.in_game_name);
+    END
+    """,
+]
+
+
+@_migration(2, "profiles full-text index")
+def _m002_profiles_fts(conn: sqlite3.Connection):
+    try:
+        conn.execute(_PROFILES_FTS_DDL[0])
+    except sqlite3.OperationalError as e:
+        if "fts5" not in str(e):
+            raise
+        # Сборка SQLite без FTS5: поиск остаётся на LIKE
+        logger.warning("FTS5 is not available (%s); /find will use LIKE search", e)
+        return
+    for ddl in _PROFILES_FTS_DDL[1:]:
+        conn.execute(ddl)
+    conn.execute("INSERT INTO profiles_fts(profiles_fts) VALUES ('rebuild')")
+
+
+@_migration(3, "admin notification deliveries")
+def _m003_admin_notifications(conn: sqlite3.Connection):
+    # Какие сообщения получил каждый админ по заявке — чтобы потом их можно было найти/отредактировать
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS admin_notifications (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            ref_id INTEGER,
+            chat_id INTEGER NOT NULL,
+            message_id INTEGER,
+            ok INTEGER NOT NULL,
+            error TEXT,
+            created_at TEXT NOT NULL DEFAULT (datetime('now'))
+        )
+        """
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_admin_notifications_ref ON admin_notifications(kind, ref_id)")
+
+
+@_migration(4, "bot state store")
+def _m004_state_store(conn: sqlite3.Connection):
+    # Состояние бота между перезапусками (заявки в ожидании, незавершённые анкеты и т.п.)
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS state_store (
+            namespace TEXT NOT NULL,
+            key TEXT NOT NULL,
+            value TEXT NOT NULL,
+            updated_at TEXT NOT NULL DEFAULT (datetime('now')),
+            PRIMARY KEY (namespace, key)
+        ) WITHOUT ROWID
+        """
+    )
+
+
+@_migration(5, "invite link pool")
+def _m005_invite_links(conn: sqlite3.Connection):
+    # Заранее созданные одноразовые ссылки-приглашения (пул для approve_request)
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS invite_links (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id INTEGER NOT NULL,
+            invite_link TEXT NOT NULL UNIQUE,
+            status TEXT NOT NULL DEFAULT 'available' CHECK(status IN ('available','claimed','revoked')),
+            created_at TEXT NOT NULL DEFAULT (datetime('now')),
+            expires_at TEXT,
+            claimed_by_user_id INTEGER,
+            claimed_at TEXT,
+            revoked_at TEXT
+        )
+        """
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_invite_links_pool ON invite_links(chat_id, status, expires_at)")
+
+
+@_migration(6, "drop legacy application drafts")
+def _m006_drop_legacy_drafts(conn: sqlite3.Connection):
+    # Незавершённые анкеты теперь хранятся записями ApplicationDraft; старые словари
+    # с полным telegram.User бот прочитать не сможет, а брошенные среди них копились вечно
+    conn.execute("DELETE FROM state_store WHERE namespace = 'user_applications'")
+
+
+# Счётчики журналов по часам ('h', 'YYYY-MM-DD HH') и дням ('d', 'YYYY-MM-DD').
+# Обновляются триггерами при вставке; при удалении сырых строк (архивирование)
+# не уменьшаются — сводка остаётся полной.
+_LOG_ROLLUPS_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS action_log_rollups (
+        grain  TEXT NOT NULL CHECK(grain IN ('h','d')),
+        bucket TEXT NOT NULL,
+        action TEXT NOT NULL,
+        cnt    INTEGER NOT NULL,
+        PRIMARY KEY (grain, bucket, action)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS antispam_rollups (
+        grain  TEXT NOT NULL CHECK(grain IN ('h','d')),
+        bucket TEXT NOT NULL,
+        kind   TEXT NOT NULL,
+        cnt    INTEGER NOT NULL,
+        PRIMARY KEY (grain, bucket, kind)
+    ) WITHOUT ROWID
+    """,
+    # Отдельно по пользователям: для топа; в сводке /log_stats эти строки не нужны
+    """
+    CREATE TABLE IF NOT EXISTS antispam_user_rollups (
+        grain   TEXT NOT NULL CHECK(grain IN ('h','d')),
+        bucket  TEXT NOT NULL,
+        kind    TEXT NOT NULL,
+        user_id INTEGER NOT NULL,
+        cnt     INTEGER NOT NULL,
+        PRIMARY KEY (grain, bucket, kind, user_id)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS action_logs_rollup_ai AFTER INSERT ON action_logs BEGIN
+        INSERT INTO action_log_rollups (grain, bucket, action, cnt)
+        VALUES ('h', substr(coalesce(new.created_at, datetime('now')), 1, 13), coalesce(new.action, ''), 1)
+        ON CONFLICT (grain, bucket, action) DO UPDATE SET cnt = cnt + 1;
+        INSERT INTO action_log_rollups (grain, bucket, action, cnt)
+        VALUES ('d', substr(coalesce(new.created_at, datetime('now')), 1, 10), coalesce(new.action, ''), 1)
+        ON CONFLICT (grain, bucket, action) DO UPDATE SET cnt = cnt + 1;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS antispam_events_rollup_ai AFTER INSERT ON antispam_events BEGIN
+        INSERT INTO antispam_rollups (grain, bucket, kind, cnt)
+        VALUES ('h', substr(coalesce(new.created_at, datetime('now')), 1, 13), coalesce(new.kind, ''), 1)
+        ON CONFLICT (grain, bucket, kind) DO UPDATE SET cnt = cnt + 1;
+        INSERT INTO antispam_rollups (grain, bucket, kind, cnt)
+        VALUES ('d', substr(coalesce(new.created_at, datetime('now')), 1, 10), coalesce(new.kind, ''), 1)
+        ON CONFLICT (grain, bucket, kind) DO UPDATE SET cnt = cnt + 1;
+        INSERT INTO antispam_user_rollups (grain, bucket, kind, user_id, cnt)
+        VALUES ('h', substr(coalesce(new.created_at, datetime('now')), 1, 13), coalesce(new.kind, ''), new.user_id, 1)
+        ON CONFLICT (grain, bucket, kind, user_id) DO UPDATE SET cnt = cnt + 1;
+        INSERT INTO antispam_user_rollups (grain, bucket, kind, user_id, cnt)
+        VALUES ('d', substr(coalesce(new.created_at, datetime('now')), 1, 10), coalesce(new.kind, ''), new.user_id, 1)
+        ON CONFLICT (grain, bucket, kind, user_id) DO UPDATE SET cnt = cnt + 1;
+    END
+    """,
+]
+
+# Пересчёт сводок из сырых строк: таблица сводки -> (ключевые столбцы, журнал,
+# SELECT по сырым данным; {src} — журнал в основной БД или в подключённом архиве).
+# Корзина и ключ считаются тем же выражением, что и в триггерах, иначе сверка
+# сводок расходится на строках с пустым created_at
+_LOG_ROLLUP_SOURCES = {
+    "action_log_rollups": (
+        "grain, bucket, action",
+        "action_logs",
+        """
+        SELECT 'h', substr(coalesce(created_at, datetime('now')), 1, 13), coalesce(action, ''), COUNT(*) FROM {src} GROUP BY 2, 3
+        UNION ALL
+        SELECT 'd', substr(coalesce(created_at, datetime('now')), 1, 10), coalesce(action, ''), COUNT(*) FROM {src} GROUP BY 2, 3
+        """,
+    ),
+    "antispam_rollups": (
+        "grain, bucket, kind",
+        "antispam_events",
+        """
+        SELECT 'h', substr(coalesce(created_at, datetime('now')), 1, 13), coalesce(kind, ''), COUNT(*) FROM {src} GROUP BY 2, 3
+        UNION ALL
+        SELECT 'd', substr(coalesce(created_at, datetime('now')), 1, 10), coalesce(kind, ''), COUNT(*) FROM {src} GROUP BY 2, 3
+        """,
+    ),
+    "antispam_user_rollups": (
+        "grain, bucket, kind, user_id",
+        "antispam_events",
+        """
+        SELECT 'h', substr(coalesce(created_at, datetime('now')), 1, 13), coalesce(kind, ''), user_id, COUNT(*) FROM {src} GROUP BY 2, 3, 4
+        UNION ALL
+        SELECT 'd', substr(coalesce(created_at, datetime('now')), 1, 10), coalesce(kind, ''), user_id, COUNT(*) FROM {src} GROUP BY 2, 3, 4
+        """,
+    ),
+}
+
+
+def _rebuild_log_rollups(conn: sqlite3.Connection):
+    # Источники готовятся заранее: подключать архивы посреди перезаписи сводок нельзя
+    sources = {
+        table: _rollup_source(conn, table, keys, log_table, source_sql)
+        for table, (keys, log_table, source_sql) in _LOG_ROLLUP_SOURCES.items()
+    }
+    try:
+        for table, (keys, _, _) in _LOG_ROLLUP_SOURCES.items():
+            conn.execute(f"DELETE FROM {table}")
+            conn.execute(f"INSERT INTO {table} ({keys}, cnt) {sources[table]}")
+    finally:
+        _drop_rollup_sources(conn)
+
+
+@_migration(7, "log rollups")
+def _m007_log_rollups(conn: sqlite3.Connection):
+    for ddl in _LOG_ROLLUPS_DDL:
+        conn.execute(ddl)
+    _rebuild_log_rollups(conn)
+
+
+# Целочисленное время создания (unix epoch, UTC) рядом с текстовым created_at:
+# диапазоны по дням сравнивают created_ts с числом, без date()/datetime() над
+# столбцом, а индекс по INTEGER компактнее текстового.
+_CREATED_TS_TABLES = (
+    "action_logs", "profile_updates", "antispam_events", "error_logs",
+    "warnings", "neaktyv_requests", "access_applications", "profile_images",
+)
+# Текстовые индексы по created_at, которые заменяет created_ts
+_CREATED_AT_INDEXES_REPLACED = (
+    "idx_action_logs_created", "idx_profile_updates_created", "idx_antispam_created_user",
+    "idx_antispam_kind_created", "idx_error_logs_created", "idx_warnings_created",
+)
+_CREATED_TS_EXPR = "CAST(strftime('%s', created_at) AS INTEGER)"
+
+
+def _prepare_created_ts():
+    """Добавляет created_ts и заполняет его порциями по id в коротких транзакциях;
+    индекс строится здесь же, чтобы основная транзакция миграции была мгновенной."""
+    for table in _CREATED_TS_TABLES:
+        with get_conn() as conn:
+            if "created_ts" not in _columns(conn, table):
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN created_ts INTEGER")
+            max_id = conn.execute(f"SELECT coalesce(max(id), 0) FROM {table}").fetchone()[0]
+        last_id = 0
+        while last_id < max_id:
+            with get_conn() as conn:
+                conn.execute(
+                    f"UPDATE {table} SET created_ts = {_CREATED_TS_EXPR} "
+                    f"WHERE id > ? AND id <= ? AND created_ts IS NULL",
+                    (last_id, last_id + MIGRATION_CHUNK_ROWS),
+                )
+            last_id += MIGRATION_CHUNK_ROWS
+        with get_conn() as conn:
+            conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_created_ts ON {table}(created_ts)")
+
+
+@_migration(8, "integer created_ts columns", prepare=_prepare_created_ts)
+def _m008_created_ts(conn: sqlite3.Connection):
+    # Строки, вставленные после prepare старым кодом (ищутся по индексу)
+    for table in _CREATED_TS_TABLES:
+        conn.execute(f"UPDATE {table} SET created_ts = {_CREATED_TS_EXPR} WHERE created_ts IS NULL")
+    for index in _CREATED_AT_INDEXES_REPLACED:
+        conn.execute(f"DROP INDEX IF EXISTS {index}")
+
+
+@_migration(9, "log archive catalog")
+def _m009_log_archives(conn: sqlite3.Connection):
+    # Какие строки журналов лежат в каком месячном файле архива: диапазоны id и
+    # created_ts позволяют не подключать файлы, в которых заведомо нечего искать
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS log_archives (
+            table_name TEXT NOT NULL,
+            month      TEXT NOT NULL, -- 'YYYY-MM'
+            file_name  TEXT NOT NULL,
+            rows       INTEGER NOT NULL DEFAULT 0,
+            min_id     INTEGER,
+            max_id     INTEGER,
+            min_ts     INTEGER,
+            max_ts     INTEGER,
+            updated_at TEXT DEFAULT (datetime('now')),
+            PRIMARY KEY (table_name, month)
+        )
+        """
+    )
+
+
+@_migration(10, "covering pending promotions index")
+def _m010_promotion_pending_covering(conn: sqlite3.Connection):
+    # Очередь заявок маленькая, а get_pending_promotion_requests читает все её
+    # колонки: покрывающий частичный индекс отдаёт строки без обращения к таблице.
+    # status тоже в ключе — иначе SQLite не считает частичный индекс покрывающим
+    conn.execute("DROP INDEX IF EXISTS idx_promotion_pending")
+    conn.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_promotion_pending ON promotion_requests(
+            created_at, status, requester_id, requester_username, requester_name, current_rank, target_rank
+        ) WHERE status = 'pending'
+        """
+    )
+
+
+def schema_version() -> int:
+    with get_conn() as conn:
+        return int(conn.execute("PRAGMA user_version").fetchone()[0])
+
+
+def migrate_db() -> int:
+    """Применяет недостающие миграции. Возвращает итоговую версию схемы."""
+    target = _MIGRATIONS[-1].version
+    current = schema_version()
+    if current >= target:
+        return current
+    for migration in _MIGRATIONS:
+        if migration.version <= current:
+            continue
+        started = time.perf_counter()
+        if migration.prepare is not None:
+            migration.prepare()
+        with get_conn() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            # Другой процесс мог успеть применить миграцию, пока мы ждали блокировку
+            if conn.execute("PRAGMA user_version").fetchone()[0] >= migration.version:
+                current = migration.version
+                continue
+            migration.apply(conn)
+            conn.execute(f"PRAGMA user_version = {int(migration.version)}")
+        current = migration.version
+        logger.info(
+            "Migration %03d (%s) applied in %.1f ms",
+            migration.version, migration.name, (time.perf_counter() - started) * 1000,
         )
+    return current
+
+
+def init_db():
+    # Режим журнала задаётся до любых записей
+    configure_storage()
+    migrate_db()
 
 
 def upsert_profile(
@@ -338,6 +936,7 @@ def upsert_profile(
 
     with get_conn() as conn:
         conn.execute(sql, fields)
+    _invalidate_profile(telegram_id)
 
 
 def update_profile_fields(telegram_id: int, **fields):
@@ -350,29 +949,50 @@ def update_profile_fields(telegram_id: int, **fields):
             f"UPDATE profiles SET {set_sql}, updated_at = datetime('now') WHERE telegram_id = :telegram_id",
             params,
         )
+    _invalidate_profile(telegram_id)
+
+
+_PROFILE_KEYS = [
+    "telegram_id","username","full_name_tg","in_game_name","rank","npu_department","role","created_at","updated_at",
+]
+
+# Кэш профилей: telegram_id -> dict и вторичный индекс lower(username) -> telegram_id.
+# Любая запись профиля сбрасывает запись кэша (см. _invalidate_profile).
+PROFILE_CACHE_SIZE = _env_int("PROFILE_CACHE_SIZE", 2000)
+PROFILE_CACHE_TTL = _env_int("PROFILE_CACHE_TTL", 300)
+_profile_cache = TTLCache(PROFILE_CACHE_SIZE, PROFILE_CACHE_TTL)
+_username_index = TTLCache(PROFILE_CACHE_SIZE, PROFILE_CACHE_TTL)
+
+
+def _invalidate_profile(telegram_id: int):
+    _profile_cache.invalidate(telegram_id)
+
+
+def _cache_profile(profile: Dict[str, Any], token: int):
+    if _profile_cache.fill(profile["telegram_id"], profile, token) and profile.get("username"):
+        _username_index.set(profile["username"].lower(), profile["telegram_id"])
+
+
+def profile_cache_stats() -> dict[str, Any]:
+    return {"profiles": _profile_cache.stats(), "usernames": _username_index.stats()}
 
 
 def get_profile(telegram_id: int) -> Optional[Dict[str, Any]]:
+    cached = _profile_cache.get(telegram_id)
+    if cached is not None:
+        return dict(cached)
+    token = _profile_cache.fill_token()
     with get_conn() as conn:
         cur = conn.execute(
             "SELECT telegram_id, username, full_name_tg, in_game_name, rank, npu_department, role, created_at, updated_at FROM profiles WHERE telegram_id = ?",
             (telegram_id,),
         )
         row = cur.fetchone()
-        if not row:
-            return None
-        keys = [
-            "telegram_id",
-            "username",
-            "full_name_tg",
-            "in_game_name",
-            "rank",
-            "npu_department",
-            "role",
-            "created_at",
-            "updated_at",
-        ]
-        return dict(zip(keys, row))
+    if not row:
+        return None
+    profile = dict(zip(_PROFILE_KEYS, row))
+    _cache_profile(profile, token)
+    return dict(profile)
 
 
 def get_profile_by_username(username: str) -> Optional[Dict[str, Any]]:
@@ -380,6 +1000,13 @@ def get_profile_by_username(username: str) -> Optional[Dict[str, Any]]:
     uname = (username or "").lstrip("@").strip()
     if not uname:
         return None
+    telegram_id = _username_index.get(uname.lower())
+    if telegram_id is not None:
+        cached = _profile_cache.get(telegram_id)
+        # Индекс мог устареть, если пользователь сменил username
+        if cached is not None and (cached.get("username") or "").lower() == uname.lower():
+            return dict(cached)
+    token = _profile_cache.fill_token()
     with get_conn() as conn:
         cur = conn.execute(
             """
@@ -389,37 +1016,71 @@ def get_profile_by_username(username: str) -> Optional[Dict[str, Any]]:
             (uname,),
         )
         row = cur.fetchone()
-        if not row:
-            return None
-        keys = [
-            "telegram_id","username","full_name_tg","in_game_name","rank","npu_department","role","created_at","updated_at",
-        ]
-        return dict(zip(keys, row))
+    if not row:
+        return None
+    profile = dict(zip(_PROFILE_KEYS, row))
+    _cache_profile(profile, token)
+    return dict(profile)
+
+
+_fts_enabled: Optional[bool] = None
+
+
+def _profiles_fts_enabled(conn: sqlite3.Connection) -> bool:
+    global _fts_enabled
+    if _fts_enabled is None:
+        _fts_enabled = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'profiles_fts'"
+        ).fetchone() is not None
+    return _fts_enabled
+
+
+def _fts_prefix_query(text: str) -> str:
+    """'Петрен @user4' -> '"петрен"* "user4"*' (все слова обязательны, по префиксу)."""
+    words = [w for w in re.split(r"[^\w]+", text.lower()) if w]
+    return " ".join('"' + w.replace('"', '""') + '"*' for w in words)
 
 
 def search_profiles(query: str, limit: int = 10) -> list[Dict[str, Any]]:
-    """Полнотекстовый простой поиск по username, full_name_tg, in_game_name (LIKE, без регистра)."""
-    q = f"%{(query or '').strip()}%"
-    if q == "%%":
+    """Поиск по username, full_name_tg, in_game_name.
+
+    FTS5: совпадение слов по префиксу без учёта регистра (включая кириллицу),
+    сортировка по bm25. Без FTS5 — прежний LIKE по подстроке.
+    """
+    text = (query or "").strip()
+    if not text:
         return []
     with get_conn() as conn:
-        cur = conn.execute(
-            """
-            SELECT telegram_id, username, full_name_tg, in_game_name, rank, npu_department, role, created_at, updated_at
-            FROM profiles
-            WHERE lower(coalesce(username,'')) LIKE lower(?)
-               OR lower(coalesce(full_name_tg,'')) LIKE lower(?)
-               OR lower(coalesce(in_game_name,'')) LIKE lower(?)
-            ORDER BY updated_at DESC
-            LIMIT ?
-            """,
-            (q, q, q, limit),
-        )
-        rows = cur.fetchall()
-        keys = [
-            "telegram_id","username","full_name_tg","in_game_name","rank","npu_department","role","created_at","updated_at",
-        ]
-        return [dict(zip(keys, row)) for row in rows]
+        if _profiles_fts_enabled(conn):
+            match = _fts_prefix_query(text)
+            if not match:
+                return []
+            cur = conn.execute(
+                """
+                SELECT p.telegram_id, p.username, p.full_name_tg, p.in_game_name, p.rank, p.npu_department, p.role, p.created_at, p.updated_at
+                FROM profiles_fts
+                JOIN profiles p ON p.telegram_id = profiles_fts.rowid
+                WHERE profiles_fts MATCH ?
+                ORDER BY bm25(profiles_fts), p.updated_at DESC
+                LIMIT ?
+                """,
+                (match, limit),
+            )
+        else:
+            q = f"%{text}%"
+            cur = conn.execute(
+                """
+                SELECT telegram_id, username, full_name_tg, in_game_name, rank, npu_department, role, created_at, updated_at
+                FROM profiles
+                WHERE lower(coalesce(username,'')) LIKE lower(?)
+                   OR lower(coalesce(full_name_tg,'')) LIKE lower(?)
+                   OR lower(coalesce(in_game_name,'')) LIKE lower(?)
+                ORDER BY updated_at DESC
+                LIMIT ?
+                """,
+                (q, q, q, limit),
+            )
+        return [dict(zip(_PROFILE_KEYS, row)) for row in cur.fetchall()]
 
 
 def replace_profile_images(telegram_id: int, file_ids: list[str]):
@@ -428,9 +1089,11 @@ def replace_profile_images(telegram_id: int, file_ids: list[str]):
         conn.execute("DELETE FROM profile_images WHERE telegram_id = ?", (telegram_id,))
         if file_ids:
             conn.executemany(
-                "INSERT INTO profile_images(telegram_id, file_id) VALUES(?, ?)",
+                "INSERT INTO profile_images(telegram_id, file_id, created_ts) VALUES(?, ?, CAST(strftime('%s', 'now') AS INTEGER))",
                 [(telegram_id, u) for u in file_ids],
             )
+    # Изображения не входят в dict профиля, но кэш сбрасываем при любой записи профиля
+    _invalidate_profile(telegram_id)
 
 
 def get_profile_images(telegram_id: int) -> list[str]:
@@ -456,8 +1119,8 @@ def insert_warning(
     with get_conn() as conn:
         cur = conn.execute(
             """
-            INSERT INTO warnings (offense, date_text, to_whom, rank_to, by_whom, kind, issued_by_user_id, issued_by_username)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            INSERT INTO warnings (offense, date_text, to_whom, rank_to, by_whom, kind, issued_by_user_id, issued_by_username, created_ts)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, CAST(strftime('%s', 'now') AS INTEGER))
             """,
             (offense, date_text, to_whom, rank_to, by_whom, kind, issued_by_user_id, issued_by_username),
         )
@@ -488,8 +1151,8 @@ def insert_neaktyv_request(
     with get_conn() as conn:
         cur = conn.execute(
             """
-            INSERT INTO neaktyv_requests (requester_id, requester_username, to_whom, rank, duration, department)
-            VALUES (?, ?, ?, ?, ?, ?)
+            INSERT INTO neaktyv_requests (requester_id, requester_username, to_whom, rank, duration, department, created_ts)
+            VALUES (?, ?, ?, ?, ?, ?, CAST(strftime('%s', 'now') AS INTEGER))
             """,
             (requester_id, requester_username, to_whom, rank, duration, department),
         )
@@ -526,8 +1189,8 @@ def insert_access_application(
     with get_conn() as conn:
         cur = conn.execute(
             """
-            INSERT INTO access_applications (user_id, username, in_game_name, npu_department, rank, images)
-            VALUES (?, ?, ?, ?, ?, ?)
+            INSERT INTO access_applications (user_id, username, in_game_name, npu_department, rank, images, created_ts)
+            VALUES (?, ?, ?, ?, ?, ?, CAST(strftime('%s', 'now') AS INTEGER))
             """,
             (user_id, username, in_game_name, npu_department, rank, imgs),
         )
@@ -554,6 +1217,336 @@ def decide_access_application(
         )
 
 
+# ======= Admin notifications =======
+def record_admin_notifications(kind: str, ref_id: int | None, deliveries) -> int:
+    """Сохраняет результаты рассылки админам (объекты с chat_id/ok/message_id/error)."""
+    rows = [(kind, ref_id, d.chat_id, d.message_id, 1 if d.ok else 0, d.error) for d in deliveries]
+    if not rows:
+        return 0
+    with get_conn() as conn:
+        conn.executemany(
+            """
+            INSERT INTO admin_notifications (kind, ref_id, chat_id, message_id, ok, error)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            rows,
+        )
+    return len(rows)
+
+
+def get_admin_notifications(kind: str, ref_id: int) -> list[Dict[str, Any]]:
+    with get_conn() as conn:
+        cur = conn.execute(
+            """
+            SELECT chat_id, message_id, ok, error, created_at
+            FROM admin_notifications
+            WHERE kind = ? AND ref_id = ?
+            ORDER BY id
+            """,
+            (kind, ref_id),
+        )
+        return [
+            {"chat_id": r[0], "message_id": r[1], "ok": bool(r[2]), "error": r[3], "created_at": r[4]}
+            for r in cur.fetchall()
+        ]
+
+
+# ======= State store =======
+def load_state(namespace: str) -> Dict[str, str]:
+    """Возвращает сырые (JSON) значения пространства имён: {key: value}."""
+    with get_conn() as conn:
+        cur = conn.execute("SELECT key, value FROM state_store WHERE namespace = ?", (namespace,))
+        return dict(cur.fetchall())
+
+
+def save_state(upserts: list[tuple[str, str, str]], deletes: list[tuple[str, str]]):
+    """Пакетно записывает изменения состояния одной транзакцией.
+
+    upserts: (namespace, key, value), deletes: (namespace, key).
+    """
+    if not upserts and not deletes:
+        return
+    with get_conn() as conn:
+        if deletes:
+            conn.executemany("DELETE FROM state_store WHERE namespace = ? AND key = ?", deletes)
+        if upserts:
+            conn.executemany(
+                """
+                INSERT INTO state_store (namespace, key, value) VALUES (?, ?, ?)
+                ON CONFLICT(namespace, key) DO UPDATE SET value = excluded.value, updated_at = datetime('now')
+                """,
+                upserts,
+            )
+
+
+# ======= Invite link pool =======
+def insert_invite_links(chat_id: int, links: list[tuple[str, str | None]]) -> int:
+    """Добавляет в пул новые ссылки: (invite_link, expires_at 'YYYY-MM-DD HH:MM:SS' UTC)."""
+    if not links:
+        return 0
+    with get_conn() as conn:
+        conn.executemany(
+            "INSERT OR IGNORE INTO invite_links (chat_id, invite_link, expires_at) VALUES (?, ?, ?)",
+            [(chat_id, link, expires_at) for link, expires_at in links],
+        )
+    return len(links)
+
+
+def claim_invite_link(chat_id: int, user_id: int, min_valid_seconds: int = 0) -> Optional[str]:
+    """Атомарно забирает из пула самую старую ссылку, которой хватит ещё на min_valid_seconds."""
+    with get_conn() as conn:
+        row = conn.execute(
+            """
+            UPDATE invite_links
+            SET status = 'claimed', claimed_by_user_id = ?, claimed_at = datetime('now')
+            WHERE id = (
+                SELECT id FROM invite_links
+                WHERE chat_id = ? AND status = 'available'
+                  AND (expires_at IS NULL OR expires_at > datetime('now', ?))
+                ORDER BY id
+                LIMIT 1
+            )
+            RETURNING invite_link
+            """,
+            (user_id, chat_id, f"+{int(min_valid_seconds)} seconds"),
+        ).fetchone()
+        return row[0] if row else None
+
+
+def count_invite_links(chat_id: int, min_valid_seconds: int = 0) -> int:
+    """Сколько ссылок в пуле ещё можно выдать."""
+    with get_conn() as conn:
+        row = conn.execute(
+            """
+            SELECT COUNT(*) FROM invite_links
+            WHERE chat_id = ? AND status = 'available'
+              AND (expires_at IS NULL OR expires_at > datetime('now', ?))
+            """,
+            (chat_id, f"+{int(min_valid_seconds)} seconds"),
+        ).fetchone()
+        return int(row[0])
+
+
+def get_stale_invite_links(chat_id: int, min_valid_seconds: int = 0, limit: int = 50) -> list[str]:
+    """Ссылки пула, которые уже нельзя выдавать (скоро истекают) и пора отозвать."""
+    with get_conn() as conn:
+        cur = conn.execute(
+            """
+            SELECT invite_link FROM invite_links
+            WHERE chat_id = ? AND status = 'available' AND expires_at <= datetime('now', ?)
+            ORDER BY id
+            LIMIT ?
+            """,
+            (chat_id, f"+{int(min_valid_seconds)} seconds", limit),
+        )
+        return [r[0] for r in cur.fetchall()]
+
+
+def mark_invite_links_revoked(links: list[str]):
+    if not links:
+        return
+    with get_conn() as conn:
+        conn.executemany(
+            "UPDATE invite_links SET status = 'revoked', revoked_at = datetime('now') WHERE invite_link = ? AND status = 'available'",
+            [(link,) for link in links],
+        )
+
+
+# ===== Отложенная (пакетная) запись журналов =====
+# action_logs / profile_updates / antispam_events / error_logs пишутся не сразу,
+# а через очередь: фоновый поток сбрасывает накопленные строки одной транзакцией
+# (executemany по каждой таблице) раз в AUDIT_FLUSH_MS миллисекунд или когда
+# набралось AUDIT_BATCH_SIZE строк. Пока поток не запущен — пишем синхронно.
+AUDIT_FLUSH_MS = _env_int("AUDIT_FLUSH_MS", 250)
+AUDIT_BATCH_SIZE = max(1, _env_int("AUDIT_BATCH_SIZE", 200))
+AUDIT_QUEUE_MAX = max(1, _env_int("AUDIT_QUEUE_MAX", 10000))
+# block — ждать место в очереди до AUDIT_BLOCK_TIMEOUT_MS, затем записать синхронно;
+# drop  — отбросить строку и учесть её в счётчике dropped
+AUDIT_OVERFLOW_POLICY = (os.getenv("AUDIT_OVERFLOW_POLICY") or "block").strip().lower()
+AUDIT_BLOCK_TIMEOUT_MS = _env_int("AUDIT_BLOCK_TIMEOUT_MS", 1000)
+
+# created_ts вычисляется из того же параметра, что и created_at (последний в кортеже)
+_AUDIT_INSERTS = {
+    "action_logs": (
+        "INSERT INTO action_logs (actor_id, actor_username, action, target_user_id, target_username, details, created_at, created_ts) "
+        "VALUES (?1, ?2, ?3, ?4, ?5, ?6, ?7, CAST(strftime('%s', ?7) AS INTEGER))"
+    ),
+    "profile_updates": (
+        "INSERT INTO profile_updates (user_id, fields, images_count, source, created_at, created_ts) "
+        "VALUES (?1, ?2, ?3, ?4, ?5, CAST(strftime('%s', ?5) AS INTEGER))"
+    ),
+    "antispam_events": (
+        "INSERT INTO antispam_events (user_id, kind, retry_after, created_at, created_ts) "
+        "VALUES (?1, ?2, ?3, ?4, CAST(strftime('%s', ?4) AS INTEGER))"
+    ),
+    "error_logs": (
+        "INSERT INTO error_logs (error_type, message, stack, update_json, context_info, created_at, created_ts) "
+        "VALUES (?1, ?2, ?3, ?4, ?5, ?6, CAST(strftime('%s', ?6) AS INTEGER))"
+    ),
+}
+
+
+def _utc_now_text() -> str:
+    # Тот же формат, что и datetime('now') в SQLite: время события, а не время сброса
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime())
+
+
+def _insert_audit_rows(rows: list[tuple[str, tuple]]):
+    by_table: dict[str, list[tuple]] = {}
+    for table, params in rows:
+        by_table.setdefault(table, []).append(params)
+    with get_conn() as conn:
+        for table, params_list in by_table.items():
+            conn.executemany(_AUDIT_INSERTS[table], params_list)
+
+
+class _AuditWriter:
+    """Фоновый поток, сбрасывающий журнальные строки пачками."""
+
+    def __init__(self, flush_ms: int, batch_size: int, queue_max: int, policy: str, block_timeout_ms: int):
+        if policy not in ("block", "drop"):
+            raise ValueError(f"AUDIT_OVERFLOW_POLICY={policy!r}: допустимые значения block, drop")
+        self.flush_interval = flush_ms / 1000.0
+        self.batch_size = batch_size
+        self.policy = policy
+        self.block_timeout = block_timeout_ms / 1000.0
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_max)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        # Счётчики меняют и потоки-производители, и поток записи
+        self.stats = {"enqueued": 0, "written": 0, "commits": 0, "dropped": 0, "sync_fallback": 0, "failed": 0}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, **deltas: int):
+        with self._stats_lock:
+            for key, delta in deltas.items():
+                self.stats[key] += delta
+
+    def snapshot(self) -> dict[str, int]:
+        with self._stats_lock:
+            return dict(self.stats)
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, table: str, params: tuple):
+        try:
+            if self.policy == "block":
+                self._queue.put((table, params), timeout=self.block_timeout)
+            else:
+                self._queue.put_nowait((table, params))
+            self._count(enqueued=1)
+        except queue.Full:
+            if self.policy == "drop":
+                self._count(dropped=1)
+                return
+            # Очередь так и не освободилась — не теряем строку, пишем сами
+            self._count(sync_fallback=1)
+            _insert_audit_rows([(table, params)])
+
+    def _run(self):
+        while not self._stop.is_set() or not self._queue.empty():
+            batch = self._collect()
+            if batch:
+                self._flush(batch)
+
+    def _collect(self) -> list[tuple[str, tuple]]:
+        try:
+            first = self._queue.get(timeout=self.flush_interval)
+        except queue.Empty:
+            return []
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self._stop.is_set():
+                # При остановке забираем всё, что уже лежит в очереди, без ожидания
+                try:
+                    batch.append(self._queue.get_nowait())
+                    continue
+                except queue.Empty:
+                    break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _flush(self, batch: list[tuple[str, tuple]]):
+        try:
+            _insert_audit_rows(batch)
+        except Exception:
+            # Возможно, временная блокировка — одна повторная попытка всей пачкой
+            time.sleep(self.flush_interval)
+        else:
+            self._count(written=len(batch), commits=1)
+            return
+        try:
+            _insert_audit_rows(batch)
+        except Exception:
+            logger.exception(f"Пачка журналов ({len(batch)} строк) не записалась, пишем построчно")
+        else:
+            self._count(written=len(batch), commits=1)
+            return
+        # Одна плохая строка (CHECK, NOT NULL) не должна уносить остальные строки пачки
+        for row in batch:
+            try:
+                _insert_audit_rows([row])
+            except Exception:
+                self._count(failed=1)
+                logger.exception(f"Строка журнала {row[0]} отброшена: {row[1]!r}")
+            else:
+                self._count(written=1, commits=1)
+
+    def stop(self, timeout: float | None = 30.0):
+        """Останавливает поток, дописав всё, что осталось в очереди."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        leftovers = []
+        while True:
+            try:
+                leftovers.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if leftovers:
+            self._flush(leftovers)
+
+
+_audit = _AuditWriter(AUDIT_FLUSH_MS, AUDIT_BATCH_SIZE, AUDIT_QUEUE_MAX, AUDIT_OVERFLOW_POLICY, AUDIT_BLOCK_TIMEOUT_MS)
+
+
+def start_audit_writer():
+    """Включает пакетную запись журналов (вызывается при старте бота)."""
+    _audit.start()
+    atexit.register(stop_audit_writer)
+
+
+def stop_audit_writer():
+    """Сбрасывает очередь журналов и останавливает фоновый поток."""
+    _audit.stop()
+
+
+def audit_stats() -> dict[str, int]:
+    return {**_audit.snapshot(), "queued": _audit._queue.qsize()}
+
+
+def _write_audit(table: str, params: tuple):
+    if _audit.running:
+        _audit.submit(table, params)
+    else:
+        _insert_audit_rows([(table, params)])
+
+
 # ===== Загальні логи дій =====
 def log_action(
     actor_id: int | None,
@@ -563,14 +1556,10 @@ def log_action(
     target_username: str | None = None,
     details: str | None = None,
 ):
-    with get_conn() as conn:
-        conn.execute(
-            """
-            INSERT INTO action_logs (actor_id, actor_username, action, target_user_id, target_username, details)
-            VALUES (?, ?, ?, ?, ?, ?)
-            """,
-            (actor_id, actor_username, action, target_user_id, target_username, details),
-        )
+    _write_audit(
+        "action_logs",
+        (actor_id, actor_username, action, target_user_id, target_username, details, _utc_now_text()),
+    )
 
 
 def log_profile_update(
@@ -587,37 +1576,203 @@ def log_profile_update(
             fields_text = "; ".join([f"{k}={v}" for k, v in fields.items()])
         except Exception:
             fields_text = str(fields)
-    with get_conn() as conn:
-        conn.execute(
-            """
-            INSERT INTO profile_updates (user_id, fields, images_count, source)
-            VALUES (?, ?, ?, ?)
-            """,
-            (user_id, fields_text, images_count, source),
-        )
+    _write_audit("profile_updates", (user_id, fields_text, images_count, source, _utc_now_text()))
 
 
-def log_antispam_event(user_id: int, kind: str, retry_after: float | None = None):
-    with get_conn() as conn:
-        conn.execute(
-            """
-            INSERT INTO antispam_events (user_id, kind, retry_after)
-            VALUES (?, ?, ?)
-            """,
-            (user_id, kind, retry_after),
-        )
+def log_antispam_event(user_id: int, kind: str, retry_after: float | None = None, created_at: str | None = None):
+    # created_at передаёт антиспам, который копит события и сбрасывает их пачкой
+    _write_audit("antispam_events", (user_id, kind, retry_after, created_at or _utc_now_text()))
+
+
+def log_antispam_events(events: list[tuple[int, str, float | None, str]]):
+    """Пачка событий антиспама (user_id, kind, retry_after, created_at) одной транзакцией."""
+    if events:
+        _insert_audit_rows([("antispam_events", event) for event in events])
 
 
 # ===== Логи ошибок =====
 def log_error(error_type: str | None, message: str | None, stack: str | None, update_json: str | None, context_info: str | None):
+    _write_audit("error_logs", (error_type, message, stack, update_json, context_info, _utc_now_text()))
+
+
+# ===== Архив журналов =====
+# Строки журналов старше LOG_RETENTION_DAYS дней переносятся в помесячные файлы
+# ARCHIVE_DIR/logs_YYYY-MM.db и удаляются из основной БД порциями по
+# ARCHIVE_BATCH_ROWS строк, каждая порция — своими короткими транзакциями.
+# Файлы архива подключаются (ATTACH) только на время запроса или экспорта;
+# каталог log_archives хранит диапазоны id и created_ts каждого файла.
+LOG_RETENTION_DAYS = max(0, _env_int("LOG_RETENTION_DAYS", 180))  # 0 — не архивировать
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR") or os.path.join(os.path.dirname(os.path.abspath(DB_PATH)), "archive")
+ARCHIVE_BATCH_ROWS = max(1, _env_int("ARCHIVE_BATCH_ROWS", 500))
+_ARCHIVED_TABLES = ("action_logs", "profile_updates", "antispam_events", "error_logs")
+
+
+class _ArchiveFile(NamedTuple):
+    month: str
+    path: str
+    rows: int
+    min_id: int
+    max_id: int
+    min_ts: int
+    max_ts: int
+
+
+@contextmanager
+def _attached(conn: sqlite3.Connection, path: str):
+    """Подключает файл архива как схему arch на время блока. Открытая в блоке
+    транзакция фиксируется (при исключении — откатывается) до DETACH: внутри
+    транзакции отключить базу нельзя."""
+    conn.execute("ATTACH DATABASE ? AS arch", (path,))
+    try:
+        yield
+        if conn.in_transaction:
+            conn.commit()
+    except BaseException:
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+    finally:
+        conn.execute("DETACH DATABASE arch")
+
+
+def _archive_files(conn: sqlite3.Connection, table: str, where: str = "", params: tuple = (), order: str = "month DESC") -> list[_ArchiveFile]:
+    """Файлы архива с непустой таблицей table по каталогу (where — доп. условие на диапазоны)."""
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'log_archives'").fetchone() is None:
+        return []
+    cur = conn.execute(
+        f"""
+        SELECT month, file_name, rows, min_id, max_id, min_ts, max_ts FROM log_archives
+        WHERE table_name = ? AND rows > 0{where}
+        ORDER BY {order}
+        """,
+        (table, *params),
+    )
+    files = []
+    for month, file_name, *rest in cur.fetchall():
+        path = os.path.join(ARCHIVE_DIR, file_name)
+        if not os.path.exists(path):
+            logger.warning(f"Файл архива {path} из каталога не найден — пропускаем")
+            continue
+        files.append(_ArchiveFile(month, path, *rest))
+    return files
+
+
+def _ensure_archive_table(conn: sqlite3.Connection, table: str) -> list[str]:
+    """Создаёт таблицу (с индексами) в подключённом архиве по схеме основной БД
+    или добавляет столбцы, появившиеся позже. Возвращает столбцы основной таблицы."""
+    columns = [row[1] for row in conn.execute(f"PRAGMA main.table_info({table})").fetchall()]
+    archived = [row[1] for row in conn.execute(f"PRAGMA arch.table_info({table})").fetchall()]
+    if not archived:
+        ddl = conn.execute("SELECT sql FROM main.sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()[0]
+        conn.execute(re.sub(rf"^\s*CREATE TABLE (IF NOT EXISTS )?{table}\b", f"CREATE TABLE arch.{table}", ddl, flags=re.I))
+        indexes = conn.execute(
+            "SELECT sql FROM main.sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL", (table,)
+        ).fetchall()
+        for (index_sql,) in indexes:
+            conn.execute(re.sub(r"^\s*CREATE INDEX (IF NOT EXISTS )?(\w+)", r"CREATE INDEX IF NOT EXISTS arch.\2", index_sql, flags=re.I))
+    else:
+        for column in columns:
+            if column not in archived:
+                conn.execute(f"ALTER TABLE arch.{table} ADD COLUMN {column}")
+    return columns
+
+
+def _archive_batch(table: str, oldest_ts: int, cutoff: int, batch_rows: int) -> int:
+    first = time.gmtime(oldest_ts)
+    month = time.strftime("%Y-%m", first)
+    next_month = calendar.timegm((first.tm_year + first.tm_mon // 12, first.tm_mon % 12 + 1, 1, 0, 0, 0))
+    file_name = f"logs_{month}.db"
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
     with get_conn() as conn:
+        ids = [r[0] for r in conn.execute(
+            f"SELECT id FROM {table} WHERE created_ts < ? ORDER BY created_ts LIMIT ?",
+            (min(cutoff, next_month), batch_rows),
+        ).fetchall()]
+        if not ids:
+            return 0
+        ids_json = json.dumps(ids)
+        # Сначала фиксируется копия в архиве, потом удаление из основной БД: между
+        # файлами нет общей атомарной фиксации, а при сбое между шагами повторный
+        # запуск перенесёт ту же порцию ещё раз (INSERT OR IGNORE по id). Каталог
+        # обновляется вместе с удалением, поэтому в rows идёт len(ids), а не rowcount:
+        # при повторе строки уже в архиве и rowcount был бы 0
+        with _attached(conn, os.path.join(ARCHIVE_DIR, file_name)):
+            cols = ", ".join(_ensure_archive_table(conn, table))
+            conn.execute(
+                f"INSERT OR IGNORE INTO arch.{table} ({cols}) "
+                f"SELECT {cols} FROM main.{table} WHERE id IN (SELECT value FROM json_each(?))",
+                (ids_json,),
+            )
+        min_id, max_id, min_ts, max_ts = conn.execute(
+            f"SELECT min(id), max(id), min(created_ts), max(created_ts) FROM {table} "
+            f"WHERE id IN (SELECT value FROM json_each(?))",
+            (ids_json,),
+        ).fetchone()
+        conn.execute(f"DELETE FROM {table} WHERE id IN (SELECT value FROM json_each(?))", (ids_json,))
         conn.execute(
             """
-            INSERT INTO error_logs (error_type, message, stack, update_json, context_info)
-            VALUES (?, ?, ?, ?, ?)
+            INSERT INTO log_archives (table_name, month, file_name, rows, min_id, max_id, min_ts, max_ts)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (table_name, month) DO UPDATE SET
+                rows = rows + excluded.rows,
+                min_id = min(min_id, excluded.min_id),
+                max_id = max(max_id, excluded.max_id),
+                min_ts = min(min_ts, excluded.min_ts),
+                max_ts = max(max_ts, excluded.max_ts),
+                updated_at = datetime('now')
             """,
-            (error_type, message, stack, update_json, context_info),
+            (table, month, file_name, len(ids), min_id, max_id, min_ts, max_ts),
         )
+    return len(ids)
+
+
+def archive_logs_batch(batch_rows: int | None = None) -> int:
+    """Переносит в архив одну порцию самых старых строк журналов, вышедших за срок
+    хранения. Возвращает число перенесённых строк; 0 — переносить больше нечего."""
+    if LOG_RETENTION_DAYS <= 0:
+        return 0
+    cutoff = int(time.time()) - LOG_RETENTION_DAYS * 86400
+    for table in _ARCHIVED_TABLES:
+        with get_conn() as conn:
+            row = conn.execute(
+                f"SELECT created_ts FROM {table} WHERE created_ts < ? ORDER BY created_ts LIMIT 1", (cutoff,)
+            ).fetchone()
+        if row is not None:
+            return _archive_batch(table, row[0], cutoff, batch_rows or ARCHIVE_BATCH_ROWS)
+    return 0
+
+
+def _rollup_source(conn: sqlite3.Connection, rollup_table: str, keys: str, log_table: str, source_sql: str) -> str:
+    """SELECT сырых счётчиков для сводки: основная БД плюс архив (сводки при
+    архивировании не уменьшаются, поэтому сверять их нужно со всеми строками).
+    Счётчики архивных файлов собираются во временную таблицу по одному файлу."""
+    archives = _archive_files(conn, log_table)
+    if not archives:
+        return source_sql.format(src=f"main.{log_table}")
+    temp = f"temp.{rollup_table}_src"
+    conn.execute(f"DROP TABLE IF EXISTS {temp}")
+    conn.execute(f"CREATE TEMP TABLE {rollup_table}_src ({keys}, cnt)")
+    conn.execute(f"INSERT INTO {temp} {source_sql.format(src=f'main.{log_table}')}")
+    # Во временной таблице только промежуточные счётчики; фиксируем, чтобы можно было делать ATTACH
+    conn.commit()
+    for archive in archives:
+        with _attached(conn, archive.path):
+            conn.execute(f"INSERT INTO {temp} {source_sql.format(src=f'arch.{log_table}')}")
+    return f"SELECT {keys}, SUM(cnt) FROM {temp} GROUP BY {keys}"
+
+
+def _drop_rollup_sources(conn: sqlite3.Connection):
+    for rollup_table in _LOG_ROLLUP_SOURCES:
+        conn.execute(f"DROP TABLE IF EXISTS temp.{rollup_table}_src")
+
+
+def list_archives() -> list[dict[str, Any]]:
+    with get_conn() as conn:
+        cur = conn.execute(
+            "SELECT table_name, month, file_name, rows, min_ts, max_ts FROM log_archives ORDER BY month, table_name"
+        )
+        keys = ["table_name", "month", "file_name", "rows", "min_ts", "max_ts"]
+        return [dict(zip(keys, r)) for r in cur.fetchall()]
 
 
 # ===== Запросы/сводки для админов =====
@@ -628,7 +1783,13 @@ def query_action_logs(
     action: str | None = None,
     date_from: str | None = None,  # 'YYYY-MM-DD'
     date_to: str | None = None,    # 'YYYY-MM-DD'
+    before_id: int | None = None,
+    after_id: int | None = None,
 ) -> list[dict[str, Any]]:
+    """Журнал действий, новые сверху. Постранично по ключу: before_id — следующая
+    (более старая) страница, after_id — предыдущая (более новая); стоимость
+    страницы не зависит от её номера, в отличие от OFFSET. Строки, перенесённые
+    в архив, попадают на страницы так же, как строки основной БД."""
     where = []
     params: list[Any] = []
     if actor_id is not None:
@@ -640,41 +1801,126 @@ def query_action_logs(
     if action:
         where.append("action = ?")
         params.append(action)
+    # Диапазон дней переводится в диапазон id (см. _date_id_range): страница
+    # остаётся поиском по rowid в порядке id, без сортировки всех строк диапазона.
+    # Сами границы по created_ts проверяются поверх (+ — без индекса created_ts)
+    id_range_at = None
+    if date_from or date_to:
+        id_range_at = len(params)
+        where.append("id >= ? AND id <= ?")
+        params.extend((0, 0))
     if date_from:
-        where.append("date(created_at) >= date(?)")
+        where.append("+created_ts >= CAST(strftime('%s', ?) AS INTEGER)")
         params.append(date_from)
     if date_to:
-        where.append("date(created_at) <= date(?)")
+        where.append("+created_ts < CAST(strftime('%s', ?, '+1 day') AS INTEGER)")
         params.append(date_to)
+    if before_id is not None:
+        where.append("id < ?")
+        params.append(before_id)
+    if after_id is not None:
+        where.append("id > ?")
+        params.append(after_id)
     where_sql = (" WHERE " + " AND ".join(where)) if where else ""
+    # Для предыдущей страницы идём от after_id вверх, потом разворачиваем
+    order = "ASC" if after_id is not None and before_id is None else "DESC"
+    keys = ["id","actor_id","actor_username","action","target_user_id","target_username","details","created_at"]
     sql = f"""
-        SELECT id, actor_id, actor_username, action, target_user_id, target_username, details, created_at
-        FROM action_logs
+        SELECT {", ".join(keys)}
+        FROM {{src}}
         {where_sql}
-        ORDER BY id DESC
+        ORDER BY id {order}
         LIMIT ?
     """
     params.append(limit)
     with get_conn() as conn:
-        cur = conn.execute(sql, params)
+        if id_range_at is not None:
+            params[id_range_at:id_range_at + 2] = _date_id_range(conn, "main", date_from, date_to)
+        cur = conn.execute(sql.format(src="main.action_logs"), params)
         rows = cur.fetchall()
-        keys = ["id","actor_id","actor_username","action","target_user_id","target_username","details","created_at"]
+        # Обычно каталог сразу показывает, что архив дальше страницы, и файлы не открываются
+        rows = _merge_archived_logs(
+            conn, rows, sql, params, limit, order, before_id, after_id, date_from, date_to, id_range_at
+        )
+        if order == "ASC":
+            rows.reverse()
         return [dict(zip(keys, r)) for r in rows]
 
 
+def _date_id_range(conn: sqlite3.Connection, schema: str, date_from: str | None, date_to: str | None) -> list[int]:
+    """[первый id, последний id] журнала действий за дни date_from..date_to
+    включительно. Журнал пополняется по времени (created_at задаётся при
+    постановке в очередь, пишет один поток), поэтому id растут вместе с
+    created_ts, и обе границы — по одному поиску в индексе created_ts."""
+    low, high = 0, 2**63 - 1
+    if date_from:
+        row = conn.execute(
+            f"SELECT id FROM {schema}.action_logs WHERE created_ts >= CAST(strftime('%s', ?) AS INTEGER) "
+            f"ORDER BY created_ts, id LIMIT 1",
+            (date_from,),
+        ).fetchone()
+        if row is None:
+            return [1, 0]
+        low = row[0]
+    if date_to:
+        row = conn.execute(
+            f"SELECT id FROM {schema}.action_logs WHERE created_ts < CAST(strftime('%s', ?, '+1 day') AS INTEGER) "
+            f"ORDER BY created_ts DESC, id DESC LIMIT 1",
+            (date_to,),
+        ).fetchone()
+        if row is None:
+            return [1, 0]
+        high = row[0]
+    return [low, high]
+
+
+def _merge_archived_logs(conn, rows, sql, params, limit, order, before_id, after_id, date_from, date_to, id_range_at=None) -> list:
+    """Добирает страницу журнала действий из архива. Файлы подключаются по очереди
+    от ближайшего к странице диапазона id; как только следующий файл целиком
+    дальше уже набранной страницы, остальные не открываются."""
+    where = ""
+    bounds: list[Any] = []
+    if before_id is not None:
+        where += " AND min_id < ?"
+        bounds.append(before_id)
+    if after_id is not None:
+        where += " AND max_id > ?"
+        bounds.append(after_id)
+    if date_from:
+        where += " AND max_ts >= CAST(strftime('%s', ?) AS INTEGER)"
+        bounds.append(date_from)
+    if date_to:
+        where += " AND min_ts < CAST(strftime('%s', ?, '+1 day') AS INTEGER)"
+        bounds.append(date_to)
+    descending = order == "DESC"
+    archives = _archive_files(conn, "action_logs", where, tuple(bounds), "max_id DESC" if descending else "min_id ASC")
+    for archive in archives:
+        if len(rows) >= limit and (archive.max_id < rows[-1][0] if descending else archive.min_id > rows[-1][0]):
+            break
+        with _attached(conn, archive.path):
+            if id_range_at is not None:
+                params = list(params)
+                params[id_range_at:id_range_at + 2] = _date_id_range(conn, "arch", date_from, date_to)
+            rows = rows + conn.execute(sql.format(src="arch.action_logs"), params).fetchall()
+        rows.sort(key=lambda r: r[0], reverse=descending)
+        del rows[limit:]
+    return rows
+
+
 def query_antispam_top(days: int = 7, kind: str | None = None, limit: int = 10) -> list[dict[str, Any]]:
-    where = ["datetime(created_at) >= datetime('now', ?) "]
-    params: list[Any] = [f"-{int(days)} days"]
+    start_hour, first_day = _rollup_window(days)
+    extra_where = ""
+    params: list[Any] = [start_hour, first_day]
     if kind in ("message", "callback"):
-        where.append("kind = ?")
-        params.append(kind)
-    where_sql = " WHERE " + " AND ".join(where)
+        extra_where = " AND kind = ?"
+        params = [start_hour, first_day, kind, first_day, kind]
+    else:
+        params.append(first_day)
     sql = f"""
-        SELECT user_id, COUNT(*) AS cnt
-        FROM antispam_events
-        {where_sql}
+        SELECT user_id, SUM(cnt) AS total
+        FROM ({_rollup_window_sql("antispam_user_rollups", "kind, user_id", extra_where)})
         GROUP BY user_id
-        ORDER BY cnt DESC
+        ORDER BY total DESC
         LIMIT ?
     """
     params.append(limit)
@@ -699,8 +1945,45 @@ def _table_primary_timestamp(table: str) -> str | None:
     return candidates.get(table)
 
 
-def export_table_csv(table: str, days: int | None = None) -> tuple[str, bytes]:
-    """Экспорт таблицы в CSV. Возвращает (filename, bytes). Разрешены только известные таблицы."""
+# Экспорт CSV: строки читаются пачками по EXPORT_CHUNK_ROWS и сразу пишутся в
+# SpooledTemporaryFile — до EXPORT_SPOOL_MAX_BYTES в памяти, дальше на диске
+EXPORT_CHUNK_ROWS = max(1, _env_int("EXPORT_CHUNK_ROWS", 5000))
+EXPORT_SPOOL_MAX_BYTES = _env_int("EXPORT_SPOOL_MAX_BYTES", 8 * 1024 * 1024)
+
+
+def _write_csv_chunks(writer, cur: sqlite3.Cursor) -> int:
+    rows = 0
+    while True:
+        chunk = cur.fetchmany(EXPORT_CHUNK_ROWS)
+        if not chunk:
+            return rows
+        writer.writerows(chunk)
+        rows += len(chunk)
+
+
+def _export_archived(conn: sqlite3.Connection, writer, table: str, cols: list[str], where_sql: str, params: list[Any]) -> int:
+    """Дописывает в экспорт строки из архива (от новых месяцев к старым)."""
+    where = ""
+    bounds: tuple = ()
+    if params:
+        where = " AND max_ts >= CAST(strftime('%s', 'now') AS INTEGER) - ?"
+        bounds = tuple(params)
+    rows = 0
+    for archive in _archive_files(conn, table, where, bounds):
+        with _attached(conn, archive.path):
+            # Столбцы, добавленные после архивации файла, выгружаются пустыми
+            archived = {row[1] for row in conn.execute(f"PRAGMA arch.table_info({table})").fetchall()}
+            select = ", ".join(col if col in archived else "NULL" for col in cols)
+            rows += _write_csv_chunks(writer, conn.execute(f"SELECT {select} FROM arch.{table}{where_sql}", params))
+    return rows
+
+
+def export_table_csv(table: str, days: int | None = None, compress: bool = False) -> tuple[str, BinaryIO, int]:
+    """Экспорт таблицы в CSV (UTF-8 с BOM, при compress — gzip). Разрешены только известные таблицы.
+
+    Возвращает (filename, файл, число строк); файл открыт и перемотан в начало,
+    закрыть его должен вызывающий. Для журналов выгружаются и строки из архива.
+    """
     allowed = {
         "profiles", "profile_images", "warnings", "neaktyv_requests",
         "access_applications", "action_logs", "profile_updates", "antispam_events", "error_logs"
@@ -710,66 +1993,116 @@ def export_table_csv(table: str, days: int | None = None) -> tuple[str, bytes]:
     ts_col = _table_primary_timestamp(table)
     where_sql = ""
     params: list[Any] = []
-    if days and ts_col:
-        where_sql = f" WHERE datetime({ts_col}) >= datetime('now', ?)"
+    if days and table in _CREATED_TS_TABLES:
+        where_sql = " WHERE created_ts >= CAST(strftime('%s', 'now') AS INTEGER) - ?"
+        params.append(int(days) * 86400)
+    elif days and ts_col:
+        # Сравниваем сам столбец (формат 'YYYY-MM-DD HH:MM:SS'), чтобы работал индекс
+        where_sql = f" WHERE {ts_col} >= datetime('now', ?)"
         params.append(f"-{int(days)} days")
-    # Получаем список столбцов
-    with get_conn() as conn:
-        cur = conn.execute(f"PRAGMA table_info({table})")
-        cols = [r[1] for r in cur.fetchall()]
-        select_sql = f"SELECT {', '.join(cols)} FROM {table}{where_sql}"
-        cur2 = conn.execute(select_sql, params)
-        rows = cur2.fetchall()
-    # Формируем CSV
-    buf = io.StringIO()
-    writer = csv.writer(buf)
-    writer.writerow(cols)
-    for row in rows:
-        writer.writerow(row)
-    content = buf.getvalue().encode("utf-8-sig")
-    filename = f"{table}.csv"
-    return filename, content
+    spool = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_MAX_BYTES)
+    try:
+        gz = gzip.GzipFile(filename=f"{table}.csv", mode="wb", fileobj=spool, compresslevel=6) if compress else None
+        text = io.TextIOWrapper(gz or spool, encoding="utf-8-sig", newline="")
+        writer = csv.writer(text)
+        rows = 0
+        with get_conn() as conn:
+            cols = [r[1] for r in conn.execute(f"PRAGMA table_info({table})").fetchall()]
+            writer.writerow(cols)
+            cur = conn.execute(f"SELECT {', '.join(cols)} FROM {table}{where_sql}", params)
+            rows += _write_csv_chunks(writer, cur)
+            if table in _ARCHIVED_TABLES:
+                rows += _export_archived(conn, writer, table, cols, where_sql, params)
+        text.flush()
+        # detach, чтобы закрытие обёртки не закрыло сам файл
+        text.detach()
+        if gz is not None:
+            gz.close()
+        spool.seek(0)
+    except BaseException:
+        spool.close()
+        raise
+    filename = f"{table}.csv.gz" if compress else f"{table}.csv"
+    return filename, spool, rows
+
+
+def _rollup_window(days: int) -> tuple[str, str]:
+    """Окно «последние days дней» в терминах сводок: часовые корзины первого
+    (неполного) дня и дневные — начиная со следующего."""
+    start = time.time() - int(days) * 86400
+    start_hour = time.strftime("%Y-%m-%d %H", time.gmtime(start))
+    first_day = time.strftime("%Y-%m-%d", time.gmtime(start + 86400))
+    return start_hour, first_day
+
+
+def _rollup_window_sql(table: str, columns: str, extra_where: str = "") -> str:
+    return f"""
+        SELECT {columns}, cnt FROM {table} WHERE grain = 'h' AND bucket >= ? AND bucket < ?{extra_where}
+        UNION ALL
+        SELECT {columns}, cnt FROM {table} WHERE grain = 'd' AND bucket >= ?{extra_where}
+    """
 
 
 def logs_stats(days: int = 7) -> dict[str, Any]:
-    """Сводные показатели за период."""
+    """Сводные показатели за период (из сводок по часам/дням, с точностью до часа).
+
+    Читаются не более days дневных и 24 часовых корзин на ключ, сколько бы
+    строк ни было в журналах.
+    """
+    start_hour, first_day = _rollup_window(days)
+    window = (start_hour, first_day, first_day)
     stats: dict[str, Any] = {}
     with get_conn() as conn:
         # Действия по типам
         cur = conn.execute(
-            """
-            SELECT action, COUNT(*)
-            FROM action_logs
-            WHERE datetime(created_at) >= datetime('now', ?)
+            f"""
+            SELECT action, SUM(cnt) FROM ({_rollup_window_sql("action_log_rollups", "action")})
             GROUP BY action
-            ORDER BY COUNT(*) DESC
+            ORDER BY SUM(cnt) DESC
             """,
-            (f"-{int(days)} days",),
+            window,
         )
         stats["actions_by_type"] = [(r[0], r[1]) for r in cur.fetchall()]
-        # Антиспам итого
-        cur = conn.execute(
-            """
-            SELECT COUNT(*) FROM antispam_events
-            WHERE datetime(created_at) >= datetime('now', ?)
-            """,
-            (f"-{int(days)} days",),
-        )
-        stats["antispam_total"] = cur.fetchone()[0]
-        # Антиспам по типам
+        # Антиспам по типам и итого
         cur = conn.execute(
-            """
-            SELECT kind, COUNT(*) FROM antispam_events
-            WHERE datetime(created_at) >= datetime('now', ?)
+            f"""
+            SELECT kind, SUM(cnt) FROM ({_rollup_window_sql("antispam_rollups", "kind")})
             GROUP BY kind
-            ORDER BY COUNT(*) DESC
+            ORDER BY SUM(cnt) DESC
             """,
-            (f"-{int(days)} days",),
+            window,
         )
         stats["antispam_by_kind"] = [(r[0], r[1]) for r in cur.fetchall()]
+        stats["antispam_total"] = sum(v for _, v in stats["antispam_by_kind"])
     return stats
 
 
+def check_log_rollups() -> dict[str, int]:
+    """Сверяет сводки с сырыми строками (включая архив). Возвращает число расходящихся корзин по таблицам."""
+    mismatches: dict[str, int] = {}
+    with get_conn() as conn:
+        try:
+            for table, (keys, log_table, source_sql) in _LOG_ROLLUP_SOURCES.items():
+                source = _rollup_source(conn, table, keys, log_table, source_sql)
+                diff_sql = f"""
+                    SELECT COUNT(*) FROM (
+                        SELECT * FROM (SELECT {keys}, cnt FROM {table} EXCEPT SELECT * FROM ({source}))
+                        UNION ALL
+                        SELECT * FROM (SELECT * FROM ({source}) EXCEPT SELECT {keys}, cnt FROM {table})
+                    )
+                """
+                mismatches[table] = conn.execute(diff_sql).fetchone()[0]
+        finally:
+            _drop_rollup_sources(conn)
+    return mismatches
+
+
+def rebuild_log_rollups():
+    """Пересчитывает сводки из сырых строк (включая архив); сами сводки перезаписываются одной транзакцией."""
+    with get_conn() as conn:
+        _rebuild_log_rollups(conn)
+
+
 def insert_promotion_request(
     requester_id: int,
     requester_username: str,
@@ -877,3 +2210,46 @@ def decide_promotion_request(
             (status, moderator_id, moderator_username, moderator_rank, reject_reason, request_id),
         )
         return cur.rowcount > 0
+
+
+def _benchmark(calls: int = 3000):
+    """Микробенчмарк пула: ops/s upsert_profile, log_action и get_profile через
+    пул и с новым соединением на каждый вызов (как было до пула)."""
+    global DB_PATH
+    import shutil
+
+    class _NoPool(_ConnectionPool):
+        def acquire(self) -> sqlite3.Connection:
+            _ensure_dir()
+            return self._connect()
+
+        def release(self, conn: sqlite3.Connection, broken: bool = False):
+            conn.close()
+
+    workdir = tempfile.mkdtemp(prefix="db-bench-")
+    DB_PATH = os.path.join(workdir, "bench.db")
+    init_db()
+    global _pool
+    ops = {
+        "upsert_profile": lambda i: upsert_profile(telegram_id=i % 500, username=f"user{i}"),
+        "log_action": lambda i: log_action(i, f"user{i}", "bench", details="x"),
+        "get_profile": lambda i: get_profile(i % 500),
+    }
+    try:
+        for label, pool in (("без пула", _NoPool(DB_PATH, 1, DB_POOL_TIMEOUT, DB_POOL_PING_AFTER)), ("пул", None)):
+            close_db()
+            _pool = pool
+            for name, op in ops.items():
+                started = time.perf_counter()
+                for i in range(calls):
+                    op(i)
+                print(f"{label:>9} {name:<15} {calls / (time.perf_counter() - started):>9.0f} ops/s")
+    finally:
+        close_db()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    import sys
+
+    _benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 3000)
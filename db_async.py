@@ -0,0 +1,108 @@
+"""Асинхронний фасад над db.py.
+
+Кожна функція тут — корутина з тією ж сигнатурою, що й однойменна функція
+db.py, але сам виклик SQLite виконується поза циклом подій:
+
+* записи йдуть в один виділений потік-писач (SQLite все одно допускає лише
+  одного писача, тож черга в одному потоці прибирає зайві очікування блокувань);
+* читання виконуються в невеликому пулі потоків і не чекають на записи.
+
+Так повільний fsync блокує лише чергу записів, а не обробку апдейтів інших
+користувачів.
+"""
+
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+import db
+
+DB_READ_WORKERS = db.DB_READ_WORKERS
+
+_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+_readers = ThreadPoolExecutor(max_workers=DB_READ_WORKERS, thread_name_prefix="db-reader")
+
+
+async def run_write(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """Виконати довільну синхронну функцію у потоці-писачі."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_writer, functools.partial(fn, *args, **kwargs))
+
+
+async def run_read(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """Виконати довільну синхронну функцію у пулі читачів."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_readers, functools.partial(fn, *args, **kwargs))
+
+
+def _writer_method(fn: Callable[..., Any]):
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        return await run_write(fn, *args, **kwargs)
+    return wrapper
+
+
+def _reader_method(fn: Callable[..., Any]):
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        return await run_read(fn, *args, **kwargs)
+    return wrapper
+
+
+def shutdown(wait: bool = True):
+    """Дочекатися завершення черги записів і зупинити потоки."""
+    _writer.shutdown(wait=wait)
+    _readers.shutdown(wait=wait)
+
+
+# ===== Профілі =====
+upsert_profile = _writer_method(db.upsert_profile)
+update_profile_fields = _writer_method(db.update_profile_fields)
+replace_profile_images = _writer_method(db.replace_profile_images)
+get_profile = _reader_method(db.get_profile)
+get_profile_by_username = _reader_method(db.get_profile_by_username)
+search_profiles = _reader_method(db.search_profiles)
+get_profile_images = _reader_method(db.get_profile_images)
+
+# ===== Догани / неактив / заявки =====
+insert_warning = _writer_method(db.insert_warning)
+revoke_warning = _writer_method(db.revoke_warning)
+insert_neaktyv_request = _writer_method(db.insert_neaktyv_request)
+decide_neaktyv_request = _writer_method(db.decide_neaktyv_request)
+insert_access_application = _writer_method(db.insert_access_application)
+decide_access_application = _writer_method(db.decide_access_application)
+insert_promotion_request = _writer_method(db.insert_promotion_request)
+decide_promotion_request = _writer_method(db.decide_promotion_request)
+get_promotion_request = _reader_method(db.get_promotion_request)
+get_pending_promotion_requests = _reader_method(db.get_pending_promotion_requests)
+record_admin_notifications = _writer_method(db.record_admin_notifications)
+get_admin_notifications = _reader_method(db.get_admin_notifications)
+
+# ===== Пул запрошень =====
+insert_invite_links = _writer_method(db.insert_invite_links)
+claim_invite_link = _writer_method(db.claim_invite_link)
+mark_invite_links_revoked = _writer_method(db.mark_invite_links_revoked)
+count_invite_links = _reader_method(db.count_invite_links)
+get_stale_invite_links = _reader_method(db.get_stale_invite_links)
+
+# ===== Логи =====
+log_action = _writer_method(db.log_action)
+log_profile_update = _writer_method(db.log_profile_update)
+log_antispam_event = _writer_method(db.log_antispam_event)
+log_antispam_events = _writer_method(db.log_antispam_events)
+log_error = _writer_method(db.log_error)
+
+# ===== Обслуговування сховища =====
+checkpoint_db = _writer_method(db.checkpoint_db)
+optimize_db = _writer_method(db.optimize_db)
+rebuild_log_rollups = _writer_method(db.rebuild_log_rollups)
+archive_logs_batch = _writer_method(db.archive_logs_batch)
+
+# ===== Звіти для адмінів =====
+query_action_logs = _reader_method(db.query_action_logs)
+query_antispam_top = _reader_method(db.query_antispam_top)
+export_table_csv = _reader_method(db.export_table_csv)
+logs_stats = _reader_method(db.logs_stats)
+check_log_rollups = _reader_method(db.check_log_rollups)
+list_archives = _reader_method(db.list_archives)
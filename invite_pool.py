@@ -0,0 +1,144 @@
+"""Пул заздалегідь створених одноразових посилань-запрошень.
+
+approve_request бере готове посилання з таблиці invite_links (один UPDATE у
+БД) замість виклику create_chat_invite_link під час схвалення. Пул підтримує
+фонова задача:
+
+* якщо доступних посилань менше low_watermark — створює нові до target_size;
+* посилання створюються з expire_date = зараз + ttl, а видаються лише ті, що
+  проживуть ще щонайменше min_valid (щоб користувач встиг ними скористатися);
+  решту задача відкликає (revoke_chat_invite_link) і позначає revoked.
+
+Якщо пул порожній, посилання створюється як раніше — напряму.
+"""
+
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Optional
+
+import db_async
+from outbound import BULK
+
+logger = logging.getLogger(__name__)
+
+
+class InviteLinkPool:
+    def __init__(
+        self,
+        chat_id: int,
+        target_size: int = 10,
+        low_watermark: int = 3,
+        ttl: int = 7 * 24 * 3600,
+        min_valid: int = 24 * 3600,
+    ):
+        self.chat_id = chat_id
+        self.target_size = max(1, int(target_size))
+        self.low_watermark = min(max(0, int(low_watermark)), self.target_size)
+        self.ttl = int(ttl)
+        self.min_valid = min(int(min_valid), self.ttl)
+        self._lock = asyncio.Lock()
+        self._background: Optional[asyncio.Task] = None
+        # Фонові перейменування: цикл подій тримає лише слабкі посилання на задачі
+        self._renames: set[asyncio.Task] = set()
+        # Метрики
+        self.depth: Optional[int] = None
+        self.claimed = 0
+        self.misses = 0
+        self.created = 0
+        self.revoked = 0
+        self.last_refill_ms = 0.0
+        self.last_create_ms = 0.0
+
+    async def claim(self, bot, user_id: int, user_name: str) -> Optional[str]:
+        """Видає посилання з пулу; None — пул порожній."""
+        link = await db_async.claim_invite_link(self.chat_id, user_id, self.min_valid)
+        if link is None:
+            self.misses += 1
+        else:
+            self.claimed += 1
+            if self.depth:
+                self.depth -= 1
+            # Підписуємо посилання ім'ям користувача вже у фоні — це не потрібно для схвалення
+            task = asyncio.create_task(self._rename(bot, link, f"Запрошення для {user_name}"))
+            self._renames.add(task)
+            task.add_done_callback(self._renames.discard)
+        if self.depth is None or self.depth < self.low_watermark:
+            self.schedule_maintenance(bot)
+        return link
+
+    async def _rename(self, bot, link: str, name: str):
+        try:
+            await bot.edit_chat_invite_link(chat_id=self.chat_id, invite_link=link, name=name[:32], rate_limit_args=BULK)
+        except Exception as e:
+            logger.debug(f"Не вдалося перейменувати посилання {link}: {e}")
+
+    def schedule_maintenance(self, bot):
+        if self._background is None or self._background.done():
+            self._background = asyncio.create_task(self.maintain(bot))
+
+    async def maintain(self, bot):
+        """Відкликати прострочені посилання і поповнити пул до target_size."""
+        async with self._lock:
+            try:
+                await self._revoke_stale(bot)
+                await self._refill(bot)
+            except Exception as e:
+                logger.error(f"Обслуговування пулу запрошень не вдалося: {e}")
+
+    async def _revoke_stale(self, bot):
+        stale = await db_async.get_stale_invite_links(self.chat_id, self.min_valid)
+        revoked = []
+        for link in stale:
+            try:
+                await bot.revoke_chat_invite_link(chat_id=self.chat_id, invite_link=link, rate_limit_args=BULK)
+            except Exception as e:
+                # Посилання могло вже закінчитися саме — з пулу його однаково прибираємо
+                logger.warning(f"Не вдалося відкликати посилання {link}: {e}")
+            revoked.append(link)
+        if revoked:
+            await db_async.mark_invite_links_revoked(revoked)
+            self.revoked += len(revoked)
+
+    async def _refill(self, bot):
+        self.depth = await db_async.count_invite_links(self.chat_id, self.min_valid)
+        if self.depth >= self.low_watermark and self.depth > 0:
+            return
+        missing = self.target_size - self.depth
+        started = time.perf_counter()
+        created = []
+        try:
+            for _ in range(missing):
+                expires = datetime.now(timezone.utc) + timedelta(seconds=self.ttl)
+                t = time.perf_counter()
+                link = await bot.create_chat_invite_link(
+                    chat_id=self.chat_id,
+                    expire_date=expires,
+                    member_limit=1,
+                    creates_join_request=False,
+                    rate_limit_args=BULK,
+                )
+                self.last_create_ms = (time.perf_counter() - t) * 1000
+                created.append((link.invite_link, expires.strftime("%Y-%m-%d %H:%M:%S")))
+        finally:
+            # Навіть якщо створення обірвалося, вже створені посилання не повинні загубитися
+            if created:
+                await db_async.insert_invite_links(self.chat_id, created)
+                self.created += len(created)
+                self.depth += len(created)
+            self.last_refill_ms = (time.perf_counter() - started) * 1000
+        logger.info(f"Пул запрошень поповнено на {len(created)} (тепер {self.depth}) за {self.last_refill_ms:.0f} мс")
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "depth": self.depth,
+            "target_size": self.target_size,
+            "low_watermark": self.low_watermark,
+            "claimed": self.claimed,
+            "misses": self.misses,
+            "created": self.created,
+            "revoked": self.revoked,
+            "last_refill_ms": self.last_refill_ms,
+            "last_create_ms": self.last_create_ms,
+        }
@@ -0,0 +1,177 @@
+"""Налаштування логування бота.
+
+* Обробники (корутини) не пишуть у потік самі: кореневий логер має лише
+  QueueHandler, а форматування часу/JSON і запис у stderr виконує окремий
+  потік QueueListener.
+* Повідомлення форматуються ліниво: logger.debug("... %s", x) для вимкненого
+  рівня коштує лише перевірку isEnabledFor, рядок не будується.
+* Для балакучих логерів можна вмикати вибірку: LOG_SAMPLING="bot.messages:100"
+  пропускає кожен 100-й запис нижче WARNING від bot.messages (і дочірніх);
+  попередження й помилки проходять завжди. Для власних логерів гарячого
+  шляху — get_logger(): вибірка відбувається ще до створення запису.
+* LOG_FORMAT=json — один JSON-об'єкт на рядок (поля extra={...} додаються як є).
+"""
+
+import atexit
+import json
+import logging
+import queue
+import sys
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+# Стандартні атрибути LogRecord — усе інше потрапило в запис через extra
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "taskName"}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        if record.stack_info:
+            entry["stack"] = record.stack_info
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Пропускає кожен every-й запис нижче WARNING від заданих логерів (з дочірніми)."""
+
+    def __init__(self, rates: dict[str, int]):
+        super().__init__()
+        self.rates = {name: max(1, int(every)) for name, every in rates.items()}
+        self._every: dict[str, int] = {}
+        self._seen: dict[str, int] = {}
+        self.dropped = 0
+
+    def _resolve(self, name: str) -> int:
+        every = self._every.get(name)
+        if every is None:
+            every, prefix = 1, name
+            while prefix:
+                if prefix in self.rates:
+                    every = self.rates[prefix]
+                    break
+                prefix = prefix.rpartition(".")[0]
+            self._every[name] = every
+        return every
+
+    def keep(self, name: str, levelno: int) -> bool:
+        if levelno >= logging.WARNING:
+            return True
+        every = self._resolve(name)
+        if every == 1:
+            return True
+        seen = self._seen.get(name, 0)
+        self._seen[name] = seen + 1
+        if seen % every == 0:
+            return True
+        self.dropped += 1
+        return False
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        # Записи SampledLogger вже пройшли вибірку до створення LogRecord
+        return record.name in _presampled or self.keep(record.name, record.levelno)
+
+
+_sampling: Optional[SamplingFilter] = None
+_presampled: set[str] = set()
+
+
+class SampledLogger(logging.LoggerAdapter):
+    """Логер для гарячого шляху: вибірка LOG_SAMPLING застосовується в
+    isEnabledFor, тож відкинутий запис не створює LogRecord і не шукає
+    місце виклику (це основна вартість виклику логера)."""
+
+    def __init__(self, name: str):
+        super().__init__(logging.getLogger(name), {})
+        _presampled.add(name)
+
+    def isEnabledFor(self, level: int) -> bool:
+        if not self.logger.isEnabledFor(level):
+            return False
+        return _sampling is None or _sampling.keep(self.logger.name, level)
+
+    def process(self, msg, kwargs):
+        return msg, kwargs
+
+
+def get_logger(name: str) -> SampledLogger:
+    return SampledLogger(name)
+
+
+def parse_sampling(spec: Optional[str]) -> dict[str, int]:
+    """"bot.messages:100, httpx:10" -> {"bot.messages": 100, "httpx": 10}; некоректні пари пропускаються."""
+    rates: dict[str, int] = {}
+    for item in (spec or "").split(","):
+        name, _, every = item.strip().rpartition(":")
+        if name and every.isdigit():
+            rates[name] = int(every)
+    return rates
+
+
+class _LocalQueueHandler(QueueHandler):
+    """Черга в межах процесу: запис не треба робити придатним до pickle. Текст
+    повідомлення фіксується одразу (аргументи можуть змінитися до запису), а
+    формат рядка, час і traceback будує вже потік слухача."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+_listener: Optional[QueueListener] = None
+
+
+def setup_logging(level: str = "INFO", fmt: str = "text", sampling: Optional[dict[str, int]] = None) -> QueueListener:
+    """Замінює обробники кореневого логера на QueueHandler і запускає слухача."""
+    global _listener, _sampling
+    stop_logging()
+    stream = logging.StreamHandler(sys.stderr)
+    stream.setFormatter(JsonFormatter() if fmt.lower() == "json" else logging.Formatter(TEXT_FORMAT))
+    handler = _LocalQueueHandler(queue.SimpleQueue())
+    _sampling = SamplingFilter(sampling) if sampling else None
+    if _sampling is not None:
+        handler.addFilter(_sampling)
+    root = logging.getLogger()
+    for old in root.handlers[:]:
+        root.removeHandler(old)
+    root.addHandler(handler)
+    numeric = logging.getLevelName(level.upper())
+    root.setLevel(numeric if isinstance(numeric, int) else logging.INFO)
+    _listener = QueueListener(handler.queue, stream, respect_handler_level=True)
+    _listener.start()
+    # Якщо процес завершиться без on_shutdown — черга однаково буде дописана
+    atexit.register(stop_logging)
+    return _listener
+
+
+def stop_logging():
+    """Дописує чергу і зупиняє слухача. Записи після зупинки йдуть у потік напряму."""
+    global _listener
+    if _listener is None:
+        return
+    listener, _listener = _listener, None
+    listener.stop()
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        if isinstance(handler, _LocalQueueHandler):
+            root.removeHandler(handler)
+            for target in listener.handlers:
+                for f in handler.filters:
+                    target.addFilter(f)
+                root.addHandler(target)
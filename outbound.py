@@ -0,0 +1,255 @@
+"""Планувальник вихідних запитів до Bot API з урахуванням лімітів Telegram.
+
+OutboundRateLimiter підключається через Application.builder().rate_limiter(...)
+і пропускає через себе всі виклики бота (send_message, reply_text, answer тощо):
+
+* глобальний token bucket (~30 запитів/с на бота);
+* окремий bucket на кожен чат: приватні чати ~1 повідомлення/с,
+  групи та канали ~20 повідомлень/хв. Він стосується лише повідомлень у чат
+  (send*/copy*/forward*); службові виклики з chat_id — get_chat_member,
+  запрошення, ban/unban — йдуть лише через глобальний ліміт;
+* черга до глобального ліміту пріоритетна: інтерактивні відповіді йдуть
+  раніше за масові розсилки (rate_limit_args=BULK);
+* на RetryAfter відправлення ставиться на паузу на вказаний час і
+  повторюється до max_retries разів.
+
+stats() повертає глибину черги та час очікування для /admin.
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import deque
+from datetime import timedelta
+from typing import Any, Callable, Coroutine, Dict, Optional, Union
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = {"priority": 0}
+BULK = {"priority": 1}
+
+_PRIORITY_NAMES = {0: "interactive", 1: "bulk"}
+
+# Методи Bot API, на які діє ліміт повідомлень у чат
+_CHAT_LIMITED_PREFIXES = ("send", "copy", "forward")
+
+
+class TokenBucket:
+    """Класичний token bucket: rate токенів за секунду, не більше capacity про запас."""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = float(rate)
+        self.capacity = max(1.0, float(capacity))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """Скільки чекати до появи цілого токена (0 — можна прямо зараз)."""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+    def reserve(self, now: float) -> float:
+        """Забронювати токен наперед; повертає, скільки чекати до нього.
+
+        Баланс може піти в мінус — наступні бронювання стають у чергу за ним,
+        тож запити до одного чату виходять у порядку надходження.
+        """
+        self._refill(now)
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def is_idle(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class OutboundRateLimiter(BaseRateLimiter[Dict[str, Any]]):
+    def __init__(
+        self,
+        overall_rate: float = 30.0,
+        overall_burst: float = 10.0,
+        private_rate: float = 1.0,
+        private_burst: float = 3.0,
+        group_rate: float = 20 / 60,
+        group_burst: float = 5.0,
+        max_retries: int = 3,
+        max_chat_buckets: int = 5000,
+    ):
+        self._overall = TokenBucket(overall_rate, overall_burst)
+        self._private = (private_rate, private_burst)
+        self._group = (group_rate, group_burst)
+        self._max_retries = max(0, int(max_retries))
+        self._max_chat_buckets = max(1, int(max_chat_buckets))
+        self._chats: Dict[Union[int, str], TokenBucket] = {}
+        self._heap: list[tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._paused_until = 0.0
+        # Метрики
+        self._chat_waiting = 0
+        self._waits = {p: deque(maxlen=1000) for p in _PRIORITY_NAMES}
+        self._sent = {p: 0 for p in _PRIORITY_NAMES}
+        self._retries = 0
+        self._retry_after_total = 0.0
+
+    async def initialize(self) -> None:
+        self._wakeup = asyncio.Event()
+        self._dispatcher = asyncio.create_task(self._dispatch(), name="outbound-dispatcher")
+
+    async def shutdown(self) -> None:
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            try:
+                await self._dispatcher
+            except asyncio.CancelledError:
+                pass
+            self._dispatcher = None
+        while self._heap:
+            _, _, fut = heapq.heappop(self._heap)
+            if not fut.done():
+                fut.cancel()
+
+    # ----- глобальна пріоритетна черга -----
+
+    async def _dispatch(self):
+        while True:
+            if not self._heap:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            now = time.monotonic()
+            delay = max(self._paused_until - now, self._overall.wait_time(now))
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            _, _, fut = heapq.heappop(self._heap)
+            if fut.done():
+                # Запит скасували, поки він стояв у черзі
+                continue
+            self._overall.take(now)
+            fut.set_result(None)
+
+    async def _acquire_overall(self, priority: int):
+        if self._dispatcher is None:
+            # Ліміт ще не ініціалізовано (виклик поза Application) — не блокуємо
+            return
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._heap, (priority, next(self._seq), fut))
+        self._wakeup.set()
+        await fut
+
+    # ----- ліміти на чат -----
+
+    def _chat_bucket(self, chat_id: Union[int, str]) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= self._max_chat_buckets:
+                self._prune_chat_buckets()
+            is_group = isinstance(chat_id, str) or chat_id < 0
+            bucket = self._chats[chat_id] = TokenBucket(*(self._group if is_group else self._private))
+        return bucket
+
+    def _prune_chat_buckets(self):
+        now = time.monotonic()
+        for chat_id in [c for c, b in self._chats.items() if b.is_idle(now)]:
+            del self._chats[chat_id]
+
+    @staticmethod
+    def _chat_id(data: Dict[str, Any]) -> Optional[Union[int, str]]:
+        chat_id = data.get("chat_id")
+        if chat_id is None:
+            return None
+        try:
+            return int(chat_id)
+        except (TypeError, ValueError):
+            return str(chat_id)
+
+    @staticmethod
+    def _is_chat_limited(endpoint: str) -> bool:
+        return endpoint.lower().startswith(_CHAT_LIMITED_PREFIXES)
+
+    # ----- BaseRateLimiter -----
+
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, Union[bool, Dict[str, Any], list[Dict[str, Any]]]]],
+        args: Any,
+        kwargs: Dict[str, Any],
+        endpoint: str,
+        data: Dict[str, Any],
+        rate_limit_args: Optional[Dict[str, Any]],
+    ) -> Union[bool, Dict[str, Any], list[Dict[str, Any]]]:
+        priority = int((rate_limit_args or INTERACTIVE).get("priority", 0))
+        priority = priority if priority in _PRIORITY_NAMES else 1
+        chat_id = self._chat_id(data)
+        started = time.monotonic()
+
+        if chat_id is not None and self._is_chat_limited(endpoint):
+            wait = self._chat_bucket(chat_id).reserve(started)
+            if wait > 0:
+                self._chat_waiting += 1
+                try:
+                    await asyncio.sleep(wait)
+                finally:
+                    self._chat_waiting -= 1
+        await self._acquire_overall(priority)
+        self._waits[priority].append(time.monotonic() - started)
+
+        attempt = 0
+        while True:
+            try:
+                result = await callback(*args, **kwargs)
+                self._sent[priority] += 1
+                return result
+            except RetryAfter as e:
+                if attempt >= self._max_retries:
+                    raise
+                attempt += 1
+                retry_after = e.retry_after
+                delay = retry_after.total_seconds() if isinstance(retry_after, timedelta) else float(retry_after)
+                self._retries += 1
+                self._retry_after_total += delay
+                logger.warning(
+                    f"Flood control на {endpoint} (chat {chat_id}): пауза {delay:g} с, спроба {attempt}/{self._max_retries}"
+                )
+                # Ліміт рахується на бота, тож пауза стосується всієї черги
+                self._paused_until = max(self._paused_until, time.monotonic() + delay)
+                await asyncio.sleep(delay)
+                await self._acquire_overall(priority)
+
+    def stats(self) -> dict[str, Any]:
+        waits = {}
+        for priority, name in _PRIORITY_NAMES.items():
+            samples = sorted(self._waits[priority])
+            waits[name] = {
+                "sent": self._sent[priority],
+                "avg_wait": (sum(samples) / len(samples)) if samples else 0.0,
+                "p95_wait": samples[min(len(samples) - 1, int(len(samples) * 0.95))] if samples else 0.0,
+                "max_wait": samples[-1] if samples else 0.0,
+            }
+        return {
+            "queued": len(self._heap),
+            "waiting_chat": self._chat_waiting,
+            "chat_buckets": len(self._chats),
+            "retries": self._retries,
+            "retry_after_total": self._retry_after_total,
+            "paused_for": max(0.0, self._paused_until - time.monotonic()),
+            **waits,
+        }
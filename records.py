@@ -0,0 +1,34 @@
+"""Компактні записи стану користувачів (замість dict з повним telegram.User).
+
+Зберігаються в StateDict як є: state_store кодує їх у JSON за іменем класу.
+"""
+
+from typing import Optional
+
+from telegram import User
+
+from state_store import StateRecord
+
+
+class UserRef(StateRecord):
+    """Те, що боту потрібно знати про користувача Telegram поза апдейтом."""
+
+    __slots__ = ("id", "first_name", "last_name", "username")
+
+    @classmethod
+    def from_user(cls, user: User) -> "UserRef":
+        return cls(id=user.id, first_name=user.first_name, last_name=user.last_name, username=user.username)
+
+    @property
+    def full_name(self) -> str:
+        return f"{self.first_name or ''} {self.last_name or ''}".strip()
+
+
+class ApplicationDraft(StateRecord):
+    """Анкета на доступ, яку користувач ще заповнює."""
+
+    __slots__ = ("user", "name", "npu_department", "rank", "image_urls", "step")
+
+    @classmethod
+    def start(cls, user: User, step: str, name: Optional[str] = None) -> "ApplicationDraft":
+        return cls(user=UserRef.from_user(user), name=name, image_urls=[], step=step)
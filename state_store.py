@@ -0,0 +1,363 @@
+"""Стан бота, що переживає перезапуск: словники поверх таблиці state_store.
+
+StateDict поводиться як звичайний dict (PENDING_REQUESTS, USER_APPLICATIONS
+тощо), але:
+
+* усі простори імен завантажуються під час запуску (StateStore.load_async у
+  пулі читачів db_async), а кожне значення розбирається з JSON лише тоді,
+  коли його справді читають; простір, створений пізніше, читається з БД
+  синхронно при першому зверненні — із попередженням у журналі;
+* зміни не пишуться одразу: ключі, які змінювали або просто читали (значення
+  могли змінити «всередині» — user_data['step'] = ...), запам'ятовуються, а
+  StateStore.flush() кодує їх, порівнює з уже збереженим JSON і пише в БД
+  лише те, що відрізняється, однією транзакцією на всі простори імен.
+
+flush викликається періодичною задачею і при зупинці бота.
+
+Для незавершених сценаріїв (анкета, заяви на модерації) простір імен можна
+обмежити: ttl — ключ, якого не читали й не змінювали ttl секунд, видаляє
+sweep(); maxsize — понад цю кількість ключів витісняється найдавніший. Такі
+видалення потрапляють у БД з найближчим flush, як і звичайні.
+
+Значення — JSON; крім звичайних типів зберігаються telegram.User і записи
+StateRecord (класи з __slots__, компактніші за dict з повним User).
+"""
+
+import asyncio
+import json
+import logging
+import sys
+import time
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from typing import Any, Callable, Dict, Hashable, Iterator, Optional
+
+from telegram import User
+
+import db
+import db_async
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+_RECORD_TYPES: Dict[str, type] = {}
+
+
+class StateRecord:
+    """Базовий клас записів стану: поля — __slots__ підкласу, у JSON — словник полів."""
+
+    __slots__ = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        _RECORD_TYPES[cls.__name__] = cls
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            setattr(self, name, fields.pop(name, None))
+        if fields:
+            raise TypeError(f"{type(self).__name__}: невідомі поля {sorted(fields)}")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __eq__(self, other: object) -> bool:
+        return type(other) is type(self) and self.to_dict() == other.to_dict()
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+
+def _encode_default(obj: Any) -> Any:
+    if isinstance(obj, StateRecord):
+        return {"__type__": type(obj).__name__, "data": obj.to_dict()}
+    if isinstance(obj, User):
+        return {"__type__": "tg.User", "data": obj.to_dict()}
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _decode_hook(obj: Dict[str, Any]) -> Any:
+    kind = obj.get("__type__")
+    if kind is None:
+        return obj
+    if kind == "tg.User":
+        return User.de_json(obj["data"], None)
+    record_type = _RECORD_TYPES.get(kind)
+    if record_type is not None:
+        return record_type(**obj["data"])
+    return obj
+
+
+def encode_value(value: Any) -> str:
+    return json.dumps(value, default=_encode_default, ensure_ascii=False, separators=(",", ":"))
+
+
+def decode_value(raw: str) -> Any:
+    return json.loads(raw, object_hook=_decode_hook)
+
+
+def approx_size(obj: Any, _depth: int = 0) -> int:
+    """Приблизний розмір значення в пам'яті (sys.getsizeof з вкладеними контейнерами)."""
+    size = sys.getsizeof(obj)
+    if _depth > 4:
+        return size
+    if isinstance(obj, dict):
+        size += sum(approx_size(k, _depth + 1) + approx_size(v, _depth + 1) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(approx_size(v, _depth + 1) for v in obj)
+    elif isinstance(obj, StateRecord):
+        size += sum(approx_size(getattr(obj, name), _depth + 1) for name in obj.__slots__)
+    return size
+
+
+class StateDict(MutableMapping):
+    def __init__(
+        self,
+        namespace: str,
+        loader: Callable[[str], Dict[str, str]],
+        ttl: Optional[float] = None,
+        maxsize: Optional[int] = None,
+    ):
+        self.namespace = namespace
+        self._loader = loader
+        self.ttl = ttl
+        self.maxsize = maxsize
+        # Час останнього звернення до ключа, від найдавнішого (лише якщо задано ttl/maxsize)
+        self._seen: Optional[OrderedDict] = OrderedDict() if ttl or maxsize else None
+        self.expired = 0
+        self.evicted = 0
+        # Останній збережений JSON кожного ключа; None — простір ще не завантажено
+        self._raw: Optional[Dict[Hashable, str]] = None
+        self._values: Dict[Hashable, Any] = {}
+        self._touched: set = set()
+        # Ключі, зачеплені до попереднього flush: обробник міг тримати посилання
+        # на значення через await і змінити його вже після того flush
+        self._recent: set = set()
+        self._deleted: set = set()
+
+    @property
+    def loaded(self) -> bool:
+        return self._raw is not None
+
+    def _load(self, rows: Dict[str, str], started: float):
+        self._raw = {json.loads(k): v for k, v in rows.items()}
+        if self._seen is not None:
+            # Після перезапуску відлік ttl починається заново
+            now = time.monotonic()
+            self._seen.update((key, now) for key in self._raw)
+        if self._raw:
+            logger.info(
+                f"Стан '{self.namespace}': відновлено {len(self._raw)} записів "
+                f"за {(time.perf_counter() - started) * 1000:.1f} мс"
+            )
+
+    def _ensure_loaded(self) -> Dict[Hashable, str]:
+        if self._raw is None:
+            # Запасний шлях: простори імен мав завантажити StateStore.load_async
+            logger.warning(f"Стан '{self.namespace}' не завантажено заздалегідь — читаємо з БД у циклі подій")
+            self._load(self._loader(self.namespace), time.perf_counter())
+        return self._raw
+
+    def __getitem__(self, key: Hashable) -> Any:
+        raw = self._ensure_loaded()
+        value = self._values.get(key, _MISSING)
+        if value is _MISSING:
+            if key not in raw:
+                raise KeyError(key)
+            value = self._values[key] = decode_value(raw[key])
+        self._touched.add(key)
+        self._seen_now(key)
+        return value
+
+    def __setitem__(self, key: Hashable, value: Any):
+        self._ensure_loaded()
+        self._values[key] = value
+        self._touched.add(key)
+        self._deleted.discard(key)
+        if self._seen is not None:
+            self._seen_now(key)
+            if self.maxsize:
+                while len(self._seen) > self.maxsize:
+                    oldest = next(iter(self._seen))
+                    del self[oldest]
+                    self.evicted += 1
+
+    def _seen_now(self, key: Hashable):
+        if self._seen is not None:
+            self._seen[key] = time.monotonic()
+            self._seen.move_to_end(key)
+
+    def __delitem__(self, key: Hashable):
+        raw = self._ensure_loaded()
+        in_values = self._values.pop(key, _MISSING) is not _MISSING
+        in_raw = raw.pop(key, _MISSING) is not _MISSING
+        if not (in_values or in_raw):
+            raise KeyError(key)
+        self._touched.discard(key)
+        self._recent.discard(key)
+        if self._seen is not None:
+            self._seen.pop(key, None)
+        # Видаляємо з БД навіть якщо ключ ще не встиг туди потрапити: його upsert міг бути вже в дорозі
+        self._deleted.add(key)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._values or key in self._ensure_loaded()
+
+    def __iter__(self) -> Iterator[Hashable]:
+        raw = self._ensure_loaded()
+        yield from list(self._values)
+        yield from [k for k in raw if k not in self._values]
+
+    def __len__(self) -> int:
+        raw = self._ensure_loaded()
+        return len(raw) + sum(1 for k in self._values if k not in raw)
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """Видалити ключі, до яких не звертались довше за ttl. Повертає кількість."""
+        if not self.ttl or self._raw is None:
+            return 0
+        deadline = (time.monotonic() if now is None else now) - self.ttl
+        removed = 0
+        while self._seen:
+            key, seen = next(iter(self._seen.items()))
+            if seen > deadline:
+                break
+            del self[key]
+            removed += 1
+        self.expired += removed
+        return removed
+
+    def approx_bytes(self) -> int:
+        if self._raw is None:
+            return 0
+        size = sum(approx_size(value) for value in self._values.values())
+        size += sum(sys.getsizeof(raw) for key, raw in self._raw.items() if key not in self._values)
+        return size
+
+    def _collect(self) -> tuple[Dict[Hashable, str], set]:
+        if self._raw is None:
+            return {}, set()
+        touched = self._touched | self._recent
+        self._recent, self._touched = self._touched, set()
+        deleted, self._deleted = self._deleted, set()
+        upserts = {}
+        for key in touched:
+            value = self._values.get(key, _MISSING)
+            if value is _MISSING:
+                continue
+            encoded = encode_value(value)
+            if self._raw.get(key) != encoded:
+                upserts[key] = encoded
+        return upserts, deleted
+
+    def _commit(self, upserts: Dict[Hashable, str]):
+        for key, encoded in upserts.items():
+            # Ключ могли видалити, поки йшов запис — тоді його видалить наступний flush
+            if key in self._values:
+                self._raw[key] = encoded
+
+    def _rollback(self, upserts: Dict[Hashable, str], deleted: set):
+        self._touched.update(k for k in upserts if k in self._values)
+        self._deleted.update(k for k in deleted if k not in self._values)
+
+
+class StateStore:
+    def __init__(
+        self,
+        loader: Callable[[str], Dict[str, str]] = db.load_state,
+        saver: Callable[[list, list], None] = db.save_state,
+    ):
+        self._loader = loader
+        self._saver = saver
+        self._dicts: Dict[str, StateDict] = {}
+        self.flushes = 0
+        self.rows_written = 0
+        self.last_flush_ms = 0.0
+
+    def namespace(self, namespace: str, ttl: Optional[float] = None, maxsize: Optional[int] = None) -> StateDict:
+        state = self._dicts.get(namespace)
+        if state is None:
+            state = self._dicts[namespace] = StateDict(namespace, self._loader, ttl=ttl, maxsize=maxsize)
+        return state
+
+    async def load_async(self) -> int:
+        """Завантажити всі ще не завантажені простори імен у пулі читачів db_async.
+
+        Викликається під час запуску бота, до обробки апдейтів. Повертає кількість записів.
+        """
+        pending = [state for state in self._dicts.values() if not state.loaded]
+        started = time.perf_counter()
+        results = await asyncio.gather(*(db_async.run_read(self._loader, state.namespace) for state in pending))
+        for state, rows in zip(pending, results):
+            # Простір могли встигнути прочитати синхронно, поки йшло завантаження
+            if not state.loaded:
+                state._load(rows, started)
+        return sum(len(rows) for rows in results)
+
+    def sweep(self) -> int:
+        """Прибрати прострочені ключі в усіх просторах імен з ttl."""
+        return sum(state.sweep() for state in self._dicts.values())
+
+    def _collect(self):
+        batch = [(state, *state._collect()) for state in self._dicts.values()]
+        upserts = [
+            (state.namespace, json.dumps(key), encoded)
+            for state, changed, _ in batch
+            for key, encoded in changed.items()
+        ]
+        deletes = [(state.namespace, json.dumps(key)) for state, _, deleted in batch for key in deleted]
+        return batch, upserts, deletes
+
+    def _finish(self, batch, rows: int, started: float, ok: bool):
+        for state, changed, deleted in batch:
+            if ok:
+                state._commit(changed)
+            else:
+                state._rollback(changed, deleted)
+        if ok:
+            self.flushes += 1
+            self.rows_written += rows
+            self.last_flush_ms = (time.perf_counter() - started) * 1000
+
+    def flush(self) -> int:
+        """Синхронно записати зміни (для зупинки бота). Повертає кількість рядків."""
+        started = time.perf_counter()
+        batch, upserts, deletes = self._collect()
+        if not upserts and not deletes:
+            return 0
+        try:
+            self._saver(upserts, deletes)
+        except Exception:
+            self._finish(batch, 0, started, ok=False)
+            raise
+        self._finish(batch, len(upserts) + len(deletes), started, ok=True)
+        return len(upserts) + len(deletes)
+
+    async def flush_async(self) -> int:
+        """Те саме, але запис іде в потоці-писачі db_async, не блокуючи цикл подій."""
+        started = time.perf_counter()
+        batch, upserts, deletes = self._collect()
+        if not upserts and not deletes:
+            return 0
+        try:
+            await db_async.run_write(self._saver, upserts, deletes)
+        except Exception:
+            self._finish(batch, 0, started, ok=False)
+            raise
+        self._finish(batch, len(upserts) + len(deletes), started, ok=True)
+        return len(upserts) + len(deletes)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "namespaces": {name: len(state) for name, state in self._dicts.items() if state.loaded},
+            "bytes": {name: state.approx_bytes() for name, state in self._dicts.items() if state.loaded},
+            "expired": sum(state.expired for state in self._dicts.values()),
+            "evicted": sum(state.evicted for state in self._dicts.values()),
+            "flushes": self.flushes,
+            "rows_written": self.rows_written,
+            "last_flush_ms": self.last_flush_ms,
+        }
@@ -0,0 +1,23 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# db.py читає шлях до БД під час імпорту — до імпорту він має вказувати на тимчасовий каталог
+os.environ.setdefault("DB_PATH", os.path.join(tempfile.mkdtemp(prefix="npu03bot-tests-"), "bot.db"))
+
+import db  # noqa: E402
+
+
+@pytest.fixture
+def fresh_db(tmp_path, monkeypatch):
+    """Порожня БД з актуальною схемою в tmp_path; пул з'єднань — лише для цього тесту."""
+    db.close_db()
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "bot.db"))
+    monkeypatch.setattr(db, "ARCHIVE_DIR", str(tmp_path / "archive"))
+    db.init_db()
+    yield db
+    db.close_db()
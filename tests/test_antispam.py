@@ -0,0 +1,61 @@
+"""Антиспам: пакетний запис подій і граничні випадки GCRA."""
+
+import asyncio
+import threading
+
+import db_async
+from antispam import AntiSpam, GcraLimiter
+
+
+def test_flush_async_writes_batch_on_writer(fresh_db, monkeypatch):
+    writer_threads = []
+    log_events = fresh_db.log_antispam_events
+
+    def traced(events):
+        writer_threads.append((threading.get_ident(), len(events)))
+        return log_events(events)
+
+    monkeypatch.setattr(fresh_db, "log_antispam_events", traced)
+    monkeypatch.setattr(db_async, "log_antispam_events", db_async._writer_method(traced))
+
+    spam = AntiSpam(message_limit=1, message_window=60)
+    for user_id in (1, 2, 3):
+        spam.check(user_id, "message", now=0.0)
+        spam.check(user_id, "message", now=0.0)
+    assert asyncio.run(spam.flush_async()) == 3
+
+    # Одна пачка, і не в потоці циклу подій
+    assert len(writer_threads) == 1 and writer_threads[0][1] == 3
+    assert writer_threads[0][0] != threading.get_ident()
+    with fresh_db.get_conn() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM antispam_events").fetchone()[0] == 3
+    assert spam.stats()["pending_events"] == 0
+
+
+def test_failed_flush_keeps_events(fresh_db, monkeypatch):
+    async def broken(events):
+        raise RuntimeError("disk full")
+
+    monkeypatch.setattr(db_async, "log_antispam_events", broken)
+    spam = AntiSpam(message_limit=1, message_window=60)
+    spam.check(1, "message", now=0.0)
+    spam.check(1, "message", now=0.0)
+    try:
+        asyncio.run(spam.flush_async())
+    except RuntimeError:
+        pass
+    assert spam.stats()["pending_events"] == 1
+    assert spam.flush() == 1
+
+
+def test_gcra_zero_window_and_single_key():
+    unlimited = GcraLimiter(limit=5, window=0)
+    assert all(unlimited.hit(1, now=float(i)) == 0.0 for i in range(100))
+    assert len(unlimited) == 0
+
+    # Витіснення з порожнього словника (або спорожнілого після першого видалення)
+    limiter = GcraLimiter(limit=1, window=1)
+    limiter._evict(0.0)
+    limiter._tat[1] = 0.0
+    limiter._evict(5.0)
+    assert len(limiter) == 0
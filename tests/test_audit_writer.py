@@ -0,0 +1,43 @@
+import threading
+
+import db as db_module
+
+
+def _count(db, table):
+    with db.get_conn() as conn:
+        return conn.execute(f"SELECT count(*) FROM {table}").fetchone()[0]
+
+
+def test_bad_row_does_not_drop_rest_of_batch(fresh_db, caplog):
+    db = fresh_db
+    writer = db_module._AuditWriter(flush_ms=1, batch_size=10, queue_max=10, policy="block", block_timeout_ms=10)
+    now = db_module._utc_now_text()
+    batch = [
+        ("action_logs", (1, "a", "ok", None, None, None, now)),
+        ("antispam_events", (1, "bogus", 1.0, now)),  # CHECK(kind IN ...) не пропустить
+        ("antispam_events", (2, "message", 1.0, now)),
+        ("action_logs", (2, "b", "ok", None, None, None, now)),
+    ]
+    writer._flush(batch)
+    assert _count(db, "action_logs") == 2
+    assert _count(db, "antispam_events") == 1
+    stats = writer.snapshot()
+    assert stats["written"] == 3
+    assert stats["failed"] == 1
+    assert any("bogus" in r.getMessage() for r in caplog.records)
+
+
+def test_stats_counters_are_consistent_across_threads():
+    writer = db_module._AuditWriter(flush_ms=1, batch_size=10, queue_max=10, policy="drop", block_timeout_ms=10)
+
+    def bump():
+        for _ in range(10000):
+            writer._count(enqueued=1, dropped=1)
+
+    threads = [threading.Thread(target=bump) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    stats = writer.snapshot()
+    assert stats["enqueued"] == stats["dropped"] == 40000
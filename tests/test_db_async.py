@@ -0,0 +1,50 @@
+import asyncio
+import threading
+import time
+
+import db_async
+
+SLOW_WRITE = 1.0
+
+
+def test_loop_and_reads_progress_while_slow_write_in_flight(fresh_db):
+    db = fresh_db
+    db.upsert_profile(telegram_id=1, username="reader")
+    started = threading.Event()
+
+    def slow_write():
+        # Тримає транзакцію запису (і потік-писач) секунду, як повільний fsync
+        with db.get_conn() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("INSERT INTO action_logs (actor_id, action) VALUES (1, 'slow')")
+            started.set()
+            time.sleep(SLOW_WRITE)
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        write = asyncio.create_task(db_async.run_write(slow_write))
+        assert await loop.run_in_executor(None, started.wait, 5)
+
+        # Цикл подій не стоїть: 20 тиків по 10 мс укладаються в межі
+        gaps = []
+        last = time.perf_counter()
+        for _ in range(20):
+            await asyncio.sleep(0.01)
+            now = time.perf_counter()
+            gaps.append(now - last)
+            last = now
+        assert max(gaps) < 0.1
+
+        # Читання йдуть своїм пулом потоків і не чекають на запис
+        t = time.perf_counter()
+        images = await asyncio.wait_for(db_async.get_profile_images(1), timeout=0.5)
+        logs = await asyncio.wait_for(db_async.query_action_logs(limit=5), timeout=0.5)
+        assert time.perf_counter() - t < 0.5
+        assert images == []
+        assert logs == []  # незафіксований запис ще не видно
+
+        assert not write.done()
+        await write
+        assert [r["action"] for r in await db_async.query_action_logs(limit=5)] == ["slow"]
+
+    asyncio.run(scenario())
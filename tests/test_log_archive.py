@@ -0,0 +1,39 @@
+"""Каталог архіву журналів рахує кожну перенесену строку рівно один раз."""
+
+import os
+import sqlite3
+
+
+def _insert_old_actions(db, rows):
+    with db.get_conn() as conn:
+        conn.executemany(
+            "INSERT INTO action_logs (id, actor_id, action, created_at, created_ts) "
+            "VALUES (?, 1, 'approve', '2020-03-05 10:00:00', CAST(strftime('%s', '2020-03-05 10:00:00') AS INTEGER))",
+            [(row_id,) for row_id in rows],
+        )
+
+
+def test_replayed_batch_is_counted_in_catalog(fresh_db):
+    _insert_old_actions(fresh_db, [1, 2, 3])
+    assert fresh_db.archive_logs_batch() == 3
+    assert [(a["table_name"], a["rows"]) for a in fresh_db.list_archives()] == [("action_logs", 3)]
+
+    # Збій між копіюванням в архів і видаленням з основної БД: строки вже в
+    # архівному файлі, але ще в основній таблиці, а каталог не оновлено
+    with fresh_db.get_conn() as conn:
+        conn.execute("DELETE FROM log_archives")
+    _insert_old_actions(fresh_db, [1, 2, 3])
+
+    assert fresh_db.archive_logs_batch() == 3
+    assert [(a["table_name"], a["rows"]) for a in fresh_db.list_archives()] == [("action_logs", 3)]
+    with fresh_db.get_conn() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM action_logs").fetchone()[0] == 0
+    archive = sqlite3.connect(os.path.join(fresh_db.ARCHIVE_DIR, "logs_2020-03.db"))
+    try:
+        assert archive.execute("SELECT COUNT(*) FROM action_logs").fetchone()[0] == 3
+    finally:
+        archive.close()
+    # Архівні строки видно в запитах журналу
+    assert len(fresh_db.query_action_logs(limit=10, actor_id=1)) == 3
+    assert len(fresh_db.query_action_logs(limit=10, date_from="2020-03-05", date_to="2020-03-05")) == 3
+    assert fresh_db.query_action_logs(limit=10, date_from="2020-03-06") == []
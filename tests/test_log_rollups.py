@@ -0,0 +1,14 @@
+"""Зведення журналів, які ведуть тригери, збігаються з перерахунком із сирих рядків."""
+
+
+def test_rollups_match_rows_without_created_at(fresh_db):
+    with fresh_db.get_conn() as conn:
+        conn.execute("INSERT INTO action_logs (actor_id, action, created_at) VALUES (1, 'approve', NULL)")
+        conn.execute("INSERT INTO action_logs (actor_id, action, created_at) VALUES (1, NULL, '2026-01-02 10:00:00')")
+        conn.execute("INSERT INTO antispam_events (user_id, kind, created_at) VALUES (7, 'message', NULL)")
+    assert fresh_db.check_log_rollups() == {"action_log_rollups": 0, "antispam_rollups": 0, "antispam_user_rollups": 0}
+
+    fresh_db.rebuild_log_rollups()
+    assert fresh_db.check_log_rollups() == {"action_log_rollups": 0, "antispam_rollups": 0, "antispam_user_rollups": 0}
+    with fresh_db.get_conn() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM action_log_rollups WHERE bucket IS NULL").fetchone()[0] == 0
@@ -0,0 +1,35 @@
+"""Ліміт на чат стосується лише повідомлень, а не службових викликів з chat_id."""
+
+import asyncio
+import time
+
+from outbound import OutboundRateLimiter
+
+
+async def _elapsed(limiter: OutboundRateLimiter, endpoint: str, chat_id: int, calls: int) -> float:
+    async def callback():
+        return True
+
+    started = time.monotonic()
+    for _ in range(calls):
+        await limiter.process_request(callback, (), {}, endpoint, {"chat_id": chat_id}, None)
+    return time.monotonic() - started
+
+
+def test_chat_bucket_only_for_messages():
+    async def scenario():
+        limiter = OutboundRateLimiter(
+            overall_rate=1000.0, overall_burst=100.0,
+            private_rate=10.0, private_burst=1.0, group_rate=10.0, group_burst=1.0,
+        )
+        await limiter.initialize()
+        try:
+            for endpoint in ("getChatMember", "createChatInviteLink", "revokeChatInviteLink", "banChatMember", "unbanChatMember"):
+                assert await _elapsed(limiter, endpoint, -100, 5) < 0.05, endpoint
+            for endpoint in ("sendMessage", "copyMessage", "forwardMessage"):
+                # 1 токен у запасі, далі 10/с: четвертий виклик чекає ~0.3 с
+                assert await _elapsed(limiter, endpoint, 1000, 4) >= 0.25, endpoint
+        finally:
+            await limiter.shutdown()
+
+    asyncio.run(scenario())
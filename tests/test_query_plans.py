@@ -0,0 +1,80 @@
+"""Гарячі запити db.py мають іти через індекси: EXPLAIN QUERY PLAN кожного
+виконаного ними оператора не повинен містити повного сканування таблиці."""
+
+import pytest
+
+import db as db_module
+
+
+@pytest.fixture
+def traced(fresh_db, monkeypatch):
+    """Збирає SQL (з підставленими параметрами), виконаний на нових з'єднаннях пулу."""
+    statements: list[str] = []
+    apply_pragmas = db_module._apply_pragmas
+
+    def apply_and_trace(conn):
+        apply_pragmas(conn)
+        conn.set_trace_callback(statements.append)
+
+    monkeypatch.setattr(db_module, "_apply_pragmas", apply_and_trace)
+    db_module.close_db()
+    yield statements
+    db_module.close_db()
+
+
+# Дозволені повні проходи: частковий індекс черги заявок містить лише рядки
+# status = 'pending', тож його обхід не залежить від розміру таблиці
+ALLOWED_SCANS = {
+    "SCAN promotion_requests USING COVERING INDEX idx_promotion_pending",
+}
+
+
+def _full_scans(db, sql: str) -> list[str]:
+    with db.get_conn() as conn:
+        plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall()]
+    # SCAN (subquery-N) / SCAN CONSTANT ROW — проходи по вже відібраних рядках, а не по таблиці
+    return [
+        step for step in plan
+        if step.startswith("SCAN ") and not step.startswith(("SCAN (", "SCAN CONSTANT ROW"))
+        and step not in ALLOWED_SCANS
+    ]
+
+
+HOT_QUERIES = {
+    "query_action_logs actor_id": lambda db: db.query_action_logs(limit=20, actor_id=42),
+    "query_action_logs action": lambda db: db.query_action_logs(limit=20, action="approve"),
+    "query_action_logs actor_username": lambda db: db.query_action_logs(limit=20, actor_username="@Someone"),
+    "query_action_logs date range": lambda db: db.query_action_logs(limit=20, date_from="2026-01-01", date_to="2026-01-31"),
+    "query_antispam_top": lambda db: db.query_antispam_top(days=7),
+    "query_antispam_top kind": lambda db: db.query_antispam_top(days=7, kind="message"),
+    "decide_access_application": lambda db: db.decide_access_application(42, "approved", 1, "admin", None),
+    "get_profile_by_username": lambda db: db.get_profile_by_username("@NotCached"),
+    "get_pending_promotion_requests": lambda db: db.get_pending_promotion_requests(),
+}
+
+
+@pytest.mark.parametrize("name", list(HOT_QUERIES))
+def test_hot_query_uses_indexes(traced, fresh_db, name):
+    HOT_QUERIES[name](fresh_db)
+    statements = [
+        sql for sql in traced
+        if sql.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE", "WITH"))
+        # Службові запити до каталогу схеми не є частиною гарячого шляху
+        and "sqlite_master" not in sql
+    ]
+    assert statements, f"{name}: жодного запиту не виконано"
+    for sql in statements:
+        assert not _full_scans(fresh_db, sql), f"{name}: повне сканування в плані для\n{sql}"
+
+
+def test_date_filtered_page_is_rowid_seek(traced, fresh_db):
+    """Перша сторінка з from=/to= не сортує весь діапазон: пошук за id без TEMP B-TREE."""
+    fresh_db.query_action_logs(limit=20, date_from="2026-01-01", date_to="2026-02-14")
+    fresh_db.query_action_logs(limit=20, date_from="2026-01-01", date_to="2026-02-14", actor_id=42)
+    pages = [sql for sql in traced if "ORDER BY id" in sql]
+    assert len(pages) == 2
+    for sql in pages:
+        with fresh_db.get_conn() as conn:
+            plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall()]
+        assert not [step for step in plan if "TEMP B-TREE" in step], plan
+        assert not [step for step in plan if "idx_action_logs_created_ts" in step], plan
@@ -0,0 +1,94 @@
+"""StateStore: завантаження під час запуску, прибирання за ttl/maxsize і кодування записів."""
+
+import asyncio
+import logging
+import threading
+import time
+from types import SimpleNamespace
+
+from telegram import User
+
+import state_store
+from records import ApplicationDraft, UserRef
+from state_store import StateStore, decode_value, encode_value
+
+
+def test_load_async_preloads_namespaces_off_loop(fresh_db, caplog):
+    fresh_db.save_state([("drafts", '"1"', '{"step":"name"}'), ("pending", "2", "[1,2]")], [])
+    loader_threads = []
+
+    def loader(namespace):
+        loader_threads.append(threading.get_ident())
+        return fresh_db.load_state(namespace)
+
+    store = StateStore(loader=loader, saver=fresh_db.save_state)
+    drafts = store.namespace("drafts", ttl=60)
+    pending = store.namespace("pending")
+
+    assert asyncio.run(store.load_async()) == 2
+    assert loader_threads and threading.get_ident() not in loader_threads
+
+    with caplog.at_level(logging.WARNING, logger="state_store"):
+        assert drafts["1"] == {"step": "name"}
+        assert pending[2] == [1, 2]
+    assert not caplog.records
+
+
+def test_late_namespace_falls_back_to_sync_load(fresh_db, caplog):
+    fresh_db.save_state([("late", '"k"', "1")], [])
+    store = StateStore()
+    with caplog.at_level(logging.WARNING, logger="state_store"):
+        assert store.namespace("late")["k"] == 1
+    assert any("late" in r.getMessage() for r in caplog.records)
+
+
+def test_sweep_drops_idle_keys_and_deletes_them_on_flush(fresh_db, monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(state_store, "time", SimpleNamespace(monotonic=lambda: clock[0], perf_counter=time.perf_counter))
+    fresh_db.save_state([("drafts", '"old"', "1")], [])
+    store = StateStore()
+    drafts = store.namespace("drafts", ttl=60)
+    asyncio.run(store.load_async())
+    drafts["fresh"] = 2
+    store.flush()
+
+    # «old» не чіпали з моменту завантаження, «fresh» прочитали через 45 с
+    clock[0] += 45
+    assert drafts["fresh"] == 2
+    clock[0] += 30
+    assert drafts.sweep() == 1
+    assert "old" not in drafts and drafts["fresh"] == 2
+    assert drafts.expired == 1
+
+    # Видалення потрапляє в БД лише з найближчим flush
+    assert fresh_db.load_state("drafts") == {'"old"': "1", '"fresh"': "2"}
+    assert store.flush() == 1
+    assert fresh_db.load_state("drafts") == {'"fresh"': "2"}
+
+
+def test_maxsize_evicts_least_recently_accessed(fresh_db):
+    store = StateStore()
+    drafts = store.namespace("drafts", maxsize=2)
+    asyncio.run(store.load_async())
+    drafts["a"] = 1
+    drafts["b"] = 2
+    assert drafts["a"] == 1  # «a» тепер свіжіший за «b»
+    drafts["c"] = 3
+
+    assert sorted(drafts) == ["a", "c"]
+    assert drafts.evicted == 1
+    store.flush()
+    assert fresh_db.load_state("drafts") == {'"a"': "1", '"c"': "3"}
+
+
+def test_application_draft_roundtrip_keeps_nested_user_ref():
+    user = User(id=5, first_name="Іван", is_bot=False, last_name="Петренко", username="ivan")
+    draft = ApplicationDraft.start(user, step="name")
+    draft.image_urls.append("https://example.com/a.jpg")
+
+    decoded = decode_value(encode_value({"draft": draft}))["draft"]
+    assert isinstance(decoded, ApplicationDraft)
+    assert isinstance(decoded.user, UserRef)
+    assert decoded == draft
+    assert decoded.user.full_name == "Іван Петренко"
+    assert decoded.image_urls == ["https://example.com/a.jpg"]
@@ -0,0 +1,69 @@
+"""Webhook відповідає 503, коли в роботі вже max_queue апдейтів, навіть якщо
+обробник апдейтів одразу забирає їх з update_queue."""
+
+import asyncio
+from types import SimpleNamespace
+
+from aiohttp.test_utils import TestClient, TestServer
+
+from update_processor import KeyedUpdateProcessor
+from webhook import SECRET_HEADER, WebhookServer
+
+
+async def _fetch_updates(application, release: asyncio.Event, tasks: set):
+    # Як Application._update_fetcher при concurrent_updates > 1: задача на кожен апдейт одразу
+    async def handle():
+        await release.wait()
+
+    while True:
+        update = await application.update_queue.get()
+        task = asyncio.create_task(application.update_processor.process_update(update, handle()))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+
+def test_webhook_rejects_when_in_flight_limit_reached():
+    async def scenario():
+        application = SimpleNamespace(
+            update_queue=asyncio.Queue(),
+            update_processor=KeyedUpdateProcessor(max_running=2, max_pending=512),
+            bot=None,
+        )
+        release = asyncio.Event()
+        tasks: set = set()
+        fetcher = asyncio.create_task(_fetch_updates(application, release, tasks))
+        server = WebhookServer(application, "/telegram", "secret", max_queue=8)
+        client = TestClient(TestServer(server.build_app()))
+        await client.start_server()
+        try:
+            statuses = []
+            for update_id in range(1, 301):
+                resp = await client.post(
+                    "/telegram",
+                    json={"update_id": update_id, "message": {
+                        "message_id": update_id, "date": 0,
+                        "chat": {"id": update_id, "type": "private"},
+                        "from": {"id": update_id, "is_bot": False, "first_name": "U"},
+                        "text": "hi",
+                    }},
+                    headers={SECRET_HEADER: "secret"},
+                )
+                statuses.append(resp.status)
+                await asyncio.sleep(0)
+
+            assert application.update_queue.qsize() == 0
+            assert statuses.count(200) == 8
+            assert statuses[8:] == [503] * 292
+            assert application.update_processor.in_flight == 8
+            assert len(tasks) == 8
+
+            release.set()
+            while tasks:
+                await asyncio.sleep(0.01)
+            assert application.update_processor.in_flight == 0
+            assert server.backlog() == 0
+        finally:
+            fetcher.cancel()
+            await client.close()
+
+    asyncio.run(scenario())
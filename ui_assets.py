@@ -0,0 +1,188 @@
+"""Статичні елементи інтерфейсу: довідники НПУ, клавіатури та тексти.
+
+Усе будується один раз при імпорті й далі лише віддається обробникам.
+Об'єкти telegram (InlineKeyboardMarkup тощо) після створення незмінні, а
+довідники обгорнуті в MappingProxyType/tuple, тож їх безпечно ділити між
+усіма апдейтами.
+"""
+
+from types import MappingProxyType
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup
+
+# Підрозділи НПУ (UKRAINE GTA) з описами
+_NPU_DEPARTMENTS = {
+    # 1. НАВС / ХНУВС
+    "navs": {
+        "title": "Національна академія внутрішніх справ (НАВС / ХНУВС)",
+        "tag": "[ХНУВС]",
+        "location": "перебуває при ГУНП м. Харкова",
+        "eligibility": "вступ до НПУ — автоматичне зарахування",
+        "desc": "Провідний навчальний заклад МВС для підготовки, перепідготовки та підвищення кваліфікації працівників поліції; наукові дослідження, міжнародна співпраця.",
+    },
+    # 2. КОРД
+    "kord": {
+        "title": "Корпус Оперативно-Раптових Дій (КОРД)",
+        "tag": "[КОРД]",
+        "location": "перебуває в УНПУ м. Дніпра",
+        "eligibility": "з 4-го порядкового звання",
+        "desc": "Елітний спецпідрозділ: штурмові/антитерористичні операції, звільнення заручників, нейтралізація озброєних злочинців, взаємодія з іншими підрозділами.",
+    },
+    # 3. ДПП
+    "dpp": {
+        "title": "Департамент Патрульної Поліції (ДПП)",
+        "tag": "[ДПП]",
+        "location": "перебуває в УНПУ м. Харкова",
+        "eligibility": "з 3-го порядкового звання",
+        "desc": "Патрулювання, реагування на виклики, профілактика правопорушень, ПДР, оформлення адмінправопорушень, перша допомога при ДТП.",
+    },
+    # 4. ГСУ
+    "gsu": {
+        "title": "Головне Слідче Управління (ГСУ)",
+        "tag": "[ГСУ]",
+        "location": "перебуває в ГУНПУ м. Києва",
+        "eligibility": "офіцерський склад, спец. у кримінальному процесі",
+        "desc": "Досудове розслідування особливо тяжких злочинів, координація регіональних слідчих, взаємодія з прокуратурою та спецслужбами.",
+    },
+    # 5. ДВБ
+    "dvb": {
+        "title": "Департамент Внутрішньої Безпеки (ДВБ)",
+        "tag": "[ДВБ]",
+        "location": "перебуває в ГУНПУ м. Києва",
+        "eligibility": "відбір у спеціалізований підрозділ",
+        "desc": "Протидія корупції та злочинам у поліції, службові розслідування, оперативні заходи, взаємодія з антикорупційними органами.",
+    },
+    # 6. НЦУП
+    "ncup": {
+        "title": "Національний Центр Управління Поліцією (НЦУП)",
+        "tag": "[НЦУП]",
+        "location": "перебуває в ГУНПУ м. Києва",
+        "eligibility": "центральний оперативно-аналітичний підрозділ",
+        "desc": "Координація підрозділів у реальному часі, диспетчеризація 102, аналітика, підтримка інформаційних систем і кібербезпека.",
+    },
+}
+
+# Список звань НПУ для UKRAINE GTA (по порядку)
+NPU_RANKS = (
+    "Рядовий",
+    "Капрал",
+    "Сержант",
+    "Старший сержант",
+    "Молодший лейтенант",
+    "Лейтенант",
+    "Старший лейтенант",
+    "Капітан",
+    "Майор",
+    "Підполковник",
+    "Полковник",
+    "Генерал",
+)
+
+NPU_DEPARTMENTS = MappingProxyType({code: MappingProxyType(meta) for code, meta in _NPU_DEPARTMENTS.items()})
+
+# Пошук підрозділу за назвою без урахування регістру (заява на неактив)
+DEPARTMENT_TITLE_BY_LOWER = MappingProxyType({meta["title"].lower(): meta["title"] for meta in NPU_DEPARTMENTS.values()})
+
+
+def _department_keyboard(prefix: str) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(
+        [[InlineKeyboardButton(meta["title"], callback_data=f"{prefix}{code}")] for code, meta in NPU_DEPARTMENTS.items()]
+    )
+
+
+def _rank_keyboard(prefix: str) -> InlineKeyboardMarkup:
+    buttons = [InlineKeyboardButton(rank, callback_data=f"{prefix}{idx}") for idx, rank in enumerate(NPU_RANKS)]
+    return InlineKeyboardMarkup([buttons[i:i + 2] for i in range(0, len(buttons), 2)])
+
+
+# Вибір підрозділу / звання: анкета доступу (npu_, rank_) і рефіл профілю (refill_npu_, refill_rank_)
+DEPARTMENT_KEYBOARDS = MappingProxyType({prefix: _department_keyboard(prefix) for prefix in ("npu_", "refill_npu_")})
+RANK_KEYBOARDS = MappingProxyType({prefix: _rank_keyboard(prefix) for prefix in ("rank_", "refill_rank_")})
+
+# Вибір відділу в заяві на неактив (кнопки під полем вводу)
+DEPARTMENT_REPLY_KEYBOARD = ReplyKeyboardMarkup(
+    [[meta["title"]] for meta in NPU_DEPARTMENTS.values()],
+    one_time_keyboard=True,
+    resize_keyboard=True,
+)
+
+_RANK_STEP = {
+    "apply": "📝 Крок 3: Оберіть ваше звання",
+    "refill": "🔸 Крок 3 з 4: Оберіть ваше звання",
+}
+
+# Картка обраного підрозділу з підказкою наступного кроку: DEPARTMENT_CARDS[variant][code]
+DEPARTMENT_CARDS = MappingProxyType({
+    variant: MappingProxyType({
+        code: (
+            f"✅ Обрано підрозділ: <b>{meta['title']}</b> {meta['tag']}\n"
+            f"Місце: {meta['location']}\n"
+            f"Допуск: {meta['eligibility']}\n\n"
+            f"{meta['desc']}\n\n"
+            f"{step}"
+        )
+        for code, meta in NPU_DEPARTMENTS.items()
+    })
+    for variant, step in _RANK_STEP.items()
+})
+
+REQUEST_ACCESS_KEYBOARD = InlineKeyboardMarkup(
+    [[InlineKeyboardButton("📝 Подати заявку на доступ", callback_data="request_access")]]
+)
+
+# Меню під полем вводу
+USER_MENU_KEYBOARD = ReplyKeyboardMarkup([["📝 Заява на неактив"]], resize_keyboard=True)
+USER_MENU_KEYBOARD_ADMIN = ReplyKeyboardMarkup([["📝 Заява на неактив"], ["🛡️ Адмін-команди"]], resize_keyboard=True)
+ADMIN_MENU_KEYBOARD = ReplyKeyboardMarkup([
+    ["📝 Оформити догану", "/admin_help"],
+    ["🔙 Звичайні команди"],
+], resize_keyboard=True)
+
+# Довідка: /admin_help, /help (звичайна і з адмінськими командами)
+ADMIN_HELP_TEXT = (
+    "🛡️ <b>Адмін-довідка</b>\n\n"
+    "<b>Адмінські команди</b>:\n"
+    "• /admin — коротка статистика заяв\n"
+    "• /dogana — оформлення догани (5 кроків, збереження у БД)\n"
+    "• /user &lt;id|@username&gt; — показати профіль користувача\n"
+    "• /find &lt;текст&gt; — пошук профілів; з повідомлення додаються кнопки дій (kick/догана)\n"
+    "• /broadcast_fill — розсилка інструкції щодо заповнення профілю\n"
+    "• /logs [на_сторінці] [action=...] [actor_id=...] [actor=@...] [from=YYYY-MM-DD] [to=YYYY-MM-DD] — журнал дій з фільтрами, посторінково\n"
+    "• /export_csv &lt;table&gt; [days=N] [gzip] — експорт таблиці у CSV (profiles, action_logs, warnings, ... ), gzip — стиснути\n"
+    "• /log_stats [days=7] — сводка (дії за типами, антиспам підсумки)\n"
+    "• /rollups_check [rebuild] — звірити зведення /log_stats з журналами (і перерахувати)\n\n"
+    "<b>Модерація неактиву</b>: у приват приходять картки з кнопками; після рішення — публікація у темі з атрибуцією.\n"
+)
+
+_HELP_COMMON = (
+    "ℹ️ <b>Довідка</b>\n\n"
+    "<b>Основні команди</b>:\n"
+    "• /start — запустити бота та показати меню\n"
+    "• /help — ця довідка\n"
+    "• /me — показати ваш збережений профіль\n"
+    "• /neaktyv — подати <i>заяву на неактив</i> (також є кнопка в меню)\n"
+    "• /refill — <i>тимчасово</i>: перезаповнити ваш профіль для оновлень БД\n\n"
+    "<b>Заява на доступ у групу</b>:\n"
+    "1) Натисніть /start і дотримуйтесь інструкцій\n"
+    "2) Введіть <i>ім'я та прізвище українською</i> (повністю)\n"
+    "3) Оберіть <i>управління НПУ</i> і <i>своє звання</i> зі списку\n"
+    "4) Надішліть <i>2 посилання</i> на скріншоти (посвідчення і трудову книжку) з imgbb/imgur/postimg\n\n"
+    "<blockquote>Порада: надсилайте <b>прямі URL</b> зображень, кожне з нового рядка.</blockquote>\n\n"
+)
+_HELP_ADMIN_COMMANDS = (
+    "<b>Адмінські команди</b>:\n"
+    "• /admin — коротка статистика заяв\n"
+    "• /dogana — оформлення догани\n"
+    "• /user &lt;id|@username&gt; — показати профіль користувача\n"
+    "• /find &lt;текст&gt; — пошук профілів (username/ім'я TG/ім'я у грі)\n"
+    "• /broadcast_fill — надіслати інструкцію для заповнення профілів\n\n"
+)
+_HELP_MODERATION = (
+    "<b>Модерація заяв на неактив</b> (адміни):\n"
+    "• У приват повідомлення приходить карточка з кнопками <b>Одобрити/Відхилити</b>\n"
+    "• Після кліку бот попросить <i>ім'я та прізвище модератора</i> для підпису\n"
+    "• Результат публікується у групі з атрибуцією <i>Перевіряючий</i>\n\n"
+    "<b>Формат імені</b>: лише українські літери, повне ім'я та прізвище.\n"
+)
+HELP_TEXT = _HELP_COMMON + _HELP_MODERATION
+HELP_TEXT_ADMIN = _HELP_COMMON + _HELP_ADMIN_COMMANDS + _HELP_MODERATION
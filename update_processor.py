@@ -0,0 +1,132 @@
+"""Паралельна обробка апдейтів зі збереженням порядку для кожного користувача.
+
+Апдейти різних користувачів обробляються одночасно (не більше max_running),
+а апдейти одного користувача (або чату, якщо користувача немає) — строго по
+черзі, в порядку надходження. Так ConversationHandler-и (догана, неактив,
+рефіл, анкета) бачать кроки діалогу в правильному порядку, а адмін, що чекає
+на create_invite_link чи get_chat_member, не гальмує решту.
+
+Підключення: Application.builder().concurrent_updates(KeyedUpdateProcessor(...)).
+"""
+
+import asyncio
+import time
+from collections import deque
+from typing import Any, Awaitable, Hashable, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+
+class _KeySlot:
+    __slots__ = ("lock", "queued")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.queued = 0
+
+
+class KeyedUpdateProcessor(BaseUpdateProcessor):
+    """max_running — скільки апдейтів виконується одночасно;
+    max_pending — скільки апдейтів узагалі може бути в роботі разом з тими,
+    що чекають своєї черги у свого користувача (семафор BaseUpdateProcessor).
+
+    in_flight — усі апдейти, які Application уже забрав з update_queue і ще не
+    обробив, включно з тими, що чекають на семафор: при конкурентній обробці
+    PTB одразу створює задачу на кожен апдейт, тож update_queue майже завжди
+    порожня і саме за цим лічильником треба рахувати навантаження.
+    """
+
+    def __init__(self, max_running: int = 16, max_pending: int = 512):
+        super().__init__(max(int(max_running), int(max_pending)))
+        self.max_running = max(1, int(max_running))
+        self._running = asyncio.BoundedSemaphore(self.max_running)
+        self._slots: dict[Hashable, _KeySlot] = {}
+        self._active = 0
+        self._pending = 0
+        self.in_flight = 0
+        # Метрики
+        self.processed = 0
+        self.max_key_depth = 0
+        self._waits: deque[float] = deque(maxlen=1000)
+
+    @staticmethod
+    def update_key(update: object) -> Optional[Hashable]:
+        if not isinstance(update, Update):
+            return None
+        if update.effective_user is not None:
+            return ("user", update.effective_user.id)
+        if update.effective_chat is not None:
+            return ("chat", update.effective_chat.id)
+        return None
+
+    async def process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        # Рахуємо ще до семафора базового класу: задачі, що на ньому чекають,
+        # теж займають пам'ять і мають стримувати прийом нових апдейтів
+        self.in_flight += 1
+        try:
+            await super().process_update(update, coroutine)
+        finally:
+            self.in_flight -= 1
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        self._pending += 1
+        try:
+            await self._process(update, coroutine)
+        finally:
+            self._pending -= 1
+
+    async def _process(self, update: object, coroutine: Awaitable[Any]):
+        started = time.monotonic()
+        key = self.update_key(update)
+        if key is None:
+            async with self._running:
+                self._waits.append(time.monotonic() - started)
+                await self._run(coroutine)
+            return
+
+        slot = self._slots.get(key)
+        if slot is None:
+            slot = self._slots[key] = _KeySlot()
+        slot.queued += 1
+        self.max_key_depth = max(self.max_key_depth, slot.queued)
+        try:
+            # Спершу черга користувача, потім загальний ліміт: апдейти, що чекають
+            # на попередній апдейт того ж користувача, не займають робочих місць
+            async with slot.lock:
+                async with self._running:
+                    self._waits.append(time.monotonic() - started)
+                    await self._run(coroutine)
+        finally:
+            slot.queued -= 1
+            if slot.queued == 0 and self._slots.get(key) is slot:
+                del self._slots[key]
+
+    async def _run(self, coroutine: Awaitable[Any]):
+        self._active += 1
+        try:
+            await coroutine
+        finally:
+            self._active -= 1
+            self.processed += 1
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def stats(self) -> dict[str, Any]:
+        depths = [slot.queued for slot in self._slots.values()]
+        waits = sorted(self._waits)
+        return {
+            "running": self._active,
+            "max_running": self.max_running,
+            "in_flight": self.in_flight,
+            "keys": len(depths),
+            "queued": self._pending - self._active,
+            "deepest_key": max(depths, default=0),
+            "max_key_depth": self.max_key_depth,
+            "processed": self.processed,
+            "p95_wait": waits[min(len(waits) - 1, int(len(waits) * 0.95))] if waits else 0.0,
+        }
@@ -0,0 +1,79 @@
+"""Перевірка і нормалізація введених користувачем імен, звань і дат.
+
+Усі шаблони компілюються один раз під час імпорту. Звання на початку рядка
+шукаються одним регулярним виразом-альтернацією, у якій довші звання стоять
+першими: так «Старший лейтенант Іван Петренко» завжди дає найдовший збіг, а
+рядок без звання відкидається за один прохід замість перебору всіх NPU_RANKS.
+
+    python validation.py  — мікробенчмарк вартості одного виклику
+"""
+
+import re
+from typing import NamedTuple, Optional
+
+from ui_assets import NPU_RANKS
+
+# Ім'я та прізвище для анкети: щонайменше два слова по 2+ українські літери
+UKRAINIAN_NAME_RE = re.compile(r"\s*[А-ЯІЇЄа-яіїє'\-]{2,}(?:\s+[А-ЯІЇЄа-яіїє'\-]{2,})+\s*")
+# Допустимі символи імені в догані (крапка — для ініціалів)
+NAME_CHARS_RE = re.compile(r"[А-ЯІЇЄа-яіїє'\-\s\.]+")
+# Рівно ім'я та прізвище з великої літери (неактив, підтвердження модератором)
+FULL_NAME_RE = re.compile(r"[А-ЯҐІЇЄЁ][а-яґіїєё']*\s+[А-ЯҐІЇЄЁ][а-яґіїєё']*")
+# Дата порушення: ДД.ММ або ДД.ММ.РРРР
+DATE_RE = re.compile(r"\d{1,2}\.\d{1,2}(?:\.\d{4})?")
+URL_PREFIX_RE = re.compile(r"https?://")
+
+
+class RankedName(NamedTuple):
+    rank: Optional[str]
+    name: str
+    is_valid: bool
+
+
+class RankMatcher:
+    """Звання на початку рядка (без урахування регістру), найдовший збіг."""
+
+    def __init__(self, ranks):
+        self._by_lower = {rank.lower(): rank for rank in ranks}
+        alternation = "|".join(re.escape(rank) for rank in sorted(self._by_lower, key=len, reverse=True))
+        self._pattern = re.compile(rf"({alternation})\s+", re.IGNORECASE)
+
+    def split(self, text: str) -> tuple[Optional[str], str]:
+        """(звання у канонічному написанні, решта рядка) або (None, text)."""
+        m = self._pattern.match(text)
+        if m is None:
+            return None, text
+        return self._by_lower[m.group(1).lower()], text[m.end():]
+
+
+RANKS = RankMatcher(NPU_RANKS)
+
+
+def normalize_ranked_name(text: str, pattern: re.Pattern = FULL_NAME_RE) -> RankedName:
+    """Виділяє звання, стискає пробіли в імені і перевіряє його шаблоном pattern."""
+    rank, name = RANKS.split(text.strip())
+    name = " ".join(name.split())
+    return RankedName(rank, name, pattern.fullmatch(name) is not None)
+
+
+def is_ukrainian_name(text: str) -> bool:
+    """Перевіряє, чи містить текст українські ім'я та прізвище"""
+    return UKRAINIAN_NAME_RE.fullmatch(text) is not None
+
+
+def is_valid_date(text: str) -> bool:
+    return DATE_RE.fullmatch(text) is not None
+
+
+if __name__ == "__main__":
+    import timeit
+
+    samples = ("Старший лейтенант Іван Петренко", "Генерал Іван Петренко", "Іван Петренко", "Іван")
+    for sample in samples:
+        number = 100000
+        cost = min(timeit.repeat(lambda: normalize_ranked_name(sample), number=number, repeat=5)) / number
+        print(f"normalize_ranked_name({sample!r}): {cost * 1e6:.2f} мкс")
+    for sample in ("Олександр Іваненко", "Іван"):
+        number = 100000
+        cost = min(timeit.repeat(lambda: is_ukrainian_name(sample), number=number, repeat=5)) / number
+        print(f"is_ukrainian_name({sample!r}): {cost * 1e6:.2f} мкс")
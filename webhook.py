@@ -0,0 +1,159 @@
+"""Режим webhook: вбудований aiohttp-сервер замість run_polling.
+
+Telegram сам надсилає апдейти POST-запитом на WEBHOOK_URL + path, тож немає
+затримки long-polling, а апдейти, що надійшли під час перезапуску, Telegram
+доставить повторно (drop_pending_updates=False).
+
+* заголовок X-Telegram-Bot-Api-Secret-Token перевіряється на кожному запиті;
+* якщо в роботі вже max_queue апдейтів (у update_queue плюс ті, що обробник
+  апдейтів уже забрав, — KeyedUpdateProcessor.in_flight), сервер відповідає
+  503 — Telegram повторить доставку пізніше, а пам'ять бота не росте;
+* без url set_webhook не викликається: так сервер можна навантажити локально,
+  надсилаючи записані JSON апдейтів, наприклад
+  curl -H 'X-Telegram-Bot-Api-Secret-Token: ...' -d @update.json http://127.0.0.1:8080/telegram
+
+aiohttp імпортується лише в цьому режимі.
+"""
+
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import signal
+from typing import Optional
+
+from telegram import Update
+from telegram.ext import Application
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def default_secret(bot_token: str) -> str:
+    """Стабільний секрет з токена бота (Telegram дозволяє лише A-Z, a-z, 0-9, _ і -)."""
+    return hashlib.sha256(f"webhook:{bot_token}".encode()).hexdigest()
+
+
+class WebhookServer:
+    def __init__(self, application: Application, path: str, secret_token: str, max_queue: int):
+        self.application = application
+        self.path = path
+        self.secret_token = secret_token
+        self.max_queue = max(1, int(max_queue))
+        self.accepted = 0
+        self.rejected_auth = 0
+        self.rejected_busy = 0
+        self.rejected_bad = 0
+
+    def build_app(self):
+        from aiohttp import web
+
+        app = web.Application(client_max_size=4 * 1024 * 1024)
+        app.router.add_post(self.path, self.handle_update)
+        app.router.add_get("/healthz", self.handle_health)
+        return app
+
+    async def handle_update(self, request):
+        from aiohttp import web
+
+        token = request.headers.get(SECRET_HEADER, "")
+        if not hmac.compare_digest(token, self.secret_token):
+            self.rejected_auth += 1
+            return web.Response(status=403)
+
+        queue = self.application.update_queue
+        if self.backlog() >= self.max_queue:
+            # Telegram повторить доставку; краще так, ніж необмежено накопичувати апдейти в пам'яті
+            self.rejected_busy += 1
+            return web.Response(status=503, headers={"Retry-After": "1"})
+
+        try:
+            data = await request.json(loads=json.loads)
+            update = Update.de_json(data, self.application.bot)
+        except Exception as e:
+            self.rejected_bad += 1
+            logger.warning(f"Webhook: некоректний апдейт: {e}")
+            return web.Response(status=400)
+
+        await queue.put(update)
+        self.accepted += 1
+        return web.Response(status=200)
+
+    def backlog(self) -> int:
+        """Апдейти, прийняті й ще не оброблені: у черзі та вже в задачах обробника."""
+        in_flight = getattr(self.application.update_processor, "in_flight", 0)
+        return self.application.update_queue.qsize() + in_flight
+
+    async def handle_health(self, request):
+        from aiohttp import web
+
+        return web.json_response({"queue": self.application.update_queue.qsize(), "backlog": self.backlog(), **self.stats()})
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "accepted": self.accepted,
+            "rejected_auth": self.rejected_auth,
+            "rejected_busy": self.rejected_busy,
+            "rejected_bad": self.rejected_bad,
+        }
+
+
+async def serve(
+    application: Application,
+    *,
+    listen: str,
+    port: int,
+    path: str,
+    secret_token: str,
+    url: Optional[str] = None,
+    max_queue: int = 1000,
+    allowed_updates: Optional[list[str]] = None,
+    stop_event: Optional[asyncio.Event] = None,
+):
+    """Запускає Application у режимі webhook до SIGINT/SIGTERM (або stop_event)."""
+    from aiohttp import web
+
+    server = WebhookServer(application, path, secret_token, max_queue)
+    runner = web.AppRunner(server.build_app(), access_log=None)
+    stop_event = stop_event or asyncio.Event()
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+
+    await application.initialize()
+    try:
+        if application.post_init:
+            await application.post_init(application)
+        await application.start()
+        await runner.setup()
+        await web.TCPSite(runner, listen, port).start()
+        if url:
+            await application.bot.set_webhook(
+                url=url.rstrip("/") + path,
+                secret_token=secret_token,
+                allowed_updates=allowed_updates,
+                drop_pending_updates=False,
+                max_connections=40,
+            )
+            logger.info(f"Webhook встановлено: {url.rstrip('/')}{path}")
+        else:
+            logger.warning("WEBHOOK_URL не задано — set_webhook пропущено (локальний режим)")
+        logger.info(f"Webhook-сервер слухає {listen}:{port}{path}")
+
+        await stop_event.wait()
+    finally:
+        await runner.cleanup()
+        if application.running:
+            await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+        logger.info(f"Webhook-сервер зупинено: {server.stats()}")